@@ -2,14 +2,44 @@
 # Fetches metrics relevant to idle detection (CPU, memory, disk I/O).
 # API: VMware Aria Operations 8.x REST API.
 import os
-from typing import Any, List, Optional
-
-import requests
+import threading
+import time
+from typing import Any, Iterator, List, Optional
 
+from . import instrumentation
 from .base import BaseClient, VMInfo, VMMetrics
+from .http import get_session
 
 # Default timeout for API calls
 REQUEST_TIMEOUT = 30
+# Resources per /api/resources page (override with config["page_size"])
+PAGE_SIZE = 1000
+# Resource ids per bulk latest-stats request (override with config["stats_chunk_size"])
+STATS_CHUNK_SIZE = 200
+# Aria stat key -> (VMInfo field, scale factor)
+STAT_FIELDS = {
+    "cpu|usage_average": ("cpu_usage_percent", 1.0),
+    "cpu|usagemhz_average": ("cpu_usage_mhz", 1.0),
+    "mem|consumed_average": ("memory_usage_mb", 1.0 / 1024.0),  # KB
+    "net|usage_average": ("network_usage_kbps", 1.0),           # KBps
+    "disk|commandsAveraged_average": ("disk_usage_iops", 1.0),
+    "sys|osUptime_latest": ("uptime_days", 1.0 / 86400.0),      # seconds
+    "config|hardware|num_Cpu": ("num_cpu", 1.0),
+    "mem|guest_provisioned": ("memory_size_mb", 1.0 / 1024.0),  # KB
+    "config|hardware|disk_Space": ("provisioned_disk_gb", 1.0),  # GB
+}
+# Sizing fields are whole numbers on VMInfo
+INT_FIELDS = frozenset({"num_cpu", "memory_size_mb"})
+# Used for disk_usage_iops when commandsAveraged is not collected
+DISK_IOPS_FALLBACK_KEYS = ("disk|numberReadAveraged_average", "disk|numberWriteAveraged_average")
+# Acquired tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+# Aria's default token lifetime, used when the acquire response has no validity
+DEFAULT_TOKEN_LIFETIME = 6 * 3600
+
+# (base_url, user) -> (token, expires_at epoch seconds); shared by all clients in the process
+_tokens: dict = {}
+_tokens_lock = threading.Lock()
 
 
 def _get_aria_config(config: dict) -> dict:
@@ -22,7 +52,90 @@ def _get_aria_config(config: dict) -> dict:
     token = config.get("token") or os.environ.get("ARIA_TOKEN", "")
     user = config.get("user") or os.environ.get("ARIA_USER", "")
     password = config.get("password") or os.environ.get("ARIA_PASSWORD", "")
-    return {"base_url": base_url, "token": token, "user": user, "password": password}
+    auth_source = config.get("auth_source") or os.environ.get("ARIA_AUTH_SOURCE", "")
+    return {
+        "base_url": base_url,
+        "token": token,
+        "user": user,
+        "password": password,
+        "auth_source": auth_source,
+    }
+
+
+def _acquired_token(cfg: dict) -> str | None:
+    """Token from /api/auth/token/acquire, cached until shortly before it expires."""
+    key = (cfg["base_url"], cfg["user"])
+    with _tokens_lock:
+        cached = _tokens.get(key)
+        if cached and cached[1] - TOKEN_REFRESH_MARGIN > time.time():
+            return cached[0]
+        body = {"username": cfg["user"], "password": cfg["password"]}
+        if cfg.get("auth_source"):
+            body["authSource"] = cfg["auth_source"]
+        try:
+            with instrumentation.phase("connect"):
+                r = get_session().post(
+                    f"{cfg['base_url']}/api/auth/token/acquire",
+                    json=body,
+                    headers={"Content-Type": "application/json", "Accept": "application/json"},
+                    timeout=REQUEST_TIMEOUT,
+                )
+            if r.status_code != 200:
+                return None
+            data = r.json()
+        except Exception:
+            return None
+        token = data.get("token") if isinstance(data, dict) else None
+        if not token:
+            return None
+        validity = data.get("validity")  # epoch milliseconds
+        expires_at = validity / 1000.0 if validity else time.time() + DEFAULT_TOKEN_LIFETIME
+        _tokens[key] = (token, expires_at)
+        return token
+
+
+def _invalidate_token(cfg: dict) -> bool:
+    """Drop a cached token (e.g. after 401); True if there was one."""
+    with _tokens_lock:
+        return _tokens.pop((cfg["base_url"], cfg["user"]), None) is not None
+
+
+def _resource_id(res: dict) -> str:
+    """Aria resource id: "identifier" is the resource UUID (a string in Aria 8.x)."""
+    identifier = res.get("identifier")
+    if isinstance(identifier, dict):
+        identifier = identifier.get("uuid")
+    return identifier or res.get("resourceId", "") or ""
+
+
+def _vm_info_from_resource(res: dict) -> VMInfo:
+    """One /api/resources entry -> VMInfo (raw resource kept as metadata)."""
+    resource_key = res.get("resourceKey") or {}
+    states = res.get("resourceStatusStates")
+    return VMInfo(
+        name=res.get("name", resource_key.get("name", "")),
+        uuid=_resource_id(res),
+        power_state=states.get("powerState") if isinstance(states, dict) else None,
+        metadata=res,
+    )
+
+
+def _apply_latest_stats(vm: VMInfo, entry: dict) -> None:
+    """Map one resource's stat-list (latest values) onto VMInfo fields."""
+    latest = {}
+    for stat in (entry.get("stat-list") or {}).get("stat", []):
+        key = (stat.get("statKey") or {}).get("key")
+        values = stat.get("data") or []
+        if key and values and values[-1] is not None:
+            latest[key] = float(values[-1])
+    for key, (field, scale) in STAT_FIELDS.items():
+        if key in latest:
+            value = latest[key] * scale
+            setattr(vm, field, round(value) if field in INT_FIELDS else value)
+    if vm.disk_usage_iops is None:
+        present = [latest[k] for k in DISK_IOPS_FALLBACK_KEYS if k in latest]
+        if present:
+            vm.disk_usage_iops = sum(present)
 
 
 class AriaClient(BaseClient):
@@ -33,53 +146,100 @@ class AriaClient(BaseClient):
     """
 
     def get_vms(self, config: dict) -> List[VMInfo]:
-        """List VM-like resources from Aria. Returns minimal VMInfo list."""
+        """List VM-like resources from Aria (all pages). Returns minimal VMInfo list."""
+        try:
+            return [vm for batch in self.iter_vm_batches(config) for vm in batch]
+        except Exception:
+            return []
+
+    def iter_vm_batches(self, config: dict) -> Iterator[List[VMInfo]]:
+        """
+        Yield one VMInfo batch per /api/resources page until every page is read (pageInfo.totalCount;
+        a short page when it is absent), so only one page of decoded JSON is held at a time. A failing first page yields nothing; a failure
+        after that raises, so a partial listing is never mistaken for the full inventory.
+        """
         cfg = _get_aria_config(config)
         if not cfg["base_url"]:
-            return []
-        headers = self._auth_headers(cfg)
+            return
+        page_size = int(config.get("page_size") or PAGE_SIZE)
         # Aria API: adapter kind for vCenter; fetch resources of type VirtualMachine
-        # Endpoint varies by Aria version; placeholder for /api/resources or similar
         url = f"{cfg['base_url']}/api/resources"
-        try:
-            r = requests.get(
-                url,
-                headers=headers,
-                timeout=REQUEST_TIMEOUT,
-                params={"resourceKind": "VirtualMachine", "pageSize": 1000},
-            )
-            if r.status_code != 200:
-                return []
+        page = 0
+        fetched = 0
+        while True:
             try:
+                r = self._request(
+                    "GET",
+                    cfg,
+                    url,
+                    params={"resourceKind": "VirtualMachine", "page": page, "pageSize": page_size},
+                )
+                r.raise_for_status()
                 data = r.json()
             except Exception:
-                return []
-            vms = []
+                if page == 0:
+                    return
+                raise
             resource_list = data.get("resourceList", []) if isinstance(data, dict) else []
             if not resource_list and isinstance(data, list):
                 resource_list = data
-            for res in resource_list:
-                if isinstance(res, dict):
-                    vms.append(VMInfo(
-                        name=res.get("name", res.get("resourceKey", {}).get("name", "")),
-                        uuid=res.get("identifier", {}).get("uuid", res.get("resourceId", "") or ""),
-                        power_state=res.get("resourceStatusStates", {}).get("powerState"),
-                        metadata=res,
-                    ))
-            return vms
-        except Exception:
-            return []
+            batch = [_vm_info_from_resource(res) for res in resource_list if isinstance(res, dict)]
+            if batch:
+                if config.get("collect_stats", True):
+                    self.enrich_with_latest_stats(config, batch)
+                yield batch
+            fetched += len(resource_list)
+            total = (data.get("pageInfo") or {}).get("totalCount") if isinstance(data, dict) else None
+            if not resource_list:
+                return
+            if total is not None:
+                # The server may cap pageSize below ours: trust totalCount over short pages
+                if fetched >= int(total):
+                    return
+            elif len(resource_list) < page_size:
+                return
+            page += 1
+
+    def enrich_with_latest_stats(self, config: dict, vms: List[VMInfo]) -> None:
+        """
+        Fill CPU, memory, network, disk, uptime and sizing on vms from the bulk latest-stats endpoint:
+        one POST per chunk of resource ids instead of one metrics call per VM.
+        """
+        cfg = _get_aria_config(config)
+        by_id = {vm.uuid: vm for vm in vms if vm.uuid}
+        if not cfg["base_url"] or not by_id:
+            return
+        chunk_size = int(config.get("stats_chunk_size") or STATS_CHUNK_SIZE)
+        url = f"{cfg['base_url']}/api/resources/stats/latest/query"
+        stat_keys = list(STAT_FIELDS) + list(DISK_IOPS_FALLBACK_KEYS)
+        ids = list(by_id)
+        for i in range(0, len(ids), chunk_size):
+            try:
+                r = self._request(
+                    "POST",
+                    cfg,
+                    url,
+                    json={"resourceId": ids[i:i + chunk_size], "statKey": stat_keys},
+                )
+                if r.status_code != 200:
+                    continue
+                data = r.json()
+            except Exception:
+                continue
+            for entry in data.get("values", []) if isinstance(data, dict) else []:
+                vm = by_id.get(entry.get("resourceId"))
+                if vm is not None:
+                    _apply_latest_stats(vm, entry)
 
     def get_vm_metrics(self, config: dict, vm_id: str) -> Optional[VMMetrics]:
         """Fetch current metrics for one VM (CPU, memory, disk I/O)."""
         cfg = _get_aria_config(config)
         if not cfg["base_url"] or not vm_id:
             return None
-        headers = self._auth_headers(cfg)
         # Placeholder: Aria metrics endpoint; adjust to actual API
         url = f"{cfg['base_url']}/api/resources/{vm_id}/metrics/latest"
         try:
-            r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            r = self._request("GET", cfg, url)
             if r.status_code != 200:
                 return None
             data = r.json()
@@ -99,15 +259,28 @@ class AriaClient(BaseClient):
         except Exception:
             return None
 
+    def _request(self, method: str, cfg: dict, url: str, **kwargs):
+        """Send through the shared pooled session; on 401 drop the cached token and retry once."""
+        session = get_session()
+        r = session.request(method, url, headers=self._auth_headers(cfg), timeout=REQUEST_TIMEOUT, **kwargs)
+        if r.status_code == 401 and cfg.get("user") and _invalidate_token(cfg):
+            r = session.request(method, url, headers=self._auth_headers(cfg), timeout=REQUEST_TIMEOUT, **kwargs)
+        return r
+
     def _auth_headers(self, cfg: dict) -> dict:
-        """Return headers with auth (token or basic)."""
+        """Return headers with auth (static token, acquired token, or basic)."""
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
         if cfg.get("token"):
-            return {"Authorization": f"Bearer {cfg['token']}", "Content-Type": "application/json"}
-        if cfg.get("user") and cfg.get("password"):
-            import base64
-            b64 = base64.b64encode(f"{cfg['user']}:{cfg['password']}".encode()).decode()
-            return {"Authorization": f"Basic {b64}", "Content-Type": "application/json"}
-        return {"Content-Type": "application/json"}
+            headers["Authorization"] = f"Bearer {cfg['token']}"
+        elif cfg.get("user") and cfg.get("password"):
+            token = _acquired_token(cfg)
+            if token:
+                headers["Authorization"] = f"vRealizeOpsToken {token}"
+            else:
+                import base64
+                b64 = base64.b64encode(f"{cfg['user']}:{cfg['password']}".encode()).decode()
+                headers["Authorization"] = f"Basic {b64}"
+        return headers
 
 
 def get_aria_vms(config: dict) -> List[VMInfo]:
@@ -1,7 +1,10 @@
 # Base interface for data source clients; VM and metric DTOs.
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional
+
+# VMs per batch from the default iter_vm_batches (clients with paged APIs stream their own pages)
+VM_BATCH_SIZE = 1000
 
 
 @dataclass
@@ -11,7 +14,7 @@ class VMInfo:
     uuid: str
     power_state: Optional[str] = None  # e.g. poweredOn, poweredOff
     metadata: Optional[dict] = None  # source-specific (cluster, cpu, memory, etc.)
-    # Resource metrics for idle scoring (use latest snapshot; 7-day avg would need history)
+    # Resource metrics for idle scoring (latest snapshot; scans also keep hourly history)
     cpu_usage_mhz: Optional[float] = None
     cpu_usage_percent: Optional[float] = None
     memory_usage_mb: Optional[float] = None
@@ -19,17 +22,23 @@ class VMInfo:
     disk_usage_iops: Optional[float] = None
     uptime_days: Optional[float] = None
     last_boot_time: Optional[datetime] = None  # when VM was last booted (runtime.bootTime)
+    # Configured size (what reclaiming the VM frees)
+    num_cpu: Optional[int] = None
+    memory_size_mb: Optional[int] = None
+    provisioned_disk_gb: Optional[float] = None  # committed + uncommitted storage
 
 
 @dataclass
 class VMMetrics:
-    """Metrics for idle scoring: CPU, memory, disk I/O (optional)."""
+    """Metrics for idle scoring: CPU, memory, disk I/O, network (optional)."""
     vm_id: str  # uuid or source id
     cpu_percent: Optional[float] = None
     memory_mb: Optional[float] = None
     memory_percent: Optional[float] = None
     disk_io_read_kbps: Optional[float] = None
     disk_io_write_kbps: Optional[float] = None
+    disk_iops: Optional[float] = None
+    network_kbps: Optional[float] = None
     sampled_at: Optional[str] = None  # ISO datetime
     metadata: Optional[dict] = None
 
@@ -41,6 +50,12 @@ class BaseClient:
         """List VMs from the source. config: host, user, password key, etc."""
         raise NotImplementedError
 
+    def iter_vm_batches(self, config: dict) -> Iterator[List[VMInfo]]:
+        """Yield the inventory in batches of VM_BATCH_SIZE; override to stream from the API."""
+        vms = self.get_vms(config)
+        for i in range(0, len(vms), VM_BATCH_SIZE):
+            yield vms[i:i + VM_BATCH_SIZE]
+
     def get_vm_metrics(self, config: dict, vm_id: str) -> Optional[VMMetrics]:
         """Fetch metrics for one VM (optional; Aria/Stor2RRD)."""
         return None
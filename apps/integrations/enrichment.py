@@ -0,0 +1,96 @@
+# Per-VM metric enrichment: call BaseClient.get_vm_metrics for many VMs concurrently
+# (bounded asyncio fan-out over the blocking clients) within a per-scan time budget.
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from .base import BaseClient, VMInfo, VMMetrics
+
+# In-flight get_vm_metrics calls per source (override with config["metrics_concurrency"])
+DEFAULT_CONCURRENCY = 16
+# Seconds one scan may spend on per-VM metrics (override with config["metrics_timeout_seconds"])
+DEFAULT_TIMEOUT_BUDGET = 600
+
+
+class MetricsBudget:
+    """Deadline shared by every enrichment batch of one scan."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+
+    @classmethod
+    def from_config(cls, config: dict) -> "MetricsBudget":
+        return cls(float(config.get("metrics_timeout_seconds") or DEFAULT_TIMEOUT_BUDGET))
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+def merge_metrics(vm: VMInfo, metrics: VMMetrics) -> None:
+    """Copy per-VM metrics onto VMInfo without overwriting values the listing already had."""
+    if vm.cpu_usage_percent is None and metrics.cpu_percent is not None:
+        vm.cpu_usage_percent = float(metrics.cpu_percent)
+    if vm.memory_usage_mb is None and metrics.memory_mb is not None:
+        vm.memory_usage_mb = float(metrics.memory_mb)
+    if vm.network_usage_kbps is None and metrics.network_kbps is not None:
+        vm.network_usage_kbps = float(metrics.network_kbps)
+    if vm.disk_usage_iops is None and metrics.disk_iops is not None:
+        vm.disk_usage_iops = float(metrics.disk_iops)
+    disk_kbps = {
+        "diskReadKbps": metrics.disk_io_read_kbps,
+        "diskWriteKbps": metrics.disk_io_write_kbps,
+    }
+    disk_kbps = {k: v for k, v in disk_kbps.items() if v is not None}
+    if disk_kbps:
+        vm.metadata = {**(vm.metadata or {}), **disk_kbps}
+
+
+async def _fetch_all(client: BaseClient, config: dict, vms: List[VMInfo], concurrency: int, timeout: float):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vm-metrics")
+
+    async def fetch(vm: VMInfo):
+        async with semaphore:
+            # Executor threads do not inherit contextvars: pass the scan instrumentation along
+            call = contextvars.copy_context().run
+            return vm, await loop.run_in_executor(executor, call, client.get_vm_metrics, config, vm.uuid)
+
+    tasks = [asyncio.ensure_future(fetch(vm)) for vm in vms]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return [t.result() for t in done if not t.cancelled() and t.exception() is None]
+    finally:
+        # Do not wait for calls still running past the budget; they end at REQUEST_TIMEOUT
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def enrich_with_vm_metrics(
+    client: BaseClient,
+    config: dict,
+    vms: List[VMInfo],
+    budget: MetricsBudget | None = None,
+) -> int:
+    """
+    Fetch get_vm_metrics for every VM in the batch in parallel and merge the results.
+    Stops at the budget deadline, keeping whatever finished. Returns number of VMs enriched.
+    """
+    budget = budget or MetricsBudget.from_config(config)
+    vms = [vm for vm in vms if vm.uuid]
+    timeout = budget.remaining()
+    if not vms or timeout <= 0:
+        return 0
+    concurrency = max(1, int(config.get("metrics_concurrency") or DEFAULT_CONCURRENCY))
+    results = asyncio.run(_fetch_all(client, config, vms, concurrency, timeout))
+    enriched = 0
+    for vm, metrics in results:
+        if metrics is not None:
+            merge_metrics(vm, metrics)
+            enriched += 1
+    return enriched
@@ -0,0 +1,66 @@
+# Shared HTTP layer for REST clients (Aria, Stor2RRD).
+# One requests.Session per process: keep-alive connection pools per host and
+# retry with exponential backoff on 429/5xx (honouring Retry-After).
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import instrumentation
+
+# Hosts with a kept connection pool, and connections kept per host
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "20"))
+# Retries on connection errors and RETRY_STATUSES; sleeps backoff * 2^n between attempts
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+def _record_response(response, *args, **kwargs):
+    # Scan instrumentation; no client streams responses, so reading content here costs nothing
+    instrumentation.count("api_calls")
+    instrumentation.count("bytes_received", len(response.content))
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        # POST is only used for read-only queries (stats, token acquire)
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_record_response)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Process-wide pooled session; created on first use."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _forget_after_fork() -> None:
+    # Pooled sockets must not be shared between a forked worker and its parent
+    global _session, _lock
+    _session = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
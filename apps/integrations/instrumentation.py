@@ -0,0 +1,105 @@
+# Scan instrumentation: phase timings and counters for the scan running in the current context.
+# scans.tasks opens a collector per ScanRun; clients report into it through module functions,
+# which are no-ops when no collector is active (management commands, shell, tests).
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Phases timed per scan (ScanRun.<phase>_seconds)
+PHASES = ("connect", "fetch", "enrich", "cache", "persist", "detect")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("scan_stats", default=None)
+
+
+class ScanStats:
+    """
+    Seconds per phase and named counters (api_calls, bytes_received, rows_*). Nested phases
+    are exclusive: time spent in an inner phase is not counted again in the outer one. The
+    phase stack is per thread, so enrichment workers timing phases concurrently do not nest
+    into each other or into the scan thread's open phase.
+    """
+
+    def __init__(self):
+        self.phases: dict = {}
+        self.counters: dict = {}
+        self.cache_hit: bool | None = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        # Enrichment threads count HTTP calls concurrently
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def phase(self, name: str):
+        stack = self._stack()
+        frame = [time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed - frame[1]
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+@contextmanager
+def collect_stats():
+    """Make a fresh ScanStats current for the block and yield it."""
+    stats = ScanStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def current_stats() -> ScanStats | None:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as phase name of the current scan (no-op without a collector)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    with stats.phase(name):
+        yield
+
+
+def count(name: str, n: int = 1) -> None:
+    stats = _current.get()
+    if stats is not None and n:
+        stats.count(name, n)
+
+
+def record_cache(hit: bool) -> None:
+    """A scan is a cache hit only if every page came from the cache."""
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_hit = hit if stats.cache_hit is None else stats.cache_hit and hit
+
+
+def timed(iterable, name: str):
+    """Yield from iterable, timing each step (the producer's work) as phase name."""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
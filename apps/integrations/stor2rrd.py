@@ -3,11 +3,16 @@
 import os
 from typing import Any, List, Optional
 
-import requests
-
 from .base import BaseClient, VMInfo, VMMetrics
+from .http import get_session
 
 REQUEST_TIMEOUT = 30
+# VMInfo sizing field -> /api/vms item keys that may carry it (first present wins)
+SIZING_KEYS = {
+    "num_cpu": ("num_cpu", "vcpu", "cpus"),
+    "memory_size_mb": ("memory_mb", "memory_size_mb", "mem_mb"),
+    "provisioned_disk_gb": ("provisioned_gb", "provisioned_disk_gb", "disk_gb"),
+}
 
 
 def _get_stor2rrd_config(config: dict) -> dict:
@@ -38,7 +43,7 @@ class Stor2RRDClient(BaseClient):
         # Stor2RRD may expose VM list via a specific endpoint; placeholder
         url = f"{cfg['base_url']}/api/vms"
         try:
-            r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            r = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
             if r.status_code != 200:
                 return []
             try:
@@ -53,6 +58,7 @@ class Stor2RRDClient(BaseClient):
                         name=item.get("name", ""),
                         uuid=item.get("uuid", item.get("id", "")),
                         metadata=item,
+                        **_sizing(item),
                     ))
             return vms
         except Exception:
@@ -68,22 +74,40 @@ class Stor2RRDClient(BaseClient):
             headers["X-API-Key"] = cfg["api_key"]
         url = f"{cfg['base_url']}/api/vms/{vm_id}/metrics"
         try:
-            r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            r = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
             if r.status_code != 200:
                 return None
             data = r.json()
             if not isinstance(data, dict):
                 return None
+            iops = data.get("iops")
+            if iops is None and (data.get("read_iops") is not None or data.get("write_iops") is not None):
+                iops = (data.get("read_iops") or 0) + (data.get("write_iops") or 0)
             return VMMetrics(
                 vm_id=vm_id,
                 disk_io_read_kbps=data.get("read_kbps"),
                 disk_io_write_kbps=data.get("write_kbps"),
+                disk_iops=iops,
                 metadata=data,
             )
         except Exception:
             return None
 
 
+def _sizing(item: dict) -> dict:
+    """Sizing fields present in a Stor2RRD VM item (non-numeric values are skipped)."""
+    out = {}
+    for field, keys in SIZING_KEYS.items():
+        for key in keys:
+            try:
+                value = float(item[key])
+            except (KeyError, TypeError, ValueError):
+                continue
+            out[field] = value if field == "provisioned_disk_gb" else round(value)
+            break
+    return out
+
+
 def get_stor2rrd_vms(config: dict) -> List[VMInfo]:
     """Convenience: list VMs/clients from Stor2RRD."""
     return Stor2RRDClient().get_vms(config)
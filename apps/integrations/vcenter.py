@@ -1,21 +1,78 @@
 # vCenter 8.x API client via pyvmomi
 # Lists VMs with name, uuid, power state, QuickStats (CPU, memory), boot time.
+# Properties are fetched with paged PropertyCollector calls and yielded one page at a time.
+# Large inventories can be split into shards (datacenter, cluster or folder), each collected
+# through its own ContainerView.
+import logging
 import os
 import ssl
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, List
+from typing import Any, Iterator, List
 
+from . import instrumentation
 from .base import BaseClient, VMInfo
 
 try:
-    from pyVim.connect import SmartConnect, Disconnect
-    from pyVmomi import vim
+    from pyVim.connect import SmartConnect
+    from pyVmomi import vim, vmodl
     PYVMOMI_AVAILABLE = True
 except ImportError:
     PYVMOMI_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
 # Default MHz per core to derive CPU % when not available (e.g. 2 GHz)
 DEFAULT_MHZ_PER_CORE = 2000.0
+# Objects per RetrievePropertiesEx page (override with config["property_page_size"])
+PROPERTY_PAGE_SIZE = 1000
+# Only these properties are fetched, in bulk, for every VM in the inventory
+VM_PROPERTIES = [
+    "name",
+    "config.uuid",
+    "summary.config.uuid",
+    "summary.config.numCpu",
+    "summary.config.memorySizeMB",
+    "summary.storage.committed",
+    "summary.storage.uncommitted",
+    "runtime.powerState",
+    "runtime.bootTime",
+    "summary.quickStats.overallCpuUsage",
+    "summary.quickStats.guestMemoryUsage",
+]
+# Properties that move on almost every poll (usage, thin-disk growth): left out of the
+# WaitForUpdatesEx filter so only config/runtime/name changes mark a VM changed, and read
+# with one paged call for the VMs an incremental sync returns
+VOLATILE_PROPERTIES = [p for p in VM_PROPERTIES if p.startswith(("summary.quickStats.", "summary.storage."))]
+SYNC_PROPERTIES = [p for p in VM_PROPERTIES if p not in VOLATILE_PROPERTIES]
+# Seconds between forced full snapshots of an incremental sync, so usage metrics of VMs
+# whose config did not change are still refreshed (override with config["full_sync_interval"])
+FULL_SYNC_INTERVAL = 3600
+# Realtime PerformanceManager counters (group.name.rollup) summed into VMInfo fields
+PERF_COUNTERS = {
+    "network_usage_kbps": ["net.usage.average"],  # KBps as reported by vCenter
+    "disk_usage_iops": ["disk.numberReadAveraged.average", "disk.numberWriteAveraged.average"],
+}
+# VMs per QueryPerf call (override with config["perf_batch_size"])
+PERF_BATCH_SIZE = 250
+# Realtime interval (20 s samples); 15 samples = last 5 minutes
+PERF_INTERVAL_ID = 20
+PERF_MAX_SAMPLE = 15
+
+# config["shard_by"] values -> inventory object types whose ContainerViews partition the VMs.
+# ComputeResource covers clusters and standalone hosts, so together the shards cover every VM.
+SHARD_TYPES = {
+    "datacenter": "Datacenter",
+    "cluster": "ComputeResource",
+    "folder": "Folder",
+}
+
+# vCenter instanceUuid -> {counter name: counter id}; resolved once per process
+_perf_counter_ids: dict = {}
+# sync_keys that had an incremental sync state in this process (to tell a first sync from a lost one)
+_synced_keys: set = set()
 
 
 def _get_password(config: dict) -> str:
@@ -37,102 +94,471 @@ def _pyvmomi_time_to_datetime(t) -> datetime | None:
         return None
 
 
+def _vm_uuid(moid: str, props: dict) -> str:
+    return props.get("summary.config.uuid") or props.get("config.uuid") or f"vm-{moid}"
+
+
+def _vm_info_from_props(moid: str, props: dict) -> VMInfo:
+    """Build VMInfo from one PropertyCollector result (property path -> value)."""
+    metadata = {"moid": moid}
+    uuid = _vm_uuid(moid, props)
+    num_cpu = props.get("summary.config.numCpu")
+    memory_size_mb = props.get("summary.config.memorySizeMB")
+    if num_cpu is not None or memory_size_mb is not None:
+        metadata["numCpu"] = num_cpu
+        metadata["memorySizeMB"] = memory_size_mb
+    committed = props.get("summary.storage.committed")
+    uncommitted = props.get("summary.storage.uncommitted")
+    provisioned_disk_gb = None
+    if committed is not None or uncommitted is not None:
+        provisioned_disk_gb = round(((committed or 0) + (uncommitted or 0)) / 2 ** 30, 2)
+
+    ps = props.get("runtime.powerState")
+    power = str(ps).replace("PowerState.", "").strip().lower() if ps is not None else ""
+    last_boot_time = None
+    boot_time = props.get("runtime.bootTime")
+    if boot_time is not None:
+        try:
+            last_boot_time = boot_time
+            if last_boot_time.tzinfo is None:
+                last_boot_time = last_boot_time.replace(tzinfo=timezone.utc)
+        except Exception:
+            last_boot_time = None
+
+    cpu_usage_mhz = props.get("summary.quickStats.overallCpuUsage")
+    memory_usage_mb = props.get("summary.quickStats.guestMemoryUsage")
+    cpu_usage_percent = None
+    uptime_days = None
+    if memory_usage_mb is not None and memory_size_mb and memory_size_mb > 0:
+        metadata["memoryUsagePercent"] = round(100.0 * memory_usage_mb / memory_size_mb, 2)
+    if cpu_usage_mhz is not None and num_cpu and num_cpu > 0:
+        mhz_per_core = DEFAULT_MHZ_PER_CORE
+        cpu_usage_percent = min(100.0, 100.0 * cpu_usage_mhz / (num_cpu * mhz_per_core))
+    if last_boot_time is not None:
+        delta = (datetime.now(timezone.utc) - last_boot_time).total_seconds()
+        uptime_days = delta / (24.0 * 3600.0)
+
+    return VMInfo(
+        name=props.get("name") or "",
+        uuid=uuid,
+        power_state=power or None,
+        metadata=metadata,
+        cpu_usage_mhz=cpu_usage_mhz,
+        cpu_usage_percent=cpu_usage_percent,
+        memory_usage_mb=float(memory_usage_mb) if memory_usage_mb is not None else None,
+        network_usage_kbps=None,  # filled by the PerformanceManager stage
+        disk_usage_iops=None,
+        uptime_days=uptime_days,
+        last_boot_time=last_boot_time,
+        num_cpu=num_cpu,
+        memory_size_mb=memory_size_mb,
+        provisioned_disk_gb=provisioned_disk_gb,
+    )
+
+
+def _resolve_perf_counter_ids(content) -> dict:
+    """Map PERF_COUNTERS names to this vCenter's counter ids (cached per vCenter instance)."""
+    key = content.about.instanceUuid
+    ids = _perf_counter_ids.get(key)
+    if ids is None:
+        wanted = {name for names in PERF_COUNTERS.values() for name in names}
+        ids = {}
+        for counter in content.perfManager.perfCounter:
+            name = f"{counter.groupInfo.key}.{counter.nameInfo.key}.{counter.rollupType}"
+            if name in wanted:
+                ids[name] = counter.key
+        _perf_counter_ids[key] = ids
+    return ids
+
+
+def _apply_perf_metrics(content, vms_by_moid: dict, config: dict) -> None:
+    """
+    Fill network_usage_kbps / disk_usage_iops from realtime stats.
+    vms_by_moid: moid -> (vm_ref, VMInfo). One QueryPerf call per batch of VMs.
+    """
+    counter_ids = _resolve_perf_counter_ids(content)
+    if not counter_ids:
+        return
+    names_by_id = {cid: name for name, cid in counter_ids.items()}
+    metric_ids = [vim.PerformanceManager.MetricId(counterId=cid, instance="") for cid in counter_ids.values()]
+    batch_size = int(config.get("perf_batch_size") or PERF_BATCH_SIZE)
+    refs = [ref for ref, _ in vms_by_moid.values()]
+    for i in range(0, len(refs), batch_size):
+        specs = [
+            vim.PerformanceManager.QuerySpec(
+                entity=ref,
+                metricId=metric_ids,
+                intervalId=PERF_INTERVAL_ID,
+                maxSample=PERF_MAX_SAMPLE,
+                format="normal",
+            )
+            for ref in refs[i:i + batch_size]
+        ]
+        try:
+            results = content.perfManager.QueryPerf(querySpec=specs) or []
+        except Exception as e:
+            # These VMs keep no network/disk data this scan (Rule B falls back to what it has)
+            logger.warning("QueryPerf failed for %d VMs on %s: %s", len(specs), content.about.instanceUuid, e)
+            instrumentation.count("perf_errors")
+            continue
+        for entity_metric in results:
+            entry = vms_by_moid.get(entity_metric.entity._moId)
+            if entry is None:
+                continue
+            averages = {}
+            for series in entity_metric.value or []:
+                samples = [v for v in (series.value or []) if v is not None and v >= 0]
+                name = names_by_id.get(series.id.counterId)
+                if samples and name:
+                    averages[name] = sum(samples) / len(samples)
+            info = entry[1]
+            for field, names in PERF_COUNTERS.items():
+                present = [averages[n] for n in names if n in averages]
+                if present:
+                    setattr(info, field, float(sum(present)))
+
+
+def _vm_filter_spec(view, paths: List[str] = VM_PROPERTIES):
+    """FilterSpec selecting paths (default VM_PROPERTIES) for every VM in a ContainerView."""
+    pc = vmodl.query.PropertyCollector
+    traversal = pc.TraversalSpec(
+        name="traverseView", type=vim.view.ContainerView, path="view", skip=False
+    )
+    obj_spec = pc.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+    prop_spec = pc.PropertySpec(type=vim.VirtualMachine, all=False, pathSet=paths)
+    return pc.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+
+
+def _retrieve_object_properties(content, refs: list, paths: List[str], page_size: int) -> dict:
+    """{moid: {path: value}} for the given VM refs, page_size objects per RetrievePropertiesEx."""
+    pc = vmodl.query.PropertyCollector
+    collector = content.propertyCollector
+    options = pc.RetrieveOptions(maxObjects=page_size)
+    out = {}
+    for i in range(0, len(refs), page_size):
+        spec = pc.FilterSpec(
+            objectSet=[pc.ObjectSpec(obj=ref, skip=False) for ref in refs[i:i + page_size]],
+            propSet=[pc.PropertySpec(type=vim.VirtualMachine, all=False, pathSet=paths)],
+        )
+        result = collector.RetrievePropertiesEx([spec], options)
+        while result is not None:
+            for obj_content in result.objects or []:
+                out[obj_content.obj._moId] = {p.name: p.val for p in (obj_content.propSet or [])}
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+    return out
+
+
+def _retrieve_vm_properties(content, view, page_size: int):
+    """
+    Yield (vm_ref, props) for every VM in the view using paged RetrievePropertiesEx /
+    ContinueRetrievePropertiesEx: one round trip per page instead of several per VM.
+    """
+    collector = content.propertyCollector
+    options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+    result = collector.RetrievePropertiesEx([_vm_filter_spec(view)], options)
+    while result is not None:
+        for obj_content in result.objects or []:
+            props = {p.name: p.val for p in (obj_content.propSet or [])}
+            yield obj_content.obj, props
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(result.token)
+
+
+def _shard(obj, name: str, recursive: bool = True) -> dict:
+    return {"type": obj._wsdlName, "moid": obj._moId, "name": name, "recursive": recursive}
+
+
+def _list_shards(content, shard_by: str) -> List[dict]:
+    """
+    Shards covering the whole inventory. Folder shards are the top-level VM folders and vApps
+    of each datacenter, plus a non-recursive shard for VMs directly in its VM folder.
+    """
+    kind = SHARD_TYPES[shard_by]
+    view_type = vim.Datacenter if kind == "Folder" else getattr(vim, kind)
+    view = content.viewManager.CreateContainerView(content.rootFolder, [view_type], True)
+    try:
+        objects = list(view.view)
+    finally:
+        view.Destroy()
+    if kind != "Folder":
+        return [_shard(obj, obj.name) for obj in objects]
+    shards = []
+    for dc in objects:
+        root = dc.vmFolder
+        shards.append(_shard(root, f"{dc.name}/", recursive=False))
+        for child in root.childEntity:
+            if isinstance(child, (vim.Folder, vim.VirtualApp)):
+                shards.append(_shard(child, f"{dc.name}/{child.name}"))
+    return shards
+
+
+def _connection_params(config: dict) -> dict | None:
+    """host/port/user/password from config + env; None if not configured."""
+    host = config.get("host") or os.environ.get("VCENTER_HOST", "")
+    user = config.get("user") or os.environ.get("VCENTER_USER", "")
+    password = config.get("password") or _get_password(config)
+    port = int(config.get("port") or os.environ.get("VCENTER_PORT", "443"))
+    if not host or not user or not password:
+        return None
+    return {"host": host, "port": port, "user": user, "password": password}
+
+
+def connect_vcenter(config: dict):
+    """SmartConnect using config + env; returns ServiceInstance or None if not configured."""
+    params = _connection_params(config)
+    if params is None:
+        return None
+    context = ssl.create_default_context()
+    if not os.environ.get("VCENTER_SSL_VERIFY", "").lower() in ("1", "true", "yes"):
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return SmartConnect(
+        host=params["host"],
+        user=params["user"],
+        pwd=params["password"],
+        port=params["port"],
+        sslContext=context,
+    )
+
+
+def _finish_page(content, page: list, config: dict, collect_perf: bool) -> List[VMInfo]:
+    """Apply perf metrics to the powered-on VMs of a [(vm_ref, VMInfo)] page; return the VMInfos."""
+    powered_on = {ref._moId: (ref, info) for ref, info in page if info.power_state == "poweredon"}
+    if powered_on and collect_perf:
+        with instrumentation.phase("enrich"):
+            _apply_perf_metrics(content, powered_on, config)
+    return [info for _, info in page]
+
+
+@dataclass
+class VMSyncResult:
+    """Outcome of an incremental sync: full inventory, or only the VMs changed since last version."""
+    full: bool
+    vms: List[VMInfo]
+    present_uuids: List[str] = field(default_factory=list)  # every VM currently in the inventory
+    # Why a full snapshot was taken: initial, session_changed, version_lost or periodic ("" = incremental)
+    full_reason: str = ""
+
+
+class _InventorySync:
+    """
+    Session-scoped PropertyCollector + filter over all VMs (SYNC_PROPERTIES), with the last
+    WaitForUpdatesEx version and the merged property state per VM. Version tokens are only
+    valid for this collector, so the state lives with the pooled session that created it.
+    """
+
+    def __init__(self, content):
+        self.view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.collector.CreateFilter(_vm_filter_spec(self.view, SYNC_PROPERTIES), partialUpdates=False)
+        self.full_at = time.monotonic()
+        self.version = ""
+        self.props: dict = {}  # moid -> {property path: value}
+        self.refs: dict = {}   # moid -> vim.VirtualMachine
+
+    def poll(self, max_objects: int) -> set:
+        """Apply updates since self.version; return moids that entered or changed."""
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0, maxObjectUpdates=max_objects)
+        changed = set()
+        while True:
+            update = self.collector.WaitForUpdatesEx(self.version, options)
+            if update is None:  # nothing changed since version
+                break
+            for filter_update in update.filterSet or []:
+                for obj_update in filter_update.objectSet or []:
+                    moid = obj_update.obj._moId
+                    if obj_update.kind == "leave":
+                        self.props.pop(moid, None)
+                        self.refs.pop(moid, None)
+                        changed.discard(moid)
+                        continue
+                    props = self.props.setdefault(moid, {})
+                    self.refs[moid] = obj_update.obj
+                    for change in obj_update.changeSet or []:
+                        if change.op in ("remove", "indirectRemove"):
+                            props.pop(change.name, None)
+                        else:
+                            props[change.name] = change.val
+                    changed.add(moid)
+            self.version = update.version
+            if not update.truncated:
+                break
+        return changed
+
+    def destroy(self) -> None:
+        for obj in (self.collector, self.view):
+            try:
+                obj.Destroy()
+            except Exception:
+                pass
+
+
+class RoundTripCounter:
+    """Number of SOAP calls (methods + property reads) made through a stub."""
+
+    def __init__(self):
+        self.calls = 0
+
+
+@contextmanager
+def count_round_trips(si):
+    """Count every SOAP round trip made through si's stub while the block runs."""
+    stub = si._stub
+    counter = RoundTripCounter()
+    invoke_method, invoke_accessor = stub.InvokeMethod, stub.InvokeAccessor
+
+    def _method(*args, **kwargs):
+        counter.calls += 1
+        return invoke_method(*args, **kwargs)
+
+    def _accessor(*args, **kwargs):
+        counter.calls += 1
+        return invoke_accessor(*args, **kwargs)
+
+    stub.InvokeMethod, stub.InvokeAccessor = _method, _accessor
+    try:
+        yield counter
+    finally:
+        del stub.InvokeMethod, stub.InvokeAccessor
+
+
 class VCenterClient(BaseClient):
     """vCenter 8.x client using pyvmomi. Fetches VMs with QuickStats and boot time for idle detection."""
 
     def get_vms(self, config: dict) -> List[VMInfo]:
-        if not PYVMOMI_AVAILABLE:
-            return []
-        host = config.get("host") or os.environ.get("VCENTER_HOST", "")
-        user = config.get("user") or os.environ.get("VCENTER_USER", "")
-        password = config.get("password") or _get_password(config)
-        port = int(config.get("port") or os.environ.get("VCENTER_PORT", "443"))
-        if not host or not user or not password:
-            return []
-        context = ssl.create_default_context()
-        if not os.environ.get("VCENTER_SSL_VERIFY", "").lower() in ("1", "true", "yes"):
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
+        return [vm for batch in self.iter_vm_batches(config) for vm in batch]
+
+    def iter_vm_batches(self, config: dict, shard: dict | None = None) -> Iterator[List[VMInfo]]:
+        """
+        Yield one VMInfo batch per PropertyCollector page, so only one page is held at a time.
+        Like Aria, a failure before the first batch yields nothing and a later one raises; for a
+        shard every failure raises, since an empty shard cannot be told from a failed one.
+        """
+        if not PYVMOMI_AVAILABLE or _connection_params(config) is None:
+            if shard is not None:
+                raise RuntimeError("vCenter is not configured")
+            return
+        from .vcenter_pool import vcenter_session
+
+        yielded = False
         try:
-            si = SmartConnect(
-                host=host,
-                user=user,
-                pwd=password,
-                port=port,
-                sslContext=context,
-            )
-            try:
-                content = si.RetrieveContent()
-                container = content.rootFolder
-                view_type = [vim.VirtualMachine]
-                recursive = True
-                view = content.viewManager.CreateContainerView(container, view_type, recursive)
-                vms: List[VMInfo] = []
-                for vm in view.view:
-                    name = getattr(vm, "name", None) or ""
-                    uuid = ""
-                    metadata = {}
-                    num_cpu = None
-                    memory_size_mb = None
-                    if hasattr(vm, "summary") and vm.summary and hasattr(vm.summary, "config") and vm.summary.config:
-                        uuid = getattr(vm.summary.config, "uuid", None) or ""
-                        num_cpu = getattr(vm.summary.config, "numCpu", None)
-                        memory_size_mb = getattr(vm.summary.config, "memorySizeMB", None)
-                        metadata["numCpu"] = num_cpu
-                        metadata["memorySizeMB"] = memory_size_mb
-                    if not uuid and hasattr(vm, "config") and vm.config:
-                        uuid = getattr(vm.config, "uuid", None) or ""
-
-                    power = ""
-                    last_boot_time = None
-                    if hasattr(vm, "runtime") and vm.runtime:
-                        ps = getattr(vm.runtime, "powerState", None)
-                        power = str(ps).replace("PowerState.", "").strip().lower() if ps is not None else ""
-                        boot_time = getattr(vm.runtime, "bootTime", None)
-                        if boot_time is not None:
-                            try:
-                                last_boot_time = boot_time
-                                if last_boot_time.tzinfo is None:
-                                    last_boot_time = last_boot_time.replace(tzinfo=timezone.utc)
-                            except Exception:
-                                last_boot_time = None
-
-                    cpu_usage_mhz = None
-                    cpu_usage_percent = None
-                    memory_usage_mb = None
-                    uptime_days = None
-                    if hasattr(vm, "summary") and vm.summary and hasattr(vm.summary, "quickStats") and vm.summary.quickStats:
-                        qs = vm.summary.quickStats
-                        cpu_usage_mhz = getattr(qs, "overallCpuUsage", None)
-                        memory_usage_mb = getattr(qs, "guestMemoryUsage", None)
-                        if memory_usage_mb is not None and memory_size_mb and memory_size_mb > 0:
-                            metadata["memoryUsagePercent"] = round(100.0 * memory_usage_mb / memory_size_mb, 2)
-                        if cpu_usage_mhz is not None and num_cpu and num_cpu > 0:
-                            mhz_per_core = DEFAULT_MHZ_PER_CORE
-                            cpu_usage_percent = min(100.0, 100.0 * cpu_usage_mhz / (num_cpu * mhz_per_core))
-                        if last_boot_time is not None:
-                            delta = (datetime.now(timezone.utc) - last_boot_time).total_seconds()
-                            uptime_days = delta / (24.0 * 3600.0)
-
-                    vms.append(VMInfo(
-                        name=name,
-                        uuid=uuid or f"vm-{id(vm)}",
-                        power_state=power or None,
-                        metadata=metadata or None,
-                        cpu_usage_mhz=cpu_usage_mhz,
-                        cpu_usage_percent=cpu_usage_percent,
-                        memory_usage_mb=float(memory_usage_mb) if memory_usage_mb is not None else None,
-                        network_usage_kbps=None,  # would require PerformanceManager
-                        disk_usage_iops=None,    # would require PerformanceManager
-                        uptime_days=uptime_days,
-                        last_boot_time=last_boot_time,
-                    ))
-                view.Destroy()
-                return vms
-            finally:
-                Disconnect(si)
+            with vcenter_session(config) as session:
+                for batch in self.iter_collect(session.si, config, shard):
+                    yielded = True
+                    yield batch
         except Exception:
+            if yielded or shard is not None:
+                raise
+
+    def list_shards(self, config: dict) -> List[dict] | None:
+        """
+        Shards for config["shard_by"] ("datacenter", "cluster" or "folder"): dicts with type,
+        moid, name and recursive. [] when sharding is off or not possible, None on error.
+        """
+        shard_by = config.get("shard_by")
+        if shard_by not in SHARD_TYPES or not PYVMOMI_AVAILABLE or _connection_params(config) is None:
             return []
+        from .vcenter_pool import vcenter_session
+
+        try:
+            with vcenter_session(config) as session:
+                return _list_shards(session.si.RetrieveContent(), shard_by)
+        except Exception:
+            return None
+
+    def collect_vms(self, si, config: dict, shard: dict | None = None) -> List[VMInfo]:
+        """Fetch VM_PROPERTIES for all VMs of a connected ServiceInstance in a few paged calls."""
+        return [vm for batch in self.iter_collect(si, config, shard) for vm in batch]
+
+    def iter_collect(self, si, config: dict, shard: dict | None = None) -> Iterator[List[VMInfo]]:
+        """
+        Yield VMs of a connected ServiceInstance one property page at a time, with perf
+        metrics applied per page; with a shard (from list_shards) only the VMs under that
+        inventory object.
+        """
+        page_size = int(config.get("property_page_size") or PROPERTY_PAGE_SIZE)
+        collect_perf = config.get("collect_perf_metrics", True)
+        content = si.RetrieveContent()
+        if shard is None:
+            container, recursive = content.rootFolder, True
+        else:
+            container = getattr(vim, shard["type"])(shard["moid"], si._stub)
+            recursive = shard.get("recursive", True)
+        view = content.viewManager.CreateContainerView(container, [vim.VirtualMachine], recursive)
+        try:
+            page = []
+            for ref, props in _retrieve_vm_properties(content, view, page_size):
+                page.append((ref, _vm_info_from_props(ref._moId, props)))
+                if len(page) >= page_size:
+                    yield _finish_page(content, page, config, collect_perf)
+                    page = []
+            if page:
+                yield _finish_page(content, page, config, collect_perf)
+        finally:
+            view.Destroy()
+
+    def sync_vms(self, config: dict, sync_key) -> VMSyncResult | None:
+        """
+        Incremental sync with WaitForUpdatesEx. The first call per sync_key (and any call after
+        the session or version was lost) returns the full inventory; later calls return only
+        VMs whose properties changed, plus the uuids of all VMs still present. None on error.
+        """
+        if not PYVMOMI_AVAILABLE or _connection_params(config) is None:
+            return None
+        from .vcenter_pool import vcenter_session
+
+        try:
+            # Prefer the pooled session that already holds this key's collector and version
+            with vcenter_session(config, prefer=("inventory_sync", sync_key)) as session:
+                return self._sync(session, config, sync_key)
+        except Exception:
+            return None
+
+    def _poll(self, session, content, config: dict, sync_key, page_size: int):
+        """(sync state, moids to return, full_reason); full_reason "" = incremental."""
+        state_key = ("inventory_sync", sync_key)
+        sync = session.state.get(state_key)
+        interval = float(config.get("full_sync_interval") or FULL_SYNC_INTERVAL)
+        try:
+            if sync is None:
+                # Never synced in this process, or the state stayed with another / re-logged session
+                raise LookupError("session_changed" if sync_key in _synced_keys else "initial")
+            changed = sync.poll(page_size)
+        except (LookupError, vmodl.query.InvalidCollectorVersion, vmodl.fault.ManagedObjectNotFound) as e:
+            # Rebuild the collector and take a full snapshot
+            reason = e.args[0] if isinstance(e, LookupError) else "version_lost"
+            if sync is not None:
+                sync.destroy()
+            sync = session.state[state_key] = _InventorySync(content)
+            _synced_keys.add(sync_key)
+            sync.poll(page_size)
+            return sync, set(sync.props), reason
+        if time.monotonic() - sync.full_at >= interval:
+            sync.full_at = time.monotonic()
+            return sync, set(sync.props), "periodic"
+        return sync, changed, ""
+
+    def _sync(self, session, config: dict, sync_key) -> VMSyncResult:
+        page_size = int(config.get("property_page_size") or PROPERTY_PAGE_SIZE)
+        content = session.si.RetrieveContent()
+        sync, moids, reason = self._poll(session, content, config, sync_key, page_size)
+        # Volatile properties are not tracked by the collector: read them for the returned VMs only
+        volatile = _retrieve_object_properties(
+            content, [sync.refs[moid] for moid in moids], VOLATILE_PROPERTIES, page_size
+        ) if moids else {}
+        infos = {moid: _vm_info_from_props(moid, {**sync.props[moid], **volatile.get(moid, {})}) for moid in moids}
+        powered_on = {moid: (sync.refs[moid], info) for moid, info in infos.items() if info.power_state == "poweredon"}
+        if powered_on and config.get("collect_perf_metrics", True):
+            _apply_perf_metrics(content, powered_on, config)
+        return VMSyncResult(
+            full=bool(reason),
+            vms=list(infos.values()),
+            present_uuids=[_vm_uuid(moid, props) for moid, props in sync.props.items()],
+            full_reason=reason,
+        )
 
 
 def get_vcenter_vms(config: dict) -> List[VMInfo]:
@@ -0,0 +1,187 @@
+# Per-process pool of authenticated vCenter sessions.
+# Avoids a TLS handshake + login per scan and caps concurrent sessions per vCenter in each
+# worker process (a vCenter sees up to worker processes x cap sessions).
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from . import instrumentation
+from .vcenter import PYVMOMI_AVAILABLE, _connection_params, connect_vcenter, count_round_trips
+
+try:
+    from pyVim.connect import Disconnect
+    from pyVmomi import vim
+except ImportError:
+    pass
+
+# Max sessions held per vCenter (host, port, user) by ONE worker process; override with
+# config["max_sessions"]. The vCenter-wide total is this times the number of worker processes,
+# so size it (and the worker concurrency) against the vCenter session limit.
+MAX_SESSIONS_PER_VCENTER = int(os.environ.get("VCENTER_MAX_SESSIONS", "2"))
+# Seconds to wait for a free session before giving up
+ACQUIRE_TIMEOUT = 300
+
+
+class PooledSession:
+    """An authenticated ServiceInstance plus per-session state (e.g. property collectors)."""
+
+    def __init__(self, si):
+        self.si = si
+        self.state: dict = {}
+        self.last_used = time.monotonic()
+
+
+class VCenterSessionPool:
+    """Idle sessions for one vCenter connection; at most max_sessions exist at once."""
+
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._idle: list[PooledSession] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, config: dict, timeout: float = ACQUIRE_TIMEOUT, prefer=None) -> PooledSession:
+        """
+        Borrow a live session (re-login or reconnect as needed); blocks while the cap is reached.
+        With prefer, an idle session holding that state key is taken first.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No free vCenter session within timeout")
+        try:
+            while True:
+                with self._lock:
+                    session = self._pop_idle(prefer)
+                if session is None:
+                    si = connect_vcenter(config)
+                    if si is None:
+                        raise ValueError("vCenter host/user/password not configured")
+                    return PooledSession(si)
+                if _ensure_authenticated(session, config):
+                    return session
+                _disconnect(session.si)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _pop_idle(self, prefer=None) -> PooledSession | None:
+        if not self._idle:
+            return None
+        for i in range(len(self._idle) - 1, -1, -1):
+            if prefer is not None and prefer in self._idle[i].state:
+                return self._idle.pop(i)
+        return self._idle.pop()
+
+    def release(self, session: PooledSession, discard: bool = False) -> None:
+        """Return a session to the pool (LIFO, so the most recent one is reused first)."""
+        try:
+            if discard:
+                _disconnect(session.si)
+            else:
+                session.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(session)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Log out all idle sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            _disconnect(session.si)
+
+
+def _ensure_authenticated(session: PooledSession, config: dict) -> bool:
+    """Cheap liveness check; log in again on NotAuthenticated. False if the session is unusable."""
+    si = session.si
+    try:
+        si.CurrentTime()
+        return True
+    except vim.fault.NotAuthenticated:
+        params = _connection_params(config)
+        try:
+            si.content.sessionManager.Login(params["user"], params["password"])
+            # Session-scoped objects (views, collectors) died with the old session
+            session.state.clear()
+            return True
+        except Exception:
+            return False
+    except Exception:
+        return False
+
+
+def _disconnect(si) -> None:
+    try:
+        Disconnect(si)
+    except Exception:
+        pass
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config: dict) -> VCenterSessionPool:
+    """Pool for the vCenter described by config (shared by DataSources with the same host/user)."""
+    params = _connection_params(config)
+    if params is None:
+        raise ValueError("vCenter host/user/password not configured")
+    key = (params["host"].lower(), params["port"], params["user"])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            max_sessions = int(config.get("max_sessions") or MAX_SESSIONS_PER_VCENTER)
+            pool = _pools[key] = VCenterSessionPool(max(1, max_sessions))
+        return pool
+
+
+@contextmanager
+def vcenter_session(config: dict, prefer=None):
+    """
+    Borrow a pooled session; it is discarded instead of returned if the block raises.
+    GeneratorExit (a generator using the session was closed early) is a normal release.
+    prefer: session state key to prefer among idle sessions (see VCenterSessionPool.acquire).
+    """
+    pool = get_pool(config)
+    with instrumentation.phase("connect"):
+        session = pool.acquire(config, prefer=prefer)
+    ok = False
+    # During a scan, SOAP round trips made with the session count as API calls
+    counting = count_round_trips(session.si) if instrumentation.current_stats() else nullcontext()
+    try:
+        with counting as trips:
+            try:
+                yield session
+            except GeneratorExit:
+                # Consumer stopped iterating between calls: the session itself is healthy
+                ok = True
+                raise
+            finally:
+                if trips is not None:
+                    instrumentation.count("api_calls", trips.calls)
+        ok = True
+    finally:
+        pool.release(session, discard=not ok)
+
+
+def close_all() -> None:
+    """Log out every pooled session in this process (worker shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _forget_after_fork() -> None:
+    # Sockets inherited from the parent must not be shared with a forked worker child
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+if PYVMOMI_AVAILABLE:
+    atexit.register(close_all)
+    os.register_at_fork(after_in_child=_forget_after_fork)
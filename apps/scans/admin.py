@@ -1,15 +1,39 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import DataSource, ScanRun, VirtualMachine
+from .tasks import refresh_dashboard
+
+
+class SummaryRefreshMixin:
+    """
+    Queue a dashboard summary refresh after admin edits and deletes (the KPIs read the snapshot);
+    the recompute runs on a worker once the change is committed, not inside the admin request.
+    """
+
+    def _queue_summary_refresh(self):
+        transaction.on_commit(refresh_dashboard.delay)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._queue_summary_refresh()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._queue_summary_refresh()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self._queue_summary_refresh()
 
 
 @admin.register(DataSource)
-class DataSourceAdmin(admin.ModelAdmin):
+class DataSourceAdmin(SummaryRefreshMixin, admin.ModelAdmin):
     list_display = ("name", "source_type", "is_enabled", "created_at")
     list_filter = ("source_type", "is_enabled")
 
 
 @admin.register(VirtualMachine)
-class VirtualMachineAdmin(admin.ModelAdmin):
+class VirtualMachineAdmin(SummaryRefreshMixin, admin.ModelAdmin):
     list_display = (
         "name", "uuid", "data_source", "power_state", "last_seen",
         "status", "idle_score", "cpu_usage_percent", "memory_usage_mb",
@@ -21,5 +45,21 @@ class VirtualMachineAdmin(admin.ModelAdmin):
 
 @admin.register(ScanRun)
 class ScanRunAdmin(admin.ModelAdmin):
-    list_display = ("started_at", "finished_at", "status", "data_source")
-    list_filter = ("status", "data_source")
+    list_display = (
+        "started_at", "finished_at", "status", "data_source", "shard", "parent",
+        "fetch_seconds", "persist_seconds", "detect_seconds",
+        "rows_created", "rows_updated", "rows_unchanged", "cache_hit", "api_calls",
+    )
+    list_filter = ("status", "data_source", "cache_hit")
+    readonly_fields = ("started_at",)
+    fieldsets = (
+        (None, {"fields": ("data_source", "parent", "shard", "status", "message", "started_at", "finished_at")}),
+        ("Timings (seconds)", {"fields": (
+            "lock_wait_seconds", "lock_hold_seconds", "connect_seconds", "fetch_seconds",
+            "enrich_seconds", "cache_seconds", "persist_seconds", "detect_seconds",
+        )}),
+        ("Counters", {"fields": (
+            "rows_created", "rows_updated", "rows_unchanged", "cache_hit", "api_calls", "bytes_received",
+            "perf_errors", "full_syncs", "incremental_syncs",
+        )}),
+    )
@@ -0,0 +1,68 @@
+# Inventory cache codec: VMInfo batches <-> compact binary values for the API cache.
+# A value is MAGIC followed by a zlib stream of columnar JSON ({field: [values...]}), so keys are
+# stored once per batch instead of once per VM and repeated metadata compresses well. Values keep
+# their JSON types exactly, so a replayed batch fingerprints the same as a fresh fetch.
+# An inventory is cached as one value per batch (chunk keys) plus a manifest under the base key.
+import json
+import zlib
+from dataclasses import fields
+from datetime import datetime
+from typing import List
+
+from apps.integrations.base import VMInfo
+
+# Format marker and version; values with another prefix (e.g. older JSON strings) are misses
+MAGIC = b"IHC\x01"
+# zlib level: 6 is the library default; lower trades size for encode speed
+COMPRESS_LEVEL = 6
+# Manifest "codec" value; bump with MAGIC when the layout changes
+CODEC_VERSION = 1
+
+FIELDS = tuple(f.name for f in fields(VMInfo))
+DATETIME_FIELDS = frozenset({"last_boot_time"})
+
+
+def encode_vms(vms: List[VMInfo]) -> bytes:
+    """One batch as MAGIC + zlib(columnar JSON)."""
+    columns = {name: [getattr(vm, name) for vm in vms] for name in FIELDS}
+    for name in DATETIME_FIELDS:
+        columns[name] = [v.isoformat() if hasattr(v, "isoformat") else v for v in columns[name]]
+    raw = json.dumps(columns, separators=(",", ":")).encode("utf-8")
+    return MAGIC + zlib.compress(raw, COMPRESS_LEVEL)
+
+
+def _parse_datetime(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def decode_vms(value: bytes) -> List[VMInfo]:
+    """Inverse of encode_vms; ValueError if value is not in this format."""
+    if not isinstance(value, bytes) or not value.startswith(MAGIC):
+        raise ValueError("Not an encoded inventory batch")
+    try:
+        columns = json.loads(zlib.decompress(value[len(MAGIC):]))
+    except zlib.error as e:
+        raise ValueError(str(e)) from e
+    for name in DATETIME_FIELDS & columns.keys():
+        columns[name] = [_parse_datetime(v) for v in columns[name]]
+    size = len(columns.get("uuid") or ())
+    # Columns added to VMInfo after the value was written decode as None
+    ordered = [columns.get(name) or [None] * size for name in FIELDS]
+    return [VMInfo(*row) for row in zip(*ordered)]
+
+
+def manifest(pages: int, vms: int, **fields) -> dict:
+    """Base-key value describing a cached inventory of pages chunk keys (plus fill metadata)."""
+    return {"codec": CODEC_VERSION, "pages": pages, "vms": vms, **fields}
+
+
+def manifest_pages(value) -> int | None:
+    """Number of chunk keys from a manifest, None if value is missing or from another codec."""
+    if not isinstance(value, dict) or value.get("codec") != CODEC_VERSION:
+        return None
+    return int(value["pages"])
@@ -0,0 +1,214 @@
+# Single-flight fill of the chunked inventory cache (cache_codec), protected against stampedes:
+# - one filler per key: a cache.add lock; other callers wait for its manifest instead of fetching
+# - probabilistic early refresh (XFetch): a caller refills a fresh value a little before it expires,
+#   more likely the closer the expiry and the longer the last fill took
+# - stale-while-revalidate: for API_CACHE_STALE_TTL seconds after expiry the old chunks are still
+#   served while a background task refills them
+# Every fill writes its chunks under a new generation and swaps the manifest last, so a reader
+# never mixes chunks of two fills. Outcomes are counted per prefix (see counters()).
+# The manifest fingerprint covers every ingested column (usage and uptime included), so two fills
+# share it exactly when persisting either would write the same values.
+import hashlib
+import math
+import random
+import time
+import uuid
+from typing import Iterator, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.integrations import instrumentation
+from apps.integrations.base import VMInfo
+
+from . import cache_codec
+from .persistence import vm_defaults, vm_fingerprint
+
+# Columns left out of the manifest fingerprint: only the scan time
+INVENTORY_FINGERPRINT_EXCLUDE = frozenset({"last_seen"})
+
+# Seconds a filled inventory is fresh
+API_CACHE_TTL = getattr(settings, "API_CACHE_TTL", 300)
+# Seconds after that it may still be served while a background refresh runs (0 = never stale)
+API_CACHE_STALE_TTL = getattr(settings, "API_CACHE_STALE_TTL", 300)
+# XFetch beta: > 1 favours earlier refreshes, 0 disables them
+XFETCH_BETA = 1.0
+# Fill lock lifetime; renewed with every chunk, so it only bounds a crashed filler
+FILL_LOCK_TTL = 120
+# How long a caller waits for another caller's fill before fetching itself (seconds)
+FILL_WAIT = getattr(settings, "API_CACHE_FILL_WAIT", 30)
+FILL_POLL = 0.5
+
+# lookup() outcomes; the first four are also counter names
+HIT, STALE, MISS, EARLY, WAITED = "hit", "stale", "miss", "early", "waited"
+COUNTERS = (HIT, STALE, MISS, EARLY, WAITED)
+# Counters live as long as a typical trend window; they reset when the cache is flushed
+COUNTER_TTL = 7 * 86400
+
+
+def _fill_key(key: str) -> str:
+    return f"{key}fill"
+
+
+def _chunk_key(key: str, gen: str, page: int) -> str:
+    return f"{key}g{gen}:p{page}"
+
+
+def _counter_key(prefix: str, name: str) -> str:
+    return f"idlehunter:cachefill:{prefix}:{name}"
+
+
+def record(prefix: str, name: str) -> None:
+    key = _counter_key(prefix, name)
+    if not cache.add(key, 1, COUNTER_TTL):
+        try:
+            cache.incr(key)
+        except ValueError:  # expired between add and incr
+            cache.add(key, 1, COUNTER_TTL)
+
+
+def counters(prefixes) -> dict:
+    """{prefix: {counter: value}} for the given cache prefixes."""
+    keys = {_counter_key(p, n): (p, n) for p in prefixes for n in COUNTERS}
+    values = cache.get_many(list(keys))
+    out = {p: {n: 0 for n in COUNTERS} for p in prefixes}
+    for key, value in values.items():
+        p, n = keys[key]
+        out[p][n] = value
+    return out
+
+
+def read_manifest(key: str) -> dict | None:
+    manifest = cache.get(key)
+    return manifest if cache_codec.manifest_pages(manifest) is not None and "gen" in manifest else None
+
+
+def is_fresh(key: str) -> bool:
+    """True if key has a manifest that is still fresh (no refill needed)."""
+    manifest = read_manifest(key)
+    return manifest is not None and manifest["fresh_until"] > time.time()
+
+
+def acquire_fill(key: str) -> str | None:
+    """Fill lock token, or None if another caller is filling key."""
+    token = uuid.uuid4().hex
+    return token if cache.add(_fill_key(key), token, FILL_LOCK_TTL) else None
+
+
+def release_fill(key: str, token: str | None) -> None:
+    if token is not None and cache.get(_fill_key(key)) == token:
+        cache.delete(_fill_key(key))
+
+
+def _early(manifest: dict, now: float) -> bool:
+    """XFetch: now - delta * beta * ln(rand) >= expiry."""
+    return now - manifest.get("delta", 0.0) * XFETCH_BETA * math.log(1.0 - random.random()) >= manifest["fresh_until"]
+
+
+def _wait_for_fill(key: str) -> dict | None:
+    deadline = time.monotonic() + FILL_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(FILL_POLL)
+        manifest = read_manifest(key)
+        if manifest is not None and manifest["fresh_until"] > time.time():
+            return manifest
+        if cache.get(_fill_key(key)) is None:
+            # Filler gave up (or crashed and its lock expired): stop waiting
+            return manifest
+    return None
+
+
+def lookup(key: str, prefix: str, refresh=None):
+    """
+    Decide how to serve key: (outcome, manifest, fill token).
+    HIT / WAITED / STALE come with a manifest to replay. For STALE, refresh(token) was called
+    to refill in the background (it owns the fill lock). MISS / EARLY mean the caller should
+    fetch and fill; the token is None if the lock could not be taken (fill without it).
+    """
+    now = time.time()
+    manifest = read_manifest(key)
+    if manifest is not None and now < manifest["fresh_until"]:
+        if _early(manifest, now):
+            token = acquire_fill(key)
+            if token is not None:
+                record(prefix, EARLY)
+                return EARLY, None, token
+        record(prefix, HIT)
+        return HIT, manifest, None
+    if manifest is not None:
+        token = acquire_fill(key)
+        if token is not None:
+            try:
+                if refresh is None:
+                    raise LookupError("no background refresh")
+                refresh(token)
+            except Exception:
+                # No background refresh possible (e.g. broker down): refill inline instead
+                record(prefix, MISS)
+                return MISS, None, token
+        record(prefix, STALE)
+        return STALE, manifest, None
+    token = acquire_fill(key)
+    if token is None:
+        manifest = _wait_for_fill(key)
+        if manifest is not None:
+            record(prefix, WAITED)
+            return WAITED, manifest, None
+    record(prefix, MISS)
+    return MISS, None, token
+
+
+def replay(key: str, manifest: dict) -> Iterator[List[VMInfo]]:
+    """Yield the cached batches of a manifest; LookupError if a chunk is gone."""
+    for page in range(manifest["pages"]):
+        with instrumentation.phase("cache"):
+            value = cache.get(_chunk_key(key, manifest["gen"], page))
+            batch = None if value is None else cache_codec.decode_vms(value)
+        if batch is None:
+            raise LookupError(page)
+        yield batch
+
+
+def fill(
+    key: str, batches: Iterator[List[VMInfo]], token: str | None = None, on_fill=None
+) -> Iterator[List[VMInfo]]:
+    """
+    Pass batches through while writing each as a chunk of a new generation; the manifest is
+    swapped in after the last one (and passed to on_fill) and the fill lock (token) released.
+    An error or an abandoned fill leaves the previous manifest in place. The manifest's
+    fingerprint is the sha1 of the sorted per-VM (uuid, vm_fingerprint) pairs: it ignores
+    page order and last_seen (INVENTORY_FINGERPRINT_EXCLUDE).
+    """
+    gen = uuid.uuid4().hex[:12]
+    timeout = API_CACHE_TTL + API_CACHE_STALE_TTL
+    started = time.monotonic()
+    pages = vms = 0
+    rows = []
+    try:
+        for batch in batches:
+            with instrumentation.phase("cache"):
+                value = cache_codec.encode_vms(batch)
+                rows.extend(
+                    f"{vm.uuid}:{vm_fingerprint(vm_defaults(vm, None), INVENTORY_FINGERPRINT_EXCLUDE)}"
+                    for vm in batch
+                )
+                cache.set(_chunk_key(key, gen, pages), value, timeout)
+                if token is not None:
+                    cache.touch(_fill_key(key), FILL_LOCK_TTL)
+            pages += 1
+            vms += len(batch)
+            yield batch
+        manifest = cache_codec.manifest(
+            pages,
+            vms,
+            gen=gen,
+            fingerprint=hashlib.sha1("\n".join(sorted(rows)).encode("utf-8")).hexdigest(),
+            delta=time.monotonic() - started,
+            fresh_until=time.time() + API_CACHE_TTL,
+        )
+        with instrumentation.phase("cache"):
+            cache.set(key, manifest, timeout)
+        if on_fill is not None:
+            on_fill(manifest)
+    finally:
+        release_fill(key, token)
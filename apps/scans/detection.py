@@ -1,8 +1,20 @@
 # Idle VM detection: resource-based (weighted scoring) + missing/deleted
+from datetime import timedelta
+
 from django.conf import settings
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Lower, Trim
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
 from django.utils import timezone
 
-from .models import VirtualMachine
+from .metrics import (
+    effective_metric,
+    store_window_metrics,
+    window_aggregates,
+    window_enabled,
+    window_expression,
+)
+from .models import DataSource, VirtualMachine
 
 # Days without being seen in a scan → treat as missing/deleted
 MISSING_DAYS_THRESHOLD = getattr(settings, "IDLE_DAYS_THRESHOLD", 7)
@@ -12,6 +24,10 @@ POWEREDOFF_IDLE_DAYS = getattr(settings, "POWEREDOFF_IDLE_DAYS", 30)
 CPU_IDLE_PERCENT = getattr(settings, "CPU_IDLE_PERCENT_THRESHOLD", 5.0)
 NETWORK_IDLE_KBPS = getattr(settings, "NETWORK_IDLE_KBPS_THRESHOLD", 1.0)
 DISK_IDLE_IOPS = getattr(settings, "DISK_IDLE_IOPS_THRESHOLD", 5.0)
+# "sql": one set-based UPDATE per DataSource; "numpy": continuous curves (scoring.py); "python": per-object loop
+SCORING_ENGINE = getattr(settings, "IDLE_SCORING_ENGINE", "sql")
+# VM ids per scoring statement in incremental detection
+DIRTY_CHUNK_SIZE = 1000
 
 
 def compute_idle_scores(queryset=None):
@@ -20,10 +36,12 @@ def compute_idle_scores(queryset=None):
     - Missing: last_seen too old or None → status='missing', idle_score=1.0
     - Rule A (Zombie): power_state=='poweredOff' and last_boot_time > 30 days ago → 1.0, status='idle'
     - Rule B (Idle): power_state=='poweredOn' → weighted score from low CPU/network/disk; status from score.
+      Metrics are RULE_B_WINDOW_DAYS aggregates from metric history when available (see metrics.py).
     """
     if queryset is None:
         queryset = VirtualMachine.objects.all()
     now = timezone.now()
+    aggregates = window_aggregates(now, vm__in=queryset.values("pk"))
     updated = 0
     fields = [
         "pk", "last_seen", "idle_score", "status",
@@ -48,15 +66,17 @@ def compute_idle_scores(queryset=None):
                     new_score = 1.0
                 # else: recently powered off; leave active/0.0 or could treat as idle
             else:
-                # --- Rule B: Powered-on; score by resource usage (current snapshot) ---
-                # Uses latest metrics; 7-day average would require metric history table.
+                # --- Rule B: Powered-on; score by resource usage (window aggregate or snapshot) ---
                 if power == "poweredon":
+                    cpu = effective_metric(aggregates, vm.pk, "cpu_usage_percent", vm.cpu_usage_percent)
+                    network = effective_metric(aggregates, vm.pk, "network_usage_kbps", vm.network_usage_kbps)
+                    disk = effective_metric(aggregates, vm.pk, "disk_usage_iops", vm.disk_usage_iops)
                     points = 0.0
-                    if vm.cpu_usage_percent is not None and vm.cpu_usage_percent < CPU_IDLE_PERCENT:
+                    if cpu is not None and cpu < CPU_IDLE_PERCENT:
                         points += 0.4
-                    if vm.network_usage_kbps is not None and vm.network_usage_kbps < NETWORK_IDLE_KBPS:
+                    if network is not None and network < NETWORK_IDLE_KBPS:
                         points += 0.3
-                    if vm.disk_usage_iops is not None and vm.disk_usage_iops < DISK_IDLE_IOPS:
+                    if disk is not None and disk < DISK_IDLE_IOPS:
                         points += 0.2
                     new_score = min(points, 1.0)
                     new_status = (
@@ -73,13 +93,136 @@ def compute_idle_scores(queryset=None):
     return updated
 
 
-def run_detection(data_source_id=None):
+def _rule_points(field: str, threshold: float, points: float):
+    """points when the field's window/snapshot value is set and below threshold, else 0.0 (Rule B term)."""
+    return Case(
+        When(LessThan(window_expression(field), threshold), then=Value(points)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def score_expressions(now=None):
+    """
+    (idle_score, status) expressions equivalent to compute_idle_scores.
+    Day-based age checks become timestamp cutoffs: (now - t).days >= N <=> t <= now - N days.
+    Rule B reads the stored window columns (see metrics.store_window_metrics).
+    """
+    now = now or timezone.now()
+    missing_cutoff = now - timedelta(days=MISSING_DAYS_THRESHOLD)
+    poweredoff_cutoff = now - timedelta(days=POWEREDOFF_IDLE_DAYS + 1)
+    power = Lower(Trim("power_state"))
+    is_missing = Q(last_seen__isnull=True) | Q(last_seen__lte=missing_cutoff)
+    is_zombie = Q(power_lower="poweredoff", last_boot_time__lte=poweredoff_cutoff)
+    rule_b = (
+        _rule_points("cpu_usage_percent", CPU_IDLE_PERCENT, 0.4)
+        + _rule_points("network_usage_kbps", NETWORK_IDLE_KBPS, 0.3)
+        + _rule_points("disk_usage_iops", DISK_IDLE_IOPS, 0.2)
+    )
+    score = Case(
+        When(is_missing, then=Value(1.0)),
+        When(is_zombie, then=Value(1.0)),
+        When(power_lower="poweredon", then=rule_b),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    status = Case(
+        When(is_missing, then=Value(VirtualMachine.VMStatus.MISSING)),
+        When(is_zombie, then=Value(VirtualMachine.VMStatus.IDLE)),
+        When(
+            Q(power_lower="poweredon") & GreaterThanOrEqual(rule_b, 0.5),
+            then=Value(VirtualMachine.VMStatus.IDLE),
+        ),
+        default=Value(VirtualMachine.VMStatus.ACTIVE),
+    )
+    return power, score, status
+
+
+def compute_idle_scores_sql(queryset=None, now=None, store_window=True):
+    """
+    Same rules as compute_idle_scores, evaluated by the database: a single UPDATE
+    that only touches rows whose idle_score or status changes. Under a Rule B window
+    the window aggregates are stored first (one more UPDATE, each aggregate computed
+    once per row); store_window=False skips that for rows that can only age into missing or
+    Rule A. Returns rows updated.
+    """
+    if queryset is None:
+        queryset = VirtualMachine.objects.all()
+    now = now or timezone.now()
+    if store_window:
+        store_window_metrics(queryset, now)
+    power, score, status = score_expressions(now)
+    changed = (
+        queryset.annotate(power_lower=power, new_score=score, new_status=status)
+        .filter(Q(idle_score__isnull=True) | ~Q(idle_score=F("new_score")) | ~Q(status=F("new_status")))
+        .values("pk")
+    )
+    return (
+        VirtualMachine.objects.filter(pk__in=changed)
+        .annotate(power_lower=power)
+        .update(idle_score=score, status=status)
+    )
+
+
+def _score_queryset(queryset, now=None) -> int:
+    """Score queryset with the configured engine; return rows updated."""
+    if SCORING_ENGINE == "numpy":
+        from .scoring import compute_idle_scores_numpy
+        return compute_idle_scores_numpy(queryset, now=now)
+    if SCORING_ENGINE == "python":
+        return compute_idle_scores(queryset)
+    return compute_idle_scores_sql(queryset, now=now)
+
+
+def apply_age_transitions(data_source_id=None, now=None) -> int:
+    """
+    Time-driven transitions only: VMs whose last_seen crossed MISSING_DAYS_THRESHOLD
+    and powered-off VMs whose last_boot_time crossed POWEREDOFF_IDLE_DAYS. Both end
+    at idle_score 1.0 whatever the engine, so this is one indexed UPDATE of the rows
+    not already in that state. Returns rows updated.
+    """
+    now = now or timezone.now()
+    qs = VirtualMachine.objects.all()
+    if data_source_id is not None:
+        qs = qs.filter(data_source_id=data_source_id)
+    candidates = qs.annotate(power_lower=Lower(Trim("power_state"))).filter(
+        Q(last_seen__isnull=True)
+        | Q(last_seen__lte=now - timedelta(days=MISSING_DAYS_THRESHOLD))
+        | Q(power_lower="poweredoff", last_boot_time__lte=now - timedelta(days=POWEREDOFF_IDLE_DAYS + 1))
+    )
+    # Candidates end missing or Rule A idle: their Rule B window is never read
+    return compute_idle_scores_sql(candidates, now=now, store_window=False)
+
+
+def run_detection(data_source_id=None, vm_ids=None, age_transitions=True):
     """
     Run resource-based idle detection on all VMs or only for a given DataSource.
+    With vm_ids (rows created/changed by the current scan) only those VMs are
+    re-scored, plus apply_age_transitions for rows that aged into missing/Rule A
+    (skipped with age_transitions=False, e.g. when part of the source was not collected).
+    With a Rule B window the whole source is re-scored instead: every scan adds a sample
+    and moves the window, so aggregates change for rows whose columns did not.
     Returns number of VMs updated.
     """
+    now = timezone.now()
+    if vm_ids is not None and data_source_id is not None and window_enabled():
+        queryset = VirtualMachine.objects.filter(data_source_id=data_source_id)
+        if not age_transitions:
+            # Rows this scan may not have collected must not age into missing
+            queryset = queryset.filter(last_seen__gt=now - timedelta(days=MISSING_DAYS_THRESHOLD))
+        return _score_queryset(queryset, now)
+    if vm_ids is not None:
+        vm_ids = list(vm_ids)
+        updated = apply_age_transitions(data_source_id, now=now) if age_transitions else 0
+        for i in range(0, len(vm_ids), DIRTY_CHUNK_SIZE):
+            updated += _score_queryset(VirtualMachine.objects.filter(pk__in=vm_ids[i:i + DIRTY_CHUNK_SIZE]), now)
+        return updated
     if data_source_id is not None:
-        qs = VirtualMachine.objects.filter(data_source_id=data_source_id)
+        source_ids = [data_source_id]
     else:
-        qs = VirtualMachine.objects.all()
-    return compute_idle_scores(qs)
+        source_ids = list(DataSource.objects.values_list("pk", flat=True))
+    # One UPDATE per source keeps each statement's lock footprint to that source's rows
+    return sum(
+        _score_queryset(VirtualMachine.objects.filter(data_source_id=ds_id), now)
+        for ds_id in source_ids
+    )
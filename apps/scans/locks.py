@@ -0,0 +1,156 @@
+# Single-flight scan lock per DataSource: a lease in the default cache (Redis in production).
+# cache.add takes the lease atomically; the holder renews it with a heartbeat thread and a crashed
+# worker's lease simply expires after SCAN_LOCK_TTL seconds. While the scan's tasks wait in the
+# Celery queue (before a chord header task starts, before its callback runs) nothing renews the
+# lease, so it is set to SCAN_LOCK_QUEUE_TTL for those hand-overs.
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+# Lease lifetime without renewal (seconds)
+SCAN_LOCK_TTL = getattr(settings, "SCAN_LOCK_TTL", 300)
+# Heartbeat renews the lease this often (seconds)
+SCAN_LOCK_HEARTBEAT = max(SCAN_LOCK_TTL / 3, 1)
+# Lease lifetime while queued between tasks; bounds how long a lost task blocks the source (seconds)
+SCAN_LOCK_QUEUE_TTL = getattr(settings, "SCAN_LOCK_QUEUE_TTL", 3600)
+# How long a trigger waits for a running scan before joining it instead (seconds; 0 = join at once)
+SCAN_LOCK_WAIT = getattr(settings, "SCAN_LOCK_WAIT", 0)
+# Poll interval while waiting
+SCAN_LOCK_POLL = 0.5
+
+# Delete KEYS[1] only if it still holds ARGV[1] (the holder's serialized lease value)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Lease whose heartbeat is running in this context (checked by persistence, see check_lease)
+_active: contextvars.ContextVar = contextvars.ContextVar("scan_lease", default=None)
+
+
+class LeaseLost(Exception):
+    """The scan lease expired or was taken over while the scan was still writing."""
+
+
+def _lock_key(data_source_id: int) -> str:
+    return f"idlehunter:scanlock:ds{data_source_id}"
+
+
+def current_holder(data_source_id: int) -> dict | None:
+    """Lease value of the running scan ({"token", "scan_run_id", "acquired_at"}) or None."""
+    return cache.get(_lock_key(data_source_id))
+
+
+class ScanLease:
+    """A held scan lock; serializable with to_dict/from_dict to hand over between Celery tasks."""
+
+    def __init__(self, data_source_id: int, token: str, scan_run_id=None, acquired_at=None, waited=0.0):
+        self.data_source_id = data_source_id
+        self.token = token
+        self.scan_run_id = scan_run_id
+        self.acquired_at = acquired_at if acquired_at is not None else time.time()
+        self.waited = waited
+        self.lost = False
+
+    @property
+    def key(self) -> str:
+        return _lock_key(self.data_source_id)
+
+    def _value(self) -> dict:
+        return {"token": self.token, "scan_run_id": self.scan_run_id, "acquired_at": self.acquired_at}
+
+    def to_dict(self) -> dict:
+        return {"data_source_id": self.data_source_id, **self._value()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ScanLease":
+        return cls(data["data_source_id"], data["token"], data.get("scan_run_id"), data.get("acquired_at"))
+
+    def held(self) -> bool:
+        value = cache.get(self.key)
+        return bool(value) and value.get("token") == self.token
+
+    def attach(self, scan_run_id: int, ttl: float | None = None) -> None:
+        """Record the ScanRun this lease belongs to, so duplicate triggers can return it."""
+        self.scan_run_id = scan_run_id
+        if self.held():
+            cache.set(self.key, self._value(), ttl or SCAN_LOCK_TTL)
+
+    def renew(self, ttl: float | None = None) -> bool:
+        """Extend the lease by ttl (SCAN_LOCK_TTL); False (and lost=True) if it expired or was taken over."""
+        if self.held() and cache.touch(self.key, ttl or SCAN_LOCK_TTL):
+            return True
+        self.lost = True
+        return False
+
+    def hand_over(self) -> bool:
+        """Keep the lease for SCAN_LOCK_QUEUE_TTL while the next task of the scan is queued."""
+        return self.renew(SCAN_LOCK_QUEUE_TTL)
+
+    def release(self) -> float:
+        """Drop the lease if still ours (compare-and-delete on its value); return seconds it was held."""
+        backend = caches["default"]
+        if isinstance(backend, RedisCache):
+            key = backend.make_key(self.key)
+            client = backend._cache.get_client(key, write=True)
+            client.eval(_RELEASE_SCRIPT, 1, key, backend._cache._serializer.dumps(self._value()))
+        elif self.held():
+            # Other backends have no atomic compare-and-delete (local memory, tests)
+            cache.delete(self.key)
+        return time.time() - self.acquired_at
+
+    @contextmanager
+    def heartbeat(self):
+        """Renew the lease every SCAN_LOCK_HEARTBEAT seconds while the block runs."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(SCAN_LOCK_HEARTBEAT):
+                if not self.renew():
+                    return
+
+        thread = threading.Thread(target=beat, name=f"scanlock-ds{self.data_source_id}", daemon=True)
+        thread.start()
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            stop.set()
+            thread.join(timeout=5)
+
+
+def check_lease() -> None:
+    """Raise LeaseLost if the lease of the scan running in this context is no longer held."""
+    lease = _active.get()
+    if lease is not None and (lease.lost or not lease.held()):
+        lease.lost = True
+        raise LeaseLost(f"Scan lock of data source {lease.data_source_id} was lost")
+
+
+def acquire_scan_lock(
+    data_source_id: int, scan_run_id=None, wait: float | None = None, ttl: float | None = None
+) -> ScanLease | None:
+    """
+    Take the scan lease for a DataSource for ttl (SCAN_LOCK_TTL) seconds, waiting up to wait
+    seconds; None if another scan holds it.
+    """
+    wait = SCAN_LOCK_WAIT if wait is None else wait
+    token = uuid.uuid4().hex
+    started = time.monotonic()
+    while True:
+        acquired_at = time.time()
+        value = {"token": token, "scan_run_id": scan_run_id, "acquired_at": acquired_at}
+        if cache.add(_lock_key(data_source_id), value, ttl or SCAN_LOCK_TTL):
+            return ScanLease(data_source_id, token, scan_run_id, acquired_at, waited=time.monotonic() - started)
+        if time.monotonic() - started >= wait:
+            return None
+        time.sleep(SCAN_LOCK_POLL)
@@ -0,0 +1,126 @@
+# Benchmark the inventory cache codec: previous JSON list of item dicts vs cache_codec (zlib columnar)
+# Usage: python manage.py benchmark_cache_codec [--vms 25000] [--chunk-size 1000]
+# Synthetic VMs carry an Aria-like raw resource as metadata (the bulk of a real cache value). No cache
+# server is used: only encoded sizes and encode/decode times are measured.
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.integrations.base import VMInfo
+from apps.scans import cache_codec
+
+
+def synthetic_vms(count: int) -> list:
+    boot = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    vms = []
+    for i in range(count):
+        uuid = f"5003{i:04x}-aaaa-bbbb-cccc-{i:012x}"
+        resource = {
+            "identifier": uuid,
+            "resourceKey": {
+                "name": f"app-{i % 300:03d}-vm-{i:06d}",
+                "adapterKindKey": "VMWARE",
+                "resourceKindKey": "VirtualMachine",
+                "resourceIdentifiers": [
+                    {
+                        "identifierType": {"name": "VMEntityObjectID", "dataType": "STRING", "isPartOfUniqueness": True},
+                        "value": f"vm-{1000 + i}",
+                    },
+                    {
+                        "identifierType": {"name": "VMEntityVCID", "dataType": "STRING", "isPartOfUniqueness": True},
+                        "value": "6b1d6d4e-1f0a-4c9a-9a57-3c2a0d7e9f11",
+                    },
+                ],
+            },
+            "resourceStatusStates": {"powerState": "poweredOn" if i % 5 else "poweredOff"},
+            "resourceHealth": "GREEN",
+            "resourceHealthValue": 100.0,
+            "dtEnabled": True,
+            "badges": [{"type": t, "color": "GREEN", "score": 100.0} for t in ("HEALTH", "RISK", "EFFICIENCY")],
+        }
+        vms.append(VMInfo(
+            name=resource["resourceKey"]["name"],
+            uuid=uuid,
+            power_state=resource["resourceStatusStates"]["powerState"],
+            metadata=resource,
+            cpu_usage_mhz=float(i % 4000),
+            cpu_usage_percent=round((i * 7 % 1000) / 10.0, 1),
+            memory_usage_mb=float(1024 + i % 8192),
+            network_usage_kbps=float(i * 3 % 700),
+            disk_usage_iops=float(i * 11 % 400),
+            uptime_days=float(i % 365),
+            last_boot_time=boot + timedelta(minutes=i),
+        ))
+    return vms
+
+
+def legacy_items(vms: list) -> list:
+    """The previous cache representation: one dict per VM, later passed to json.dumps."""
+    out = []
+    for v in vms:
+        item = {
+            "name": v.name,
+            "uuid": v.uuid,
+            "power_state": v.power_state,
+            "metadata": v.metadata,
+            "cpu_usage_mhz": v.cpu_usage_mhz,
+            "cpu_usage_percent": v.cpu_usage_percent,
+            "memory_usage_mb": v.memory_usage_mb,
+            "network_usage_kbps": v.network_usage_kbps,
+            "disk_usage_iops": v.disk_usage_iops,
+            "uptime_days": v.uptime_days,
+            "last_boot_time": v.last_boot_time.isoformat() if v.last_boot_time else None,
+        }
+        out.append(item)
+    return out
+
+
+def _legacy_decode(value: str) -> list:
+    vms = []
+    for d in json.loads(value):
+        lb = d.get("last_boot_time")
+        vms.append(VMInfo(**{**d, "last_boot_time": datetime.fromisoformat(lb) if lb else None}))
+    return vms
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+class Command(BaseCommand):
+    help = "Compare size and encode/decode time of the previous JSON cache values and the binary cache codec."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vms", type=int, default=25000, help="Synthetic inventory size.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="VMs per cache chunk for the codec.")
+
+    def handle(self, *args, **options):
+        vms = synthetic_vms(options["vms"])
+        size = options["chunk_size"]
+        chunks = [vms[i:i + size] for i in range(0, len(vms), size)]
+
+        legacy, legacy_enc = _timed(lambda: json.dumps(legacy_items(vms)))
+        decoded, legacy_dec = _timed(_legacy_decode, legacy)
+        legacy_bytes = len(legacy.encode("utf-8"))
+
+        encoded, codec_enc = _timed(lambda: [cache_codec.encode_vms(chunk) for chunk in chunks])
+        roundtrip, codec_dec = _timed(lambda: [vm for value in encoded for vm in cache_codec.decode_vms(value)])
+        codec_bytes = sum(len(value) for value in encoded)
+        if roundtrip != vms or decoded != vms:
+            raise CommandError("Round trip changed the inventory.")
+
+        self.stdout.write(f"{len(vms)} VMs, codec chunks of {size} ({len(chunks)} keys + manifest)")
+        self.stdout.write(
+            f"{'json (one value)':<22} {legacy_bytes / 2 ** 20:8.2f} MiB"
+            f"  encode {legacy_enc:7.3f}s  decode {legacy_dec:7.3f}s"
+        )
+        self.stdout.write(
+            f"{'codec (chunked)':<22} {codec_bytes / 2 ** 20:8.2f} MiB"
+            f"  encode {codec_enc:7.3f}s  decode {codec_dec:7.3f}s"
+            f"  largest chunk {max(len(v) for v in encoded) / 2 ** 10:.0f} KiB"
+            f"  ({legacy_bytes / codec_bytes:.1f}x smaller)"
+        )
@@ -0,0 +1,82 @@
+# Benchmark vCenter VM collection: SOAP round trips per VM, per-object walk vs bulk PropertyCollector
+# Usage: python manage.py benchmark_vcenter --data-source <id> [--limit 500]
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.integrations.vcenter import (
+    PYVMOMI_AVAILABLE,
+    VCenterClient,
+    connect_vcenter,
+    count_round_trips,
+)
+from apps.scans.models import DataSource
+
+
+def _per_object_walk(si, limit: int) -> int:
+    """Attribute access pattern of the previous get_vms (one round trip per attribute read)."""
+    from pyVmomi import vim
+
+    content = si.RetrieveContent()
+    view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+    count = 0
+    try:
+        for vm in view.view[:limit] if limit else view.view:
+            _ = vm.name
+            if vm.summary and vm.summary.config:
+                _ = (vm.summary.config.uuid, vm.summary.config.numCpu, vm.summary.config.memorySizeMB)
+            if vm.runtime:
+                _ = (vm.runtime.powerState, vm.runtime.bootTime)
+            if vm.summary and vm.summary.quickStats:
+                qs = vm.summary.quickStats
+                _ = (qs.overallCpuUsage, qs.guestMemoryUsage)
+            count += 1
+    finally:
+        view.Destroy()
+    return count
+
+
+class Command(BaseCommand):
+    help = "Compare SOAP round trips per VM: per-object walk vs bulk PropertyCollector retrieval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data-source", type=int, required=True, help="vCenter DataSource id.")
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=500,
+            help="Max VMs for the per-object walk (0 = all; slow on large inventories).",
+        )
+
+    def handle(self, *args, **options):
+        if not PYVMOMI_AVAILABLE:
+            raise CommandError("pyvmomi is not installed.")
+        try:
+            ds = DataSource.objects.get(pk=options["data_source"], source_type=DataSource.SourceType.VCENTER)
+        except DataSource.DoesNotExist:
+            raise CommandError("vCenter DataSource not found.")
+        config = dict(ds.config or {})
+        si = connect_vcenter(config)
+        if si is None:
+            raise CommandError("vCenter host/user/password not configured.")
+        try:
+            with count_round_trips(si) as before:
+                t0 = time.perf_counter()
+                walked = _per_object_walk(si, options["limit"])
+                before_s = time.perf_counter() - t0
+            with count_round_trips(si) as after:
+                t0 = time.perf_counter()
+                collected = len(VCenterClient().collect_vms(si, config))
+                after_s = time.perf_counter() - t0
+        finally:
+            from pyVim.connect import Disconnect
+            Disconnect(si)
+
+        self._report("per-object walk", walked, before.calls, before_s)
+        self._report("bulk PropertyCollector", collected, after.calls, after_s)
+
+    def _report(self, label, vms, calls, seconds):
+        per_vm = calls / vms if vms else 0.0
+        self.stdout.write(
+            f"{label:<24} {vms:>7} VMs  {calls:>8} round trips  {per_vm:8.3f} per VM  {seconds:8.2f}s"
+        )
@@ -7,6 +7,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from apps.scans.models import DataSource, ScanRun, VirtualMachine
+from apps.scans.summary import refresh_dashboard_summary
 
 
 DEMO_PREFIX = "Demo "
@@ -34,6 +35,7 @@ class Command(BaseCommand):
         self._load_datasources()
         self._load_vms()
         self._load_scan_runs()
+        refresh_dashboard_summary()
         self.stdout.write(self.style.SUCCESS("Demo data loaded successfully."))
 
     def _clear_demo_data(self):
@@ -138,6 +140,9 @@ class Command(BaseCommand):
                     "memory_usage_mb": (mem_mb * 0.4) if cpu_pct is not None else None,
                     "network_usage_kbps": net_kbps,
                     "disk_usage_iops": disk_iops,
+                    "num_cpu": cpu,
+                    "memory_size_mb": mem_mb,
+                    "provisioned_disk_gb": 40.0 * cpu,
                     "metadata": {"numCpu": cpu, "memorySizeMB": mem_mb, "power_state": power},
                 }
                 _, was_created = VirtualMachine.objects.update_or_create(
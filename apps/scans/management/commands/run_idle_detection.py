@@ -4,6 +4,7 @@
 from django.core.management.base import BaseCommand
 
 from apps.scans.detection import run_detection
+from apps.scans.summary import refresh_dashboard_summary
 
 
 class Command(BaseCommand):
@@ -11,4 +12,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         updated = run_detection()
+        refresh_dashboard_summary()
         self.stdout.write(self.style.SUCCESS(f"Idle detection done. Updated {updated} VM(s)."))
@@ -0,0 +1,287 @@
+# Metric history: hourly VMMetricSample rows written by scans, and windowed Rule B aggregates.
+# The raw samples are the hourly tier; rollups.py aggregates them into daily buckets. Window
+# queries read the daily rollups when the window spans WINDOW_MIN_BUCKETS days, plus raw
+# samples after the daily watermark. Set-based detection stores each VM's window aggregates
+# in its window_* columns first (store_window_metrics).
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Aggregate,
+    Case,
+    Count,
+    F,
+    FloatField,
+    Max,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Lower, Trim
+from django.utils import timezone
+
+from .models import MetricRollupWatermark, VirtualMachine, VMMetricRollup, VMMetricSample
+
+# Rule B looks at this many days of history (0 = latest snapshot only)
+RULE_B_WINDOW_DAYS = getattr(settings, "RULE_B_WINDOW_DAYS", 7)
+# "avg" or "p95" (p95 needs PostgreSQL; other databases fall back to avg)
+RULE_B_AGGREGATE = getattr(settings, "RULE_B_AGGREGATE", "avg")
+# Columns sampled per VM and aggregated for Rule B
+METRIC_FIELDS = ("cpu_usage_percent", "network_usage_kbps", "disk_usage_iops")
+# VirtualMachine column holding the stored window aggregate of each metric
+WINDOW_FIELDS = {field: f"window_{field}" for field in METRIC_FIELDS}
+# Sample rows per INSERT
+SAMPLE_BATCH_SIZE = 1000
+# A rollup resolution is used for a window only if the window spans this many of its buckets
+WINDOW_MIN_BUCKETS = 24
+BUCKET_SIZES = {VMMetricRollup.Resolution.DAY: timedelta(days=1)}
+
+
+class Percentile95(Aggregate):
+    """PostgreSQL percentile_cont(0.95) ordered-set aggregate."""
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(0.95) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+
+def sample_time(now=None):
+    """Scan time truncated to the hour (sample resolution)."""
+    return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_start(dt, resolution: str):
+    """Start of the UTC rollup bucket containing dt."""
+    dt = dt.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if resolution == VMMetricRollup.Resolution.DAY else dt
+
+
+def record_samples(rows, now=None) -> int:
+    """
+    Insert one sample per (vm_pk, cpu, network, disk) row for the current hour; rows with
+    no metric at all are skipped and an existing sample for that hour is kept. A sample in a
+    bucket that is already rolled up (scan started before the rollup ran) moves that
+    resolution's watermark back to the bucket, so the next rollup aggregates it again.
+    Returns rows sent.
+    """
+    sampled_at = sample_time(now)
+    samples = [
+        VMMetricSample(
+            vm_id=vm_pk,
+            sampled_at=sampled_at,
+            cpu_usage_percent=cpu,
+            network_usage_kbps=network,
+            disk_usage_iops=disk,
+        )
+        for vm_pk, cpu, network, disk in rows
+        if cpu is not None or network is not None or disk is not None
+    ]
+    if samples:
+        VMMetricSample.objects.bulk_create(samples, batch_size=SAMPLE_BATCH_SIZE, ignore_conflicts=True)
+        for resolution in BUCKET_SIZES:
+            bucket = bucket_start(sampled_at, resolution)
+            MetricRollupWatermark.objects.filter(resolution=resolution, rolled_up_to__gt=bucket).update(
+                rolled_up_to=bucket
+            )
+    return len(samples)
+
+
+def window_enabled() -> bool:
+    return RULE_B_WINDOW_DAYS > 0
+
+
+def window_start(now=None):
+    return (now or timezone.now()) - timedelta(days=RULE_B_WINDOW_DAYS)
+
+
+def get_watermarks() -> dict:
+    """{resolution: rolled_up_to} for resolutions that have been rolled up at least once."""
+    return dict(MetricRollupWatermark.objects.values_list("resolution", "rolled_up_to"))
+
+
+def resolution_for(since, now=None):
+    """
+    (resolution, watermark) of the coarsest rollup covering [since, now) with at least
+    WINDOW_MIN_BUCKETS buckets, or (None, None) to read raw samples only.
+    """
+    span = (now or timezone.now()) - since
+    watermarks = get_watermarks()
+    for resolution, size in BUCKET_SIZES.items():
+        mark = watermarks.get(resolution)
+        if span >= size * WINDOW_MIN_BUCKETS and mark is not None and mark > since:
+            return resolution, mark
+    return None, None
+
+
+def _use_p95() -> bool:
+    return RULE_B_AGGREGATE == "p95" and connection.vendor == "postgresql"
+
+
+def _segments(now):
+    """
+    [(queryset, aggregates)] for the window: rollup buckets before the watermark, raw samples
+    after it. Each aggregates dict yields the field's weighted sum and weight (avg) or its
+    p95 (upper bound across rollup buckets: the max of their p95s).
+    """
+    since = window_start(now)
+    resolution, mark = resolution_for(since, now)
+    segments = []
+    if resolution is not None:
+        rollups = VMMetricRollup.objects.filter(resolution=resolution, bucket__gte=since, bucket__lt=mark)
+        if _use_p95():
+            aggregates = {field: {"p95": Max(f"{field}_p95")} for field in METRIC_FIELDS}
+        else:
+            aggregates = {
+                field: {
+                    "sum": Sum(F(f"{field}_avg") * F("sample_count"), output_field=FloatField()),
+                    "weight": Sum(
+                        Case(When(**{f"{field}_avg__isnull": False}, then=F("sample_count")), default=Value(0)),
+                        output_field=FloatField(),
+                    ),
+                }
+                for field in METRIC_FIELDS
+            }
+        segments.append((rollups, aggregates))
+        since = mark
+    samples = VMMetricSample.objects.filter(sampled_at__gte=since)
+    if _use_p95():
+        aggregates = {field: {"p95": Percentile95(field)} for field in METRIC_FIELDS}
+    else:
+        aggregates = {
+            field: {
+                "sum": Sum(field, output_field=FloatField()),
+                "weight": Count(field, output_field=FloatField()),
+            }
+            for field in METRIC_FIELDS
+        }
+    segments.append((samples, aggregates))
+    return segments
+
+
+def _grouped_segments(now, **vm_filter) -> list:
+    """One GROUP BY vm_id queryset per segment, annotated {sum,weight,p95}_{field} as in _segments."""
+    return [
+        queryset.filter(**vm_filter)
+        .values("vm_id")
+        .annotate(**{
+            f"{name}_{field}": aggregate
+            for field, named in aggregates.items()
+            for name, aggregate in named.items()
+        })
+        .order_by()
+        for queryset, aggregates in _segments(now)
+    ]
+
+
+def window_aggregates(now=None, **vm_filter) -> dict:
+    """
+    {vm_pk: {field: aggregate}} over the Rule B window: one grouped query per segment
+    (rollups, raw tail); vm_filter narrows the VMs (e.g. vm__data_source_id=..., vm_id__in=...).
+    """
+    if not window_enabled():
+        return {}
+    parts = {}
+    for rows in _grouped_segments(now or timezone.now(), **vm_filter):
+        for row in rows:
+            vm_parts = parts.setdefault(row.pop("vm_id"), {})
+            for key, value in row.items():
+                if value is not None:
+                    vm_parts.setdefault(key, []).append(value)
+    result = {}
+    for vm_pk, vm_parts in parts.items():
+        values = {}
+        for field in METRIC_FIELDS:
+            if f"p95_{field}" in vm_parts:
+                values[field] = max(vm_parts[f"p95_{field}"])
+            weight = sum(vm_parts.get(f"weight_{field}", []))
+            if weight:
+                values[field] = sum(vm_parts[f"sum_{field}"]) / weight
+        result[vm_pk] = values
+    return result
+
+
+def effective_metric(aggregates: dict, vm_pk: int, field: str, snapshot):
+    """Windowed value when the VM has history for field, else the snapshot value."""
+    value = aggregates.get(vm_pk, {}).get(field)
+    return snapshot if value is None else value
+
+
+def _window_table_sql(vm_ids, now):
+    """
+    (sql, params) of a derived table with one row per VM of vm_ids (a values("pk") queryset):
+    vm_pk plus one WINDOW_FIELDS column per metric (NULL without history in the window).
+    The segment GROUP BYs are combined by a single outer GROUP BY on vm_id.
+    """
+    qn = connection.ops.quote_name
+    ids_sql, params = vm_ids.query.sql_with_params()
+    params = list(params)
+    parts = []
+    for i, grouped in enumerate(_grouped_segments(now, vm__in=vm_ids)):
+        sql, part_params = grouped.query.sql_with_params()
+        parts.append(f"SELECT * FROM ({sql}) AS {qn(f'segment_{i}')}")
+        params.extend(part_params)
+    columns = []
+    for field, column in WINDOW_FIELDS.items():
+        if _use_p95():
+            # Upper bound across segments, as in window_aggregates
+            value = f"MAX(parts.{qn(f'p95_{field}')})"
+        else:
+            value = f"SUM(parts.{qn(f'sum_{field}')}) / NULLIF(SUM(parts.{qn(f'weight_{field}')}), 0)"
+        columns.append(f"{value} AS {qn(column)}")
+    sql = (
+        f"SELECT ids.{qn('pk')} AS vm_pk, {', '.join(columns)} FROM ({ids_sql}) AS ids"
+        f" LEFT JOIN ({' UNION ALL '.join(parts)}) AS parts ON parts.{qn('vm_id')} = ids.{qn('pk')}"
+        f" GROUP BY ids.{qn('pk')}"
+    )
+    return sql, params
+
+
+def store_window_metrics(queryset, now=None) -> int:
+    """
+    Write the window aggregate of every metric into its WINDOW_FIELDS column for the powered-on
+    VMs of queryset (the only ones Rule B scores). The aggregates come from one derived table
+    (see _window_table_sql) joined on the VM id by a single UPDATE ... FROM, so set-based scoring
+    reads plain columns instead of per-row history subqueries. Returns rows updated.
+    """
+    if not window_enabled():
+        return 0
+    now = now or timezone.now()
+    powered_on = queryset.annotate(power_lower=Lower(Trim("power_state"))).filter(power_lower="poweredon")
+    window_sql, params = _window_table_sql(powered_on.values("pk").order_by(), now)
+    qn = connection.ops.quote_name
+    table = qn(VirtualMachine._meta.db_table)
+    assignments = ", ".join(f"{qn(column)} = w.{qn(column)}" for column in WINDOW_FIELDS.values())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {assignments} FROM ({window_sql}) AS w WHERE {table}.{qn('id')} = w.vm_pk",
+            params,
+        )
+        return cursor.rowcount
+
+
+def window_expression(field: str):
+    """
+    VirtualMachine-level Rule B value: the stored window aggregate (see store_window_metrics),
+    falling back to the snapshot column.
+    """
+    if not window_enabled():
+        return F(field)
+    return Coalesce(F(WINDOW_FIELDS[field]), F(field))
+
+
+def metric_series(vm_pk: int, field: str, since, now=None):
+    """
+    (resolution, [(timestamp, value)]) for charts: bucket averages at the resolution picked by
+    resolution_for, then raw samples after its watermark; resolution is "raw" without rollups.
+    """
+    resolution, mark = resolution_for(since, now)
+    points = []
+    if resolution is not None:
+        points += VMMetricRollup.objects.filter(
+            vm_id=vm_pk, resolution=resolution, bucket__gte=since, bucket__lt=mark
+        ).order_by("bucket").values_list("bucket", f"{field}_avg")
+        since = mark
+    points += VMMetricSample.objects.filter(vm_id=vm_pk, sampled_at__gte=since).order_by(
+        "sampled_at"
+    ).values_list("sampled_at", field)
+    return resolution or "raw", [(t, value) for t, value in points if value is not None]
@@ -0,0 +1,17 @@
+# Content hash of ingested VM attributes (lets scans skip unchanged rows)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0005_vm_metrics_and_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
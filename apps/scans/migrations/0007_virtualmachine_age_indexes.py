@@ -0,0 +1,20 @@
+# Indexes for the age-driven detection pass (last_seen / last_boot_time cutoffs per source)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0006_virtualmachine_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="virtualmachine",
+            index=models.Index(fields=["data_source", "last_seen"], name="scans_vm_ds_last_seen_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="virtualmachine",
+            index=models.Index(fields=["data_source", "last_boot_time"], name="scans_vm_ds_last_boot_idx"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Metric history: one narrow row per VM per hour for windowed Rule B aggregates
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0007_virtualmachine_age_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VMMetricSample",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("sampled_at", models.DateTimeField()),
+                ("cpu_usage_percent", models.FloatField(blank=True, null=True)),
+                ("network_usage_kbps", models.FloatField(blank=True, null=True)),
+                ("disk_usage_iops", models.FloatField(blank=True, null=True)),
+                (
+                    "vm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="metric_samples",
+                        to="scans.virtualmachine",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "VM metric sample",
+                "verbose_name_plural": "VM metric samples",
+                "constraints": [
+                    models.UniqueConstraint(fields=("vm", "sampled_at"), name="scans_vmmetricsample_vm_sampled_at")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Metric history rollups (daily aggregates of the hourly samples) and their per-resolution watermark
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0008_vmmetricsample"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MetricRollupWatermark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("resolution", models.CharField(choices=[("day", "Day")], max_length=8, unique=True)),
+                ("rolled_up_to", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Metric rollup watermark",
+                "verbose_name_plural": "Metric rollup watermarks",
+            },
+        ),
+        migrations.CreateModel(
+            name="VMMetricRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("resolution", models.CharField(choices=[("day", "Day")], max_length=8)),
+                ("bucket", models.DateTimeField()),
+                ("sample_count", models.PositiveIntegerField(default=0)),
+                ("cpu_usage_percent_min", models.FloatField(blank=True, null=True)),
+                ("cpu_usage_percent_avg", models.FloatField(blank=True, null=True)),
+                ("cpu_usage_percent_max", models.FloatField(blank=True, null=True)),
+                ("cpu_usage_percent_p95", models.FloatField(blank=True, null=True)),
+                ("network_usage_kbps_min", models.FloatField(blank=True, null=True)),
+                ("network_usage_kbps_avg", models.FloatField(blank=True, null=True)),
+                ("network_usage_kbps_max", models.FloatField(blank=True, null=True)),
+                ("network_usage_kbps_p95", models.FloatField(blank=True, null=True)),
+                ("disk_usage_iops_min", models.FloatField(blank=True, null=True)),
+                ("disk_usage_iops_avg", models.FloatField(blank=True, null=True)),
+                ("disk_usage_iops_max", models.FloatField(blank=True, null=True)),
+                ("disk_usage_iops_p95", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "VM metric rollup",
+                "verbose_name_plural": "VM metric rollups",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="vmmetricsample",
+            index=models.Index(fields=["sampled_at"], name="scans_sample_sampled_at_idx"),
+        ),
+        migrations.AddField(
+            model_name="vmmetricrollup",
+            name="vm",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="metric_rollups", to="scans.virtualmachine"),
+        ),
+        migrations.AddIndex(
+            model_name="vmmetricrollup",
+            index=models.Index(fields=["resolution", "bucket"], name="scans_rollup_res_bucket_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="vmmetricrollup",
+            constraint=models.UniqueConstraint(fields=("vm", "resolution", "bucket"), name="scans_vmmetricrollup_vm_resolution_bucket"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Add Celery Beat schedule: hourly metric history rollup and retention at :15 UTC
+from django.db import migrations
+
+TASK_NAME = "IdleHunter metric history rollup"
+
+
+def add_rollup_schedule(apps, schema_editor):
+    CrontabSchedule = apps.get_model("django_celery_beat", "CrontabSchedule")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    schedule, _ = CrontabSchedule.objects.get_or_create(
+        minute="15",
+        hour="*",
+        day_of_week="*",
+        day_of_month="*",
+        month_of_year="*",
+        timezone="UTC",
+    )
+    PeriodicTask.objects.get_or_create(
+        name=TASK_NAME,
+        defaults={
+            "task": "apps.scans.tasks.rollup_metric_history",
+            "crontab": schedule,
+            "enabled": True,
+            "kwargs": "{}",
+        },
+    )
+
+
+def remove_rollup_schedule(apps, schema_editor):
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    PeriodicTask.objects.filter(name=TASK_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0009_metric_rollups"),
+        ("django_celery_beat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_rollup_schedule, remove_rollup_schedule),
+    ]
@@ -0,0 +1,22 @@
+# Scan lock timings on ScanRun (wait for / hold of the per-DataSource lease)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0010_add_metric_rollup_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanrun",
+            name="lock_wait_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="lock_hold_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Child ScanRuns for sharded vCenter scans
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0011_scanrun_lock_timings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanrun",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="shards",
+                to="scans.scanrun",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="shard",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
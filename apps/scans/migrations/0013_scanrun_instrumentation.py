@@ -0,0 +1,72 @@
+# Per-phase timings and scan counters on ScanRun
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0012_scanrun_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanrun",
+            name="connect_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="fetch_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="enrich_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="cache_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="persist_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="detect_seconds",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="rows_created",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="rows_updated",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="rows_unchanged",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="cache_hit",
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="api_calls",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="bytes_received",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Fingerprint of the last fully persisted cached inventory on DataSource
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0013_scanrun_instrumentation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasource",
+            name="inventory_generation",
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name="datasource",
+            name="inventory_synced_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
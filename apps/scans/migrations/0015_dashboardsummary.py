@@ -0,0 +1,30 @@
+# Precomputed dashboard KPIs and chart data (single row, refreshed after each scan)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0014_datasource_inventory_generation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DashboardSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("computed_at", models.DateTimeField()),
+                ("total_vms", models.PositiveIntegerField(default=0)),
+                ("idle_zombie_count", models.PositiveIntegerField(default=0)),
+                ("savings_vcpu", models.PositiveIntegerField(default=0)),
+                ("savings_ram_mb", models.BigIntegerField(default=0)),
+                ("active_count", models.PositiveIntegerField(default=0)),
+                ("idle_count", models.PositiveIntegerField(default=0)),
+                ("top_sources", models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                "verbose_name": "Dashboard summary",
+                "verbose_name_plural": "Dashboard summary",
+            },
+        ),
+    ]
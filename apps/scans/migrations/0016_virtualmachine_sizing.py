@@ -0,0 +1,74 @@
+# Sizing columns on VirtualMachine (backfilled from vCenter-shaped metadata) and savings in the dashboard summary
+from django.db import migrations, models
+
+# Rows per backfill UPDATE batch
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _int_or_none(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+        return int(value)
+    return None
+
+
+def backfill_sizing(apps, schema_editor):
+    """numCpu / memorySizeMB from metadata (vCenter and demo data); disk is filled by the next scan."""
+    VirtualMachine = apps.get_model("scans", "VirtualMachine")
+    batch = []
+    qs = VirtualMachine.objects.filter(num_cpu__isnull=True).only("pk", "metadata")
+    for vm in qs.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        meta = vm.metadata if isinstance(vm.metadata, dict) else {}
+        vm.num_cpu = _int_or_none(meta.get("numCpu"))
+        vm.memory_size_mb = _int_or_none(meta.get("memorySizeMB"))
+        if vm.num_cpu is None and vm.memory_size_mb is None:
+            continue
+        batch.append(vm)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            VirtualMachine.objects.bulk_update(batch, ["num_cpu", "memory_size_mb"])
+            batch = []
+    if batch:
+        VirtualMachine.objects.bulk_update(batch, ["num_cpu", "memory_size_mb"])
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0015_dashboardsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="num_cpu",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="memory_size_mb",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="provisioned_disk_gb",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="virtualmachine",
+            index=models.Index(fields=["data_source", "idle_score"], name="scans_vm_ds_idle_score_idx"),
+        ),
+        migrations.AddField(
+            model_name="dashboardsummary",
+            name="savings_disk_gb",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dashboardsummary",
+            name="savings_by_source",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_sizing, noop),
+    ]
@@ -0,0 +1,43 @@
+# Add Celery Beat schedule: hourly age transitions and dashboard summary refresh at :45 UTC
+from django.db import migrations
+
+TASK_NAME = "IdleHunter dashboard refresh"
+
+
+def add_refresh_schedule(apps, schema_editor):
+    CrontabSchedule = apps.get_model("django_celery_beat", "CrontabSchedule")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    schedule, _ = CrontabSchedule.objects.get_or_create(
+        minute="45",
+        hour="*",
+        day_of_week="*",
+        day_of_month="*",
+        month_of_year="*",
+        timezone="UTC",
+    )
+    PeriodicTask.objects.get_or_create(
+        name=TASK_NAME,
+        defaults={
+            "task": "apps.scans.tasks.refresh_dashboard",
+            "crontab": schedule,
+            "enabled": True,
+            "kwargs": "{}",
+        },
+    )
+
+
+def remove_refresh_schedule(apps, schema_editor):
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    PeriodicTask.objects.filter(name=TASK_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0016_virtualmachine_sizing"),
+        ("django_celery_beat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_refresh_schedule, remove_refresh_schedule),
+    ]
@@ -0,0 +1,17 @@
+# Failed metric queries per ScanRun
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0017_add_dashboard_refresh_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanrun",
+            name="perf_errors",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
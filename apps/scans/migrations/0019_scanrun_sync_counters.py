@@ -0,0 +1,22 @@
+# Full vs incremental vCenter syncs per ScanRun
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0018_scanrun_perf_errors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanrun",
+            name="full_syncs",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanrun",
+            name="incremental_syncs",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Stored Rule B window aggregates, read by set-based detection
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scans", "0019_scanrun_sync_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="window_cpu_usage_percent",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="window_network_usage_kbps",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="virtualmachine",
+            name="window_disk_usage_iops",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
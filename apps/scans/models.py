@@ -1,4 +1,4 @@
-# Scans app: data sources, virtual machines, scan runs
+# Scans app: data sources, virtual machines, metric history, scan runs
 from django.db import models
 
 from apps.core.models import TimeStampedModel
@@ -19,6 +19,11 @@ class DataSource(TimeStampedModel):
     is_enabled = models.BooleanField(default=True)
     # Connection details stored as JSON or in env; for Step 2 we only store metadata.
     config = models.JSONField(default=dict, blank=True)
+    # Fingerprint of the cached inventory last persisted in full ("" = unknown), and the
+    # last_seen every VM of that inventory has at least; a scan replaying the same
+    # inventory only bumps last_seen
+    inventory_generation = models.CharField(max_length=40, blank=True, editable=False)
+    inventory_synced_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -62,19 +67,123 @@ class VirtualMachine(TimeStampedModel):
     memory_usage_mb = models.FloatField(null=True, blank=True)
     network_usage_kbps = models.FloatField(null=True, blank=True)
     disk_usage_iops = models.FloatField(null=True, blank=True)
+    # Rule B window aggregates, stored by set-based detection before scoring (null = no history)
+    window_cpu_usage_percent = models.FloatField(null=True, blank=True, editable=False)
+    window_network_usage_kbps = models.FloatField(null=True, blank=True, editable=False)
+    window_disk_usage_iops = models.FloatField(null=True, blank=True, editable=False)
+    # Configured size, summed in SQL for savings / reclaimable capacity
+    num_cpu = models.PositiveIntegerField(null=True, blank=True)
+    memory_size_mb = models.PositiveIntegerField(null=True, blank=True)
+    provisioned_disk_gb = models.FloatField(null=True, blank=True)
     # Raw snapshot of last-known state (cluster, etc.)
     metadata = models.JSONField(default=dict, blank=True)
+    # Hash of the ingested attributes; unchanged rows only get last_seen bumped
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
 
     class Meta:
         ordering = ["name"]
         verbose_name = "Virtual machine"
         verbose_name_plural = "Virtual machines"
         unique_together = [["data_source", "uuid"]]
+        indexes = [
+            # Age-driven detection pass (missing / powered-off zombie cutoffs)
+            models.Index(fields=["data_source", "last_seen"], name="scans_vm_ds_last_seen_idx"),
+            models.Index(fields=["data_source", "last_boot_time"], name="scans_vm_ds_last_boot_idx"),
+            # Savings / reclaimable capacity: idle VMs per source (sizing columns summed from these rows)
+            models.Index(fields=["data_source", "idle_score"], name="scans_vm_ds_idle_score_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.uuid[:8]}...)"
 
 
+class VMMetricSample(models.Model):
+    """
+    Rule B metrics of one VM at one hour (history for windowed averages).
+    Kept narrow on purpose (no timestamps/metadata): one row per VM per hour.
+    """
+
+    vm = models.ForeignKey(VirtualMachine, on_delete=models.CASCADE, related_name="metric_samples")
+    # Scan time truncated to the hour; the first scan in an hour wins
+    sampled_at = models.DateTimeField()
+    cpu_usage_percent = models.FloatField(null=True, blank=True)
+    network_usage_kbps = models.FloatField(null=True, blank=True)
+    disk_usage_iops = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "VM metric sample"
+        verbose_name_plural = "VM metric samples"
+        constraints = [
+            # Also the (vm, sampled_at) index used by window queries
+            models.UniqueConstraint(fields=["vm", "sampled_at"], name="scans_vmmetricsample_vm_sampled_at"),
+        ]
+        indexes = [
+            # Rollup ranges and retention deletes by sample age
+            models.Index(fields=["sampled_at"], name="scans_sample_sampled_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.vm_id} @ {self.sampled_at.isoformat()}"
+
+
+class VMMetricRollup(models.Model):
+    """
+    Daily aggregates of VMMetricSample per VM (min/avg/max/p95 per metric); the raw samples
+    are already hourly. p95 is only computed on PostgreSQL (percentile_cont); null elsewhere.
+    """
+
+    class Resolution(models.TextChoices):
+        DAY = "day", "Day"
+
+    vm = models.ForeignKey(VirtualMachine, on_delete=models.CASCADE, related_name="metric_rollups")
+    resolution = models.CharField(max_length=8, choices=Resolution.choices)
+    # Bucket start (UTC, aligned to the resolution)
+    bucket = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=0)
+    cpu_usage_percent_min = models.FloatField(null=True, blank=True)
+    cpu_usage_percent_avg = models.FloatField(null=True, blank=True)
+    cpu_usage_percent_max = models.FloatField(null=True, blank=True)
+    cpu_usage_percent_p95 = models.FloatField(null=True, blank=True)
+    network_usage_kbps_min = models.FloatField(null=True, blank=True)
+    network_usage_kbps_avg = models.FloatField(null=True, blank=True)
+    network_usage_kbps_max = models.FloatField(null=True, blank=True)
+    network_usage_kbps_p95 = models.FloatField(null=True, blank=True)
+    disk_usage_iops_min = models.FloatField(null=True, blank=True)
+    disk_usage_iops_avg = models.FloatField(null=True, blank=True)
+    disk_usage_iops_max = models.FloatField(null=True, blank=True)
+    disk_usage_iops_p95 = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "VM metric rollup"
+        verbose_name_plural = "VM metric rollups"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vm", "resolution", "bucket"], name="scans_vmmetricrollup_vm_resolution_bucket"
+            ),
+        ]
+        indexes = [
+            # Retention deletes and watermark scans by bucket age
+            models.Index(fields=["resolution", "bucket"], name="scans_rollup_res_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.vm_id} {self.resolution} @ {self.bucket.isoformat()}"
+
+
+class MetricRollupWatermark(models.Model):
+    """Per resolution: every bucket before rolled_up_to has been aggregated (each bucket once)."""
+
+    resolution = models.CharField(max_length=8, choices=VMMetricRollup.Resolution.choices, unique=True)
+    rolled_up_to = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Metric rollup watermark"
+        verbose_name_plural = "Metric rollup watermarks"
+
+    def __str__(self):
+        return f"{self.resolution} rolled up to {self.rolled_up_to.isoformat()}"
+
+
 class ScanRun(TimeStampedModel):
     """A single run of data collection (vCenter/Aria/Stor2RRD) and optional scoring."""
 
@@ -93,6 +202,33 @@ class ScanRun(TimeStampedModel):
         DataSource, on_delete=models.CASCADE, null=True, blank=True, related_name="scan_runs"
     )
     message = models.TextField(blank=True)  # Error or summary message
+    # Per-DataSource scan lock: seconds spent waiting for it and holding it
+    lock_wait_seconds = models.FloatField(null=True, blank=True)
+    lock_hold_seconds = models.FloatField(null=True, blank=True)
+    # Sharded vCenter scans: one child run per shard (datacenter/cluster/folder) under the source run
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, related_name="shards"
+    )
+    shard = models.CharField(max_length=255, blank=True)
+    # Instrumentation: exclusive seconds per phase (see integrations.instrumentation.PHASES)
+    connect_seconds = models.FloatField(null=True, blank=True)
+    fetch_seconds = models.FloatField(null=True, blank=True)
+    enrich_seconds = models.FloatField(null=True, blank=True)
+    cache_seconds = models.FloatField(null=True, blank=True)
+    persist_seconds = models.FloatField(null=True, blank=True)
+    detect_seconds = models.FloatField(null=True, blank=True)
+    # Upsert outcome, whether the inventory came from the API cache, and API traffic
+    rows_created = models.PositiveIntegerField(null=True, blank=True)
+    rows_updated = models.PositiveIntegerField(null=True, blank=True)
+    rows_unchanged = models.PositiveIntegerField(null=True, blank=True)
+    cache_hit = models.BooleanField(null=True, blank=True)
+    api_calls = models.PositiveIntegerField(null=True, blank=True)
+    bytes_received = models.BigIntegerField(null=True, blank=True)
+    # Failed metric queries (e.g. vCenter QueryPerf batches): those VMs have no network/disk data
+    perf_errors = models.PositiveIntegerField(null=True, blank=True)
+    # Incremental vCenter sync: full snapshots vs incremental polls (full ones include lost state)
+    full_syncs = models.PositiveIntegerField(null=True, blank=True)
+    incremental_syncs = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ["-started_at"]
@@ -101,3 +237,32 @@ class ScanRun(TimeStampedModel):
 
     def __str__(self):
         return f"ScanRun {self.started_at.isoformat()} ({self.status})"
+
+
+class DashboardSummary(models.Model):
+    """
+    Dashboard KPIs and chart data, recomputed once per scan (see summary.refresh_dashboard_summary)
+    so the dashboard renders them from one row whatever the inventory size. Single row (pk=1).
+    """
+
+    computed_at = models.DateTimeField()
+    total_vms = models.PositiveIntegerField(default=0)
+    # idle_score > IDLE_ZOMBIE_THRESHOLD, and what reclaiming them would free
+    idle_zombie_count = models.PositiveIntegerField(default=0)
+    savings_vcpu = models.PositiveIntegerField(default=0)
+    savings_ram_mb = models.BigIntegerField(default=0)
+    savings_disk_gb = models.FloatField(default=0)
+    # Donut: idle_score >= IDLE_FOR_CHART vs the rest
+    active_count = models.PositiveIntegerField(default=0)
+    idle_count = models.PositiveIntegerField(default=0)
+    # Bar chart: [{"label": source name, "count": idle/zombie VMs}], top TOP_SOURCES
+    top_sources = models.JSONField(default=list, blank=True)
+    # Reclaimable capacity per source: [{"label", "count", "vcpu", "ram_mb", "disk_gb"}], all sources with idle VMs
+    savings_by_source = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        verbose_name = "Dashboard summary"
+        verbose_name_plural = "Dashboard summary"
+
+    def __str__(self):
+        return f"Dashboard summary {self.computed_at.isoformat()}"
@@ -0,0 +1,176 @@
+# Bulk persistence: write VMInfo batches into VirtualMachine rows in chunked upserts
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.integrations.base import VMInfo
+
+from .metrics import METRIC_FIELDS, record_samples
+from .models import VirtualMachine
+
+# Rows per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = getattr(settings, "SCAN_UPSERT_CHUNK_SIZE", 1000)
+# Columns rewritten when a (data_source, uuid) row already exists
+UPSERT_FIELDS = [
+    "name",
+    "last_seen",
+    "power_state",
+    "last_boot_time",
+    "uptime_days",
+    "cpu_usage_mhz",
+    "cpu_usage_percent",
+    "memory_usage_mb",
+    "network_usage_kbps",
+    "disk_usage_iops",
+    "num_cpu",
+    "memory_size_mb",
+    "provisioned_disk_gb",
+    "metadata",
+    "fingerprint",
+    "updated_at",
+]
+# Columns that move on every scan without the VM changing (uptime, usage, thin-disk growth):
+# left out of the fingerprint and written together with last_seen on unchanged rows
+VOLATILE_FIELDS = [
+    "last_seen",
+    "uptime_days",
+    "cpu_usage_mhz",
+    "cpu_usage_percent",
+    "memory_usage_mb",
+    "network_usage_kbps",
+    "disk_usage_iops",
+    "provisioned_disk_gb",
+]
+# Columns left out of the fingerprint
+FINGERPRINT_EXCLUDE = frozenset(VOLATILE_FIELDS)
+
+
+@dataclass
+class UpsertResult:
+    """Rows created, updated and left unchanged by one upsert_vms call."""
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # pks of created/updated rows, plus unchanged rows whose scored metrics moved
+    # (input for downstream stages such as detection)
+    changed_pks: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return self.created + self.updated + self.unchanged
+
+
+def _first_int(*values) -> int | None:
+    """First value that is a non-negative number, as int."""
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+            return int(value)
+    return None
+
+
+def vm_defaults(vm: VMInfo, now) -> dict:
+    """Column values for one VMInfo (everything except data_source and uuid)."""
+    metadata = vm.metadata or {}
+    return {
+        "name": vm.name or vm.uuid[:8],
+        "last_seen": now,
+        "power_state": vm.power_state or "",
+        "last_boot_time": getattr(vm, "last_boot_time", None),
+        "uptime_days": getattr(vm, "uptime_days", None),
+        "cpu_usage_mhz": getattr(vm, "cpu_usage_mhz", None),
+        "cpu_usage_percent": getattr(vm, "cpu_usage_percent", None),
+        "memory_usage_mb": getattr(vm, "memory_usage_mb", None),
+        "network_usage_kbps": getattr(vm, "network_usage_kbps", None),
+        "disk_usage_iops": getattr(vm, "disk_usage_iops", None),
+        # Clients set sizing on VMInfo; vCenter-shaped metadata is the fallback (older cache entries)
+        "num_cpu": _first_int(getattr(vm, "num_cpu", None), metadata.get("numCpu")),
+        "memory_size_mb": _first_int(getattr(vm, "memory_size_mb", None), metadata.get("memorySizeMB")),
+        "provisioned_disk_gb": getattr(vm, "provisioned_disk_gb", None),
+        "metadata": {**metadata, "power_state": vm.power_state},
+    }
+
+
+def vm_fingerprint(defaults: dict, exclude=FINGERPRINT_EXCLUDE) -> str:
+    """Stable sha1 of the ingested column values, except the exclude columns."""
+    payload = {k: v for k, v in defaults.items() if k not in exclude}
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def upsert_vms(data_source_id: int, vms: List[VMInfo], chunk_size: int | None = None, now=None) -> UpsertResult:
+    """
+    Create or update VirtualMachine rows for one DataSource, chunk_size rows per
+    statement, all inside one transaction. One SELECT per chunk fetches the stored
+    fingerprints and volatile values: rows whose fingerprint matches only get their
+    VOLATILE_FIELDS written (just last_seen, in one UPDATE, if none of them moved), the
+    rest go through bulk_create(update_conflicts=True) on (data_source, uuid).
+    Missing rows that reappear are always rewritten so detection sees them again.
+    Every row with metrics also gets an hourly VMMetricSample (see metrics.record_samples).
+    """
+    chunk_size = chunk_size or UPSERT_CHUNK_SIZE
+    now = now or timezone.now()
+    # ON CONFLICT cannot touch the same row twice in one statement: last duplicate wins
+    by_uuid = {vm.uuid: vm for vm in vms if vm.uuid}
+    uuids = list(by_uuid)
+    result = UpsertResult()
+    with transaction.atomic():
+        for i in range(0, len(uuids), chunk_size):
+            chunk = uuids[i:i + chunk_size]
+            existing = {
+                row[0]: row[1:]
+                for row in VirtualMachine.objects.filter(
+                    data_source_id=data_source_id, uuid__in=chunk
+                ).values_list("uuid", "pk", "fingerprint", "status", *VOLATILE_FIELDS[1:])
+            }
+            touched_pks = []
+            unchanged = []
+            objs = []
+            for uuid in chunk:
+                defaults = vm_defaults(by_uuid[uuid], now)
+                defaults["fingerprint"] = vm_fingerprint(defaults)
+                row = existing.get(uuid)
+                if (
+                    row is not None
+                    and row[1] == defaults["fingerprint"]
+                    and row[2] != VirtualMachine.VMStatus.MISSING
+                ):
+                    moved = {name for name, value in zip(VOLATILE_FIELDS[1:], row[3:]) if defaults[name] != value}
+                    if not moved:
+                        touched_pks.append(row[0])
+                        continue
+                    unchanged.append(VirtualMachine(data_source_id=data_source_id, uuid=uuid, **defaults))
+                    if moved.intersection(METRIC_FIELDS):
+                        # Snapshot scoring (and the window fallback) reads these columns
+                        result.changed_pks.append(row[0])
+                    continue
+                objs.append(VirtualMachine(data_source_id=data_source_id, uuid=uuid, **defaults))
+            if touched_pks:
+                VirtualMachine.objects.filter(pk__in=touched_pks).update(last_seen=now)
+            for rows, fields in ((unchanged, VOLATILE_FIELDS), (objs, UPSERT_FIELDS)):
+                if rows:
+                    VirtualMachine.objects.bulk_create(
+                        rows,
+                        update_conflicts=True,
+                        unique_fields=["data_source", "uuid"],
+                        update_fields=fields,
+                    )
+            updated = sum(1 for obj in objs if obj.uuid in existing)
+            result.unchanged += len(touched_pks) + len(unchanged)
+            result.updated += updated
+            result.created += len(objs) - updated
+            pks = {uuid: row[0] for uuid, row in existing.items()}
+            pks.update((obj.uuid, obj.pk) for obj in objs if obj.pk is not None)
+            result.changed_pks.extend(pks[obj.uuid] for obj in objs if obj.uuid in pks)
+            record_samples(
+                [
+                    (pks[uuid], vm.cpu_usage_percent, vm.network_usage_kbps, vm.disk_usage_iops)
+                    for uuid, vm in ((uuid, by_uuid[uuid]) for uuid in chunk if uuid in pks)
+                ],
+                now,
+            )
+    return result
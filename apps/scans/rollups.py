@@ -0,0 +1,113 @@
+# Metric history downsampling: raw VMMetricSample rows (already hourly) -> daily VMMetricRollup, plus retention
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .metrics import METRIC_FIELDS, Percentile95, bucket_start, get_watermarks
+from .models import MetricRollupWatermark, VMMetricRollup, VMMetricSample
+
+Resolution = VMMetricRollup.Resolution
+
+# Raw (hourly) samples / daily rollups older than this many days are deleted
+RAW_RETENTION_DAYS = getattr(settings, "METRIC_RAW_RETENTION_DAYS", 30)
+DAILY_RETENTION_DAYS = getattr(settings, "METRIC_DAILY_RETENTION_DAYS", 400)
+# Rows per retention DELETE (keeps each statement and its locks short)
+RETENTION_DELETE_BATCH = 5000
+# Rollup rows per INSERT
+ROLLUP_BATCH_SIZE = 1000
+# Max time range aggregated per rollup step (bounds the first run over a large backlog)
+MAX_ROLLUP_SPAN = {Resolution.DAY: timedelta(days=7)}
+
+_ROLLUP_UPDATE_FIELDS = ["sample_count"] + [
+    f"{field}_{stat}" for field in METRIC_FIELDS for stat in ("min", "avg", "max", "p95")
+]
+
+
+def _aggregates() -> dict:
+    aggregates = {"sample_count": Count("id")}
+    for field in METRIC_FIELDS:
+        aggregates[f"{field}_min"] = Min(field)
+        aggregates[f"{field}_avg"] = Avg(field)
+        aggregates[f"{field}_max"] = Max(field)
+        if connection.vendor == "postgresql":
+            aggregates[f"{field}_p95"] = Percentile95(field)
+    return aggregates
+
+
+def rollup_step(resolution: str, now=None) -> int | None:
+    """
+    Aggregate the next pending range of complete buckets (at most MAX_ROLLUP_SPAN) with one
+    grouped query, upsert the rollups and advance the watermark. Returns rollup rows written,
+    None when the resolution is caught up. A late sample moves the watermark back
+    (metrics.record_samples), so its bucket is aggregated again and its rollup overwritten.
+    """
+    end = bucket_start(now or timezone.now(), resolution)
+    start = get_watermarks().get(resolution)
+    if start is None:
+        first = VMMetricSample.objects.order_by("sampled_at").values_list("sampled_at", flat=True).first()
+        if first is None:
+            return None
+        start = bucket_start(first, resolution)
+    if start >= end:
+        return None
+    end = min(end, start + MAX_ROLLUP_SPAN[resolution])
+    rows = (
+        VMMetricSample.objects.filter(sampled_at__gte=start, sampled_at__lt=end)
+        .annotate(bucket=Trunc("sampled_at", resolution, tzinfo=dt_timezone.utc))
+        .values("vm_id", "bucket")
+        .annotate(**_aggregates())
+        .order_by()
+    )
+    rollups = [VMMetricRollup(resolution=resolution, **row) for row in rows]
+    with transaction.atomic():
+        if rollups:
+            VMMetricRollup.objects.bulk_create(
+                rollups,
+                batch_size=ROLLUP_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["vm", "resolution", "bucket"],
+                update_fields=_ROLLUP_UPDATE_FIELDS,
+            )
+        MetricRollupWatermark.objects.update_or_create(resolution=resolution, defaults={"rolled_up_to": end})
+    return len(rollups)
+
+
+def _delete_in_batches(queryset) -> int:
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:RETENTION_DELETE_BATCH])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def apply_retention(now=None) -> dict:
+    """
+    Delete expired history in RETENTION_DELETE_BATCH chunks. Raw samples are only deleted
+    once they are rolled up, so stopping the rollup task never loses data.
+    """
+    now = now or timezone.now()
+    deleted = {"raw": 0}
+    mark = get_watermarks().get(Resolution.DAY)
+    if mark is not None:
+        cutoff = min(now - timedelta(days=RAW_RETENTION_DAYS), mark)
+        deleted["raw"] = _delete_in_batches(VMMetricSample.objects.filter(sampled_at__lt=cutoff))
+    deleted[Resolution.DAY.value] = _delete_in_batches(
+        VMMetricRollup.objects.filter(resolution=Resolution.DAY, bucket__lt=now - timedelta(days=DAILY_RETENTION_DAYS))
+    )
+    return deleted
+
+
+def rollup_metric_history(now=None) -> dict:
+    """Roll up every complete bucket, then apply retention."""
+    now = now or timezone.now()
+    rolled = {}
+    for resolution in Resolution.values:
+        rolled[resolution] = 0
+        while (written := rollup_step(resolution, now)) is not None:
+            rolled[resolution] += written
+    return {"rolled_up": rolled, "deleted": apply_retention(now)}
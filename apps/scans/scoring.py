@@ -0,0 +1,160 @@
+# Vectorized idle scoring (NumPy): continuous, weighted per-metric curves instead of step points.
+# Missing and Rule A (powered-off zombie) are the same as in detection.py; powered-on VMs get
+#   score = sum(weight_m * 1 / (1 + (x_m / threshold_m) ** CURVE_STEEPNESS))
+# so a metric at its idle threshold contributes half its weight, near zero the full weight.
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .detection import (
+    CPU_IDLE_PERCENT,
+    DISK_IDLE_IOPS,
+    MISSING_DAYS_THRESHOLD,
+    NETWORK_IDLE_KBPS,
+    POWEREDOFF_IDLE_DAYS,
+)
+from .metrics import METRIC_FIELDS, window_aggregates
+from .models import VirtualMachine
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Metric weights for powered-on VMs (a metric with no value contributes nothing)
+CPU_WEIGHT = getattr(settings, "IDLE_SCORE_CPU_WEIGHT", 0.5)
+NETWORK_WEIGHT = getattr(settings, "IDLE_SCORE_NETWORK_WEIGHT", 0.3)
+DISK_WEIGHT = getattr(settings, "IDLE_SCORE_DISK_WEIGHT", 0.2)
+# Curve steepness around each threshold (higher = closer to the old step rules)
+CURVE_STEEPNESS = getattr(settings, "IDLE_SCORE_CURVE_STEEPNESS", 4.0)
+# Powered-on score at or above this => status idle
+IDLE_STATUS_SCORE = 0.5
+# Rows per values_list page and per bulk_update batch
+CHUNK_SIZE = 10000
+# Scores are stored rounded so float noise does not count as a change
+SCORE_DECIMALS = 4
+
+# Status codes used inside the arrays
+ACTIVE, IDLE, MISSING = 0, 1, 2
+STATUS_VALUES = {
+    ACTIVE: VirtualMachine.VMStatus.ACTIVE,
+    IDLE: VirtualMachine.VMStatus.IDLE,
+    MISSING: VirtualMachine.VMStatus.MISSING,
+}
+_STATUS_CODES = {value: code for code, value in STATUS_VALUES.items()}
+
+_FIELDS = (
+    "pk", "last_seen", "power_state", "last_boot_time",
+    "cpu_usage_percent", "network_usage_kbps", "disk_usage_iops", "idle_score", "status",
+)
+
+
+def _idle_curve(values, threshold: float):
+    """1 / (1 + (x / threshold) ** k) for x >= 0; NaN (no metric) maps to 0."""
+    x = np.clip(np.nan_to_num(values, nan=np.inf), 0.0, None) / threshold
+    with np.errstate(over="ignore"):
+        return 1.0 / (1.0 + np.power(x, CURVE_STEEPNESS))
+
+
+def score_arrays(now_ts: float, last_seen, powered_on, powered_off, last_boot, cpu, network, disk):
+    """
+    Scores and status codes for whole columns at once. Timestamps are epoch seconds
+    and metrics floats, NaN where the column is NULL; powered_on/off are bool arrays.
+    """
+    missing = np.isnan(last_seen) | (last_seen <= now_ts - timedelta(days=MISSING_DAYS_THRESHOLD).total_seconds())
+    zombie = powered_off & (last_boot <= now_ts - timedelta(days=POWEREDOFF_IDLE_DAYS + 1).total_seconds())
+    rule_b = (
+        CPU_WEIGHT * _idle_curve(cpu, CPU_IDLE_PERCENT)
+        + NETWORK_WEIGHT * _idle_curve(network, NETWORK_IDLE_KBPS)
+        + DISK_WEIGHT * _idle_curve(disk, DISK_IDLE_IOPS)
+    )
+    scores = np.where(powered_on, np.minimum(rule_b, 1.0), 0.0)
+    scores = np.where(missing | zombie, 1.0, scores)
+    scores = np.round(scores, SCORE_DECIMALS)
+    statuses = np.where(powered_on & (scores >= IDLE_STATUS_SCORE), IDLE, ACTIVE)
+    statuses = np.where(zombie, IDLE, statuses)
+    statuses = np.where(missing, MISSING, statuses)
+    return scores, statuses
+
+
+def _timestamps(values):
+    return np.fromiter((v.timestamp() if v is not None else np.nan for v in values), dtype=float, count=len(values))
+
+
+def _floats(values):
+    # None converts to NaN
+    return np.array(values, dtype=float)
+
+
+def _window_metrics(aggregates: dict, pk, snapshots) -> list:
+    """Per metric field: the window aggregate where the VM has one, else the snapshot column."""
+    missing = {}
+    arrays = []
+    for field, values in zip(METRIC_FIELDS, snapshots):
+        window = np.fromiter(
+            (aggregates.get(p, missing).get(field, np.nan) for p in pk), dtype=float, count=len(pk)
+        )
+        arrays.append(np.where(np.isnan(window), _floats(values), window))
+    return arrays
+
+
+def _power_masks(power):
+    """(powered_on, powered_off) bool arrays; normalises each distinct raw value once."""
+    on = {v: (v or "").strip().lower() == "poweredon" for v in set(power)}
+    off = {v: (v or "").strip().lower() == "poweredoff" for v in on}
+    return (
+        np.fromiter(map(on.__getitem__, power), dtype=bool, count=len(power)),
+        np.fromiter(map(off.__getitem__, power), dtype=bool, count=len(power)),
+    )
+
+
+def _score_chunk(rows, now) -> list:
+    """VirtualMachine stubs (pk, idle_score, status) for the rows whose result changed."""
+    pk, last_seen, power, last_boot, cpu, network, disk, old_score, old_status = zip(*rows)
+    # Rule B metrics: window aggregates from metric history where present (one grouped query)
+    aggregates = window_aggregates(now, vm_id__in=pk)
+    if aggregates:
+        cpu, network, disk = _window_metrics(aggregates, pk, (cpu, network, disk))
+    powered_on, powered_off = _power_masks(power)
+    scores, statuses = score_arrays(
+        now.timestamp(),
+        _timestamps(last_seen),
+        powered_on,
+        powered_off,
+        _timestamps(last_boot),
+        _floats(cpu),
+        _floats(network),
+        _floats(disk),
+    )
+    old_codes = np.array([_STATUS_CODES.get(s, -1) for s in old_status])
+    changed = np.flatnonzero((_floats(old_score) != scores) | (old_codes != statuses))
+    return [
+        VirtualMachine(pk=pk[i], idle_score=float(scores[i]), status=STATUS_VALUES[int(statuses[i])])
+        for i in changed
+    ]
+
+
+def compute_idle_scores_numpy(queryset=None, now=None) -> int:
+    """
+    Score VMs in CHUNK_SIZE pages: columns come from values_list (keyset-paged on pk),
+    scoring runs on NumPy arrays, changed rows are written with bulk_update.
+    Returns the number of VMs updated.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy is not installed.")
+    if queryset is None:
+        queryset = VirtualMachine.objects.all()
+    now = now or timezone.now()
+    updated = 0
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by("pk").values_list(*_FIELDS)[:CHUNK_SIZE])
+        if not rows:
+            return updated
+        last_pk = rows[-1][0]
+        changed = _score_chunk(rows, now)
+        if changed:
+            VirtualMachine.objects.bulk_update(changed, ["idle_score", "status"], batch_size=CHUNK_SIZE)
+            updated += len(changed)
@@ -0,0 +1,67 @@
+# Dashboard summary snapshot: KPIs and chart data computed in two aggregate queries per scan.
+# Savings sum the typed sizing columns (num_cpu, memory_size_mb, provisioned_disk_gb) in SQL.
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import DashboardSummary, VirtualMachine
+
+# Idle threshold for "Idle/Zombie" count (and the savings KPI)
+IDLE_ZOMBIE_THRESHOLD = 0.7
+# For donut: "Idle" = score >= 0.5; "Active" = score < 0.5 or None
+IDLE_FOR_CHART = 0.5
+# Sources in the bar chart
+TOP_SOURCES = 5
+
+SUMMARY_PK = 1
+
+
+def reclaimable_by_source():
+    """Idle/zombie VMs and their summed sizing per DataSource, largest count first (one GROUP BY)."""
+    return (
+        VirtualMachine.objects.filter(idle_score__gt=IDLE_ZOMBIE_THRESHOLD)
+        .values("data_source_id", "data_source__name")
+        .annotate(count=Count("pk"), vcpu=Sum("num_cpu"), ram_mb=Sum("memory_size_mb"), disk_gb=Sum("provisioned_disk_gb"))
+        .order_by("-count", "data_source__name")
+    )
+
+
+def refresh_dashboard_summary(now=None) -> DashboardSummary:
+    """Recompute the snapshot from VirtualMachine (one aggregate + one GROUP BY) and store it."""
+    zombie = Q(idle_score__gt=IDLE_ZOMBIE_THRESHOLD)
+    totals = VirtualMachine.objects.aggregate(
+        total_vms=Count("pk"),
+        idle_zombie_count=Count("pk", filter=zombie),
+        active_count=Count("pk", filter=Q(idle_score__lt=IDLE_FOR_CHART) | Q(idle_score__isnull=True)),
+        idle_count=Count("pk", filter=Q(idle_score__gte=IDLE_FOR_CHART)),
+        savings_vcpu=Sum("num_cpu", filter=zombie),
+        savings_ram_mb=Sum("memory_size_mb", filter=zombie),
+        savings_disk_gb=Sum("provisioned_disk_gb", filter=zombie),
+    )
+    by_source = [
+        {
+            "label": row["data_source__name"],
+            "count": row["count"],
+            "vcpu": row["vcpu"] or 0,
+            "ram_mb": row["ram_mb"] or 0,
+            "disk_gb": round(row["disk_gb"] or 0.0, 1),
+        }
+        for row in reclaimable_by_source()
+    ]
+    summary, _ = DashboardSummary.objects.update_or_create(
+        pk=SUMMARY_PK,
+        defaults={
+            **totals,
+            "savings_vcpu": totals["savings_vcpu"] or 0,
+            "savings_ram_mb": totals["savings_ram_mb"] or 0,
+            "savings_disk_gb": round(totals["savings_disk_gb"] or 0.0, 1),
+            "top_sources": [{"label": row["label"], "count": row["count"]} for row in by_source[:TOP_SOURCES]],
+            "savings_by_source": by_source,
+            "computed_at": now or timezone.now(),
+        },
+    )
+    return summary
+
+
+def dashboard_summary() -> DashboardSummary:
+    """The stored snapshot; computed on first use (before any scan has run)."""
+    return DashboardSummary.objects.filter(pk=SUMMARY_PK).first() or refresh_dashboard_summary()
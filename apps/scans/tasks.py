@@ -1,21 +1,47 @@
 # Celery tasks: fetch VMs from vCenter/Aria/Stor2RRD and orchestrate scans
-import json
-from typing import List
+from contextlib import nullcontext
+from functools import partial
+from typing import Iterator, List, Set
 
-from celery import shared_task
-from django.core.cache import cache
+from celery import chord, shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
+from apps.integrations import instrumentation
 from apps.integrations.aria import AriaClient
 from apps.integrations.base import VMInfo
+from apps.integrations.enrichment import MetricsBudget, enrich_with_vm_metrics
 from apps.integrations.stor2rrd import Stor2RRDClient
 from apps.integrations.vcenter import VCenterClient
+from apps.integrations.vcenter_pool import close_all as close_vcenter_sessions
 
-from .detection import run_detection
+from . import cache_fill
+from .detection import apply_age_transitions, run_detection
+from .locks import SCAN_LOCK_QUEUE_TTL, ScanLease, acquire_scan_lock, check_lease, current_holder
+from .metrics import window_enabled
 from .models import DataSource, ScanRun, VirtualMachine
+from .persistence import upsert_vms
+from .rollups import rollup_metric_history as _rollup_metric_history
+from .summary import refresh_dashboard_summary
 
-# Cache TTL for API responses (seconds) to avoid hammering external APIs
-API_CACHE_TTL = 300
+# uuids per UPDATE when touching last_seen of unchanged VMs
+TOUCH_CHUNK_SIZE = 1000
+# Celery queue for scans of vCenters with incremental_sync. The WaitForUpdatesEx state lives in
+# the worker process that created it, so consume this queue with one process ("" = default queue)
+SCAN_SYNC_QUEUE = getattr(settings, "SCAN_SYNC_QUEUE", "")
+# A background cache refresh that finds the source being scanned retries after this many
+# seconds, up to this many times (about the length of a long scan in total)
+REFRESH_RETRY_COUNTDOWN = 60
+REFRESH_MAX_RETRIES = 15
+
+
+@worker_process_shutdown.connect
+def _close_vcenter_sessions(**kwargs):
+    """Log out pooled vCenter sessions when a worker process exits."""
+    close_vcenter_sessions()
 
 
 def _get_datasource_config(data_source: DataSource) -> dict:
@@ -28,164 +54,558 @@ def _cache_key(prefix: str, data_source_id: int, extra: str = "") -> str:
     return f"idlehunter:{prefix}:ds{data_source_id}:{extra}"
 
 
-def _update_vms_from_list(data_source_id: int, vms: List[VMInfo]) -> int:
-    """Create or update VirtualMachine records with metrics; return count."""
-    try:
-        ds = DataSource.objects.get(pk=data_source_id)
-    except DataSource.DoesNotExist:
+def _update_vms_from_list(data_source_id: int, vms: List[VMInfo], dirty: Set[int] | None = None) -> int:
+    """
+    Create or update VirtualMachine records with metrics (chunked bulk upsert); return count.
+    pks of created/changed rows are added to dirty (input for incremental detection).
+    """
+    if not DataSource.objects.filter(pk=data_source_id).exists():
         return 0
+    check_lease()
+    with instrumentation.phase("persist"):
+        result = upsert_vms(data_source_id, vms)
+    instrumentation.count("rows_created", result.created)
+    instrumentation.count("rows_updated", result.updated)
+    instrumentation.count("rows_unchanged", result.unchanged)
+    if dirty is not None:
+        dirty.update(result.changed_pks)
+    return result.count
+
+
+def _per_vm_metrics_enabled(ds: DataSource, config: dict) -> bool:
+    """Per-VM metric calls: on by default for Stor2RRD (no bulk endpoint), opt-in elsewhere."""
+    return bool(config.get("per_vm_metrics", ds.source_type == DataSource.SourceType.STOR2RRD))
+
+
+def _touch_vms(data_source_id: int, uuids: List[str], dirty: Set[int] | None = None) -> int:
+    """
+    Bump last_seen for VMs still present but unchanged (incremental sync); return rows touched.
+    Touched rows currently marked missing are added to dirty so detection revives them.
+    """
+    check_lease()
     now = timezone.now()
-    count = 0
-    for vm in vms:
-        if not vm.uuid:
-            continue
-        metadata = vm.metadata or {}
-        defaults = {
-            "name": vm.name or vm.uuid[:8],
-            "last_seen": now,
-            "power_state": vm.power_state or "",
-            "last_boot_time": getattr(vm, "last_boot_time", None),
-            "uptime_days": getattr(vm, "uptime_days", None),
-            "cpu_usage_mhz": getattr(vm, "cpu_usage_mhz", None),
-            "cpu_usage_percent": getattr(vm, "cpu_usage_percent", None),
-            "memory_usage_mb": getattr(vm, "memory_usage_mb", None),
-            "network_usage_kbps": getattr(vm, "network_usage_kbps", None),
-            "disk_usage_iops": getattr(vm, "disk_usage_iops", None),
-            "metadata": {**metadata, "power_state": vm.power_state},
-        }
-        obj, created = VirtualMachine.objects.update_or_create(
-            data_source=ds,
-            uuid=vm.uuid,
-            defaults=defaults,
-        )
-        count += 1
-    return count
-
-
-def _vms_to_cache_items(vms: List[VMInfo]) -> list:
-    """Serialize VMInfo list for Redis cache (include metrics)."""
-    out = []
-    for v in vms:
-        item = {
-            "name": v.name,
-            "uuid": v.uuid,
-            "power_state": v.power_state,
-            "metadata": v.metadata,
-            "cpu_usage_mhz": getattr(v, "cpu_usage_mhz", None),
-            "cpu_usage_percent": getattr(v, "cpu_usage_percent", None),
-            "memory_usage_mb": getattr(v, "memory_usage_mb", None),
-            "network_usage_kbps": getattr(v, "network_usage_kbps", None),
-            "disk_usage_iops": getattr(v, "disk_usage_iops", None),
-            "uptime_days": getattr(v, "uptime_days", None),
-            "last_boot_time": getattr(v, "last_boot_time", None),
-        }
-        if item["last_boot_time"] is not None and hasattr(item["last_boot_time"], "isoformat"):
-            item["last_boot_time"] = item["last_boot_time"].isoformat()
-        out.append(item)
+    touched = 0
+    with instrumentation.phase("persist"):
+        for i in range(0, len(uuids), TOUCH_CHUNK_SIZE):
+            qs = VirtualMachine.objects.filter(data_source_id=data_source_id, uuid__in=uuids[i:i + TOUCH_CHUNK_SIZE])
+            if dirty is not None:
+                dirty.update(qs.filter(status=VirtualMachine.VMStatus.MISSING).values_list("pk", flat=True))
+            touched += qs.update(last_seen=now)
+    instrumentation.count("rows_unchanged", touched)
+    return touched
+
+
+def _sync_vcenter_incremental(ds: DataSource, dirty: Set[int] | None = None) -> dict:
+    """Apply only VMs changed since the last WaitForUpdatesEx version; bypasses the API cache."""
+    with instrumentation.phase("fetch"):
+        result = VCenterClient().sync_vms(_get_datasource_config(ds), sync_key=ds.id)
+    if result is None:
+        return {"ok": False, "error": "vCenter sync failed", "count": 0}
+    instrumentation.count("full_syncs" if result.full else "incremental_syncs")
+    _update_vms_from_list(ds.id, result.vms, dirty)
+    if not result.full:
+        changed = {vm.uuid for vm in result.vms}
+        _touch_vms(ds.id, [uuid for uuid in result.present_uuids if uuid not in changed], dirty)
+    out = {
+        "ok": True,
+        "count": len(result.present_uuids),
+        "changed": len(result.vms),
+        "incremental": not result.full,
+    }
+    if result.full:
+        # Surfaced on the ScanRun so unexpected fallbacks (session_changed, version_lost) are visible
+        out["full_sync_reason"] = result.full_reason
+        out["message"] = f"{out['count']} VMs (full sync: {result.full_reason})"
     return out
 
 
-def _vms_from_cache_items(items: list) -> List[VMInfo]:
-    """Deserialize VMInfo list from cache."""
-    from datetime import datetime
-    vms = []
-    for d in items:
-        lb = d.get("last_boot_time")
-        if isinstance(lb, str):
-            try:
-                lb = datetime.fromisoformat(lb.replace("Z", "+00:00"))
-            except Exception:
-                lb = None
-        vms.append(VMInfo(
-            name=d["name"],
-            uuid=d["uuid"],
-            power_state=d.get("power_state"),
-            metadata=d.get("metadata"),
-            cpu_usage_mhz=d.get("cpu_usage_mhz"),
-            cpu_usage_percent=d.get("cpu_usage_percent"),
-            memory_usage_mb=d.get("memory_usage_mb"),
-            network_usage_kbps=d.get("network_usage_kbps"),
-            disk_usage_iops=d.get("disk_usage_iops"),
-            uptime_days=d.get("uptime_days"),
-            last_boot_time=lb,
-        ))
-    return vms
-
-
-def _fetch_vcenter_impl(data_source_id: int) -> dict:
-    cache_key = _cache_key("vcenter", data_source_id)
-    cached = cache.get(cache_key)
-    if cached is not None:
-        vms = _vms_from_cache_items(json.loads(cached))
-    else:
-        try:
-            ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.VCENTER)
-        except DataSource.DoesNotExist:
-            return {"ok": False, "error": "DataSource not found", "count": 0}
-        config = _get_datasource_config(ds)
-        vms = VCenterClient().get_vms(config)
-        cache.set(cache_key, json.dumps(_vms_to_cache_items(vms)), API_CACHE_TTL)
-    count = _update_vms_from_list(data_source_id, vms)
-    return {"ok": True, "count": count}
+def _source_client(ds: DataSource):
+    if ds.source_type == DataSource.SourceType.VCENTER:
+        return VCenterClient()
+    if ds.source_type == DataSource.SourceType.ARIA:
+        return AriaClient()
+    return Stor2RRDClient()
 
 
-def _fetch_aria_impl(data_source_id: int) -> dict:
-    cache_key = _cache_key("aria", data_source_id)
-    cached = cache.get(cache_key)
-    if cached is not None:
-        vms = _vms_from_cache_items(json.loads(cached))
-    else:
-        try:
-            ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.ARIA)
-        except DataSource.DoesNotExist:
-            return {"ok": False, "error": "DataSource not found", "count": 0}
-        config = _get_datasource_config(ds)
-        vms = AriaClient().get_vms(config)
-        cache.set(cache_key, json.dumps(_vms_to_cache_items(vms)), API_CACHE_TTL)
-    count = _update_vms_from_list(data_source_id, vms)
+def _source_batches(ds: DataSource, shard: dict | None = None) -> Iterator[List[VMInfo]]:
+    """VM batches straight from the source API (per-VM metric enrichment applied per batch)."""
+    config = _get_datasource_config(ds)
+    client = _source_client(ds)
+    if shard is not None:
+        yield from client.iter_vm_batches(config, shard)
+        return
+    enrich = None
+    if ds.source_type != DataSource.SourceType.VCENTER and _per_vm_metrics_enabled(ds, config):
+        # One budget for the whole scan, spent batch by batch
+        budget = MetricsBudget.from_config(config)
+        enrich = partial(enrich_with_vm_metrics, client, config, budget=budget)
+    for batch in client.iter_vm_batches(config):
+        if enrich is not None:
+            with instrumentation.phase("enrich"):
+                enrich(batch)
+        yield batch
+
+
+def _source_cache_key(ds: DataSource, shard: dict | None = None) -> str:
+    return _cache_key(ds.source_type, ds.id, f"shard-{shard['moid']}:" if shard else "")
+
+
+def _persist_batches(data_source_id: int, batches: Iterator[List[VMInfo]], dirty: Set[int] | None = None) -> dict:
+    """
+    Streaming fetch-to-persist: each batch is upserted before the next one is pulled, so a
+    worker holds one batch of VMInfo, encoded cache value and ORM objects at a time instead
+    of the whole inventory.
+    """
+    count = 0
+    # Time spent inside the client between batches is the fetch phase
+    for batch in instrumentation.timed(batches, "fetch"):
+        count += _update_vms_from_list(data_source_id, batch, dirty)
     return {"ok": True, "count": count}
 
 
-def _fetch_stor2rrd_impl(data_source_id: int) -> dict:
-    cache_key = _cache_key("stor2rrd", data_source_id)
-    cached = cache.get(cache_key)
-    if cached is not None:
-        vms = _vms_from_cache_items(json.loads(cached))
-    else:
+def _set_inventory(ds: DataSource, fingerprint: str, synced_at) -> None:
+    """Record which cached inventory the source's rows now reflect ("" = unknown)."""
+    ds.inventory_generation = fingerprint
+    ds.inventory_synced_at = synced_at
+    DataSource.objects.filter(pk=ds.id).update(inventory_generation=fingerprint, inventory_synced_at=synced_at)
+
+
+def _touch_inventory(ds: DataSource) -> int:
+    """
+    The cached inventory is the one already persisted: every VM it contains got
+    last_seen >= inventory_synced_at from that persist, so one UPDATE on the
+    (data_source, last_seen) index stands in for the whole upsert. Returns rows touched.
+    """
+    check_lease()
+    now = timezone.now()
+    with instrumentation.phase("persist"), transaction.atomic():
+        touched = VirtualMachine.objects.filter(
+            data_source_id=ds.id, last_seen__gte=ds.inventory_synced_at
+        ).update(last_seen=now)
+        _set_inventory(ds, ds.inventory_generation, now)
+    instrumentation.count("rows_unchanged", touched)
+    return touched
+
+
+def _fetch_cached(ds: DataSource, dirty: Set[int] | None = None, shard: dict | None = None) -> dict:
+    """
+    Persist a source's inventory through the API cache (cache_fill): replay a fresh or stale
+    cached inventory, wait for a concurrent fill, or fetch and fill it while persisting.
+    A stale inventory is refreshed by refresh_source_cache in the background.
+    Unsharded sources remember the fingerprint of the inventory they persisted last; a cached
+    inventory with that fingerprint only bumps last_seen and is marked unchanged (no re-scoring).
+    """
+    key = _source_cache_key(ds, shard)
+    with instrumentation.phase("cache"):
+        _, manifest, token = cache_fill.lookup(
+            key, ds.source_type, refresh=lambda token: refresh_source_cache.delay(ds.id, shard, token)
+        )
+    synced_at = timezone.now()
+    if manifest is not None:
+        fingerprint = manifest.get("fingerprint", "")
+        if shard is None and fingerprint and fingerprint == ds.inventory_generation and ds.inventory_synced_at:
+            instrumentation.record_cache(True)
+            count = _touch_inventory(ds)
+            return {"ok": True, "count": count, "unchanged": True, "message": f"{count} VMs (unchanged)"}
         try:
-            ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.STOR2RRD)
-        except DataSource.DoesNotExist:
-            return {"ok": False, "error": "DataSource not found", "count": 0}
-        config = _get_datasource_config(ds)
-        vms = Stor2RRDClient().get_vms(config)
-        cache.set(cache_key, json.dumps(_vms_to_cache_items(vms)), API_CACHE_TTL)
-    count = _update_vms_from_list(data_source_id, vms)
+            out = _persist_batches(ds.id, cache_fill.replay(key, manifest), dirty)
+        except (LookupError, ValueError):
+            # Chunks evicted (or unreadable) under a live manifest: fetch like a miss
+            token = cache_fill.acquire_fill(key)
+        else:
+            instrumentation.record_cache(True)
+            if shard is None:
+                _set_inventory(ds, fingerprint, synced_at)
+            return out
+    instrumentation.record_cache(False)
+    filled = {}
+    out = _persist_batches(ds.id, cache_fill.fill(key, _source_batches(ds, shard), token, filled.update), dirty)
+    if shard is None:
+        _set_inventory(ds, filled.get("fingerprint", ""), synced_at)
+    return out
+
+
+def _fetch_vcenter_impl(data_source_id: int, dirty: Set[int] | None = None) -> dict:
+    try:
+        ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.VCENTER)
+    except DataSource.DoesNotExist:
+        return {"ok": False, "error": "DataSource not found", "count": 0}
+    if (ds.config or {}).get("incremental_sync"):
+        # Rows are changed outside the API cache: no cached inventory matches them any more
+        _set_inventory(ds, "", None)
+        return _sync_vcenter_incremental(ds, dirty)
+    return _fetch_cached(ds, dirty)
+
+
+def _fetch_vcenter_shard_impl(data_source_id: int, shard: dict, dirty: Set[int] | None = None) -> dict:
+    """Collect one shard of a vCenter through a shard-local ContainerView; cached per shard."""
+    try:
+        ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.VCENTER)
+    except DataSource.DoesNotExist:
+        return {"ok": False, "error": "DataSource not found", "count": 0}
+    # Shards persist part of the source: the source-wide inventory fingerprint no longer applies
+    _set_inventory(ds, "", None)
+    try:
+        return _fetch_cached(ds, dirty, shard)
+    except Exception as e:
+        return {"ok": False, "error": f"vCenter shard {shard['name']} failed: {e}", "count": 0}
+
+
+def _vcenter_shards(ds: DataSource) -> List[dict]:
+    """Shards for a vCenter with config["shard_by"]; [] = scan unsharded (also if listing fails)."""
+    config = ds.config or {}
+    if ds.source_type != DataSource.SourceType.VCENTER or not config.get("shard_by") or config.get("incremental_sync"):
+        return []
+    return VCenterClient().list_shards(_get_datasource_config(ds)) or []
+
+
+def _fetch_aria_impl(data_source_id: int, dirty: Set[int] | None = None) -> dict:
+    # Aria inventories are cached and persisted page by page so memory stays at one page
+    try:
+        ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.ARIA)
+    except DataSource.DoesNotExist:
+        return {"ok": False, "error": "DataSource not found", "count": 0}
+    return _fetch_cached(ds, dirty)
+
+
+def _fetch_stor2rrd_impl(data_source_id: int, dirty: Set[int] | None = None) -> dict:
+    try:
+        ds = DataSource.objects.get(pk=data_source_id, source_type=DataSource.SourceType.STOR2RRD)
+    except DataSource.DoesNotExist:
+        return {"ok": False, "error": "DataSource not found", "count": 0}
+    return _fetch_cached(ds, dirty)
+
+
+@shared_task(bind=True, max_retries=REFRESH_MAX_RETRIES)
+def refresh_source_cache(self, data_source_id: int, shard: dict | None = None, token: str | None = None) -> dict:
+    """
+    Refill the API cache of a DataSource (or vCenter shard) that is being served stale.
+    Holds the fill lock (token) taken by cache_fill.lookup; persists nothing, the next scan
+    replays the fresh inventory. Fetches under the scan lock like any scan: while the scan
+    that served the stale entry holds it, the fill lock is given back (that scan may refill
+    the entry itself) and the task retries every REFRESH_RETRY_COUNTDOWN seconds. A retry
+    takes the fill lock again, unless the entry is fresh by then or another caller is filling.
+    """
+    try:
+        ds = DataSource.objects.get(pk=data_source_id)
+    except DataSource.DoesNotExist:
+        # The fill lock is left to expire (FILL_LOCK_TTL)
+        return {"ok": False, "error": "DataSource not found", "count": 0}
+    key = _source_cache_key(ds, shard)
+    if token is None and self.request.retries:
+        if cache_fill.is_fresh(key):
+            return {"ok": True, "count": 0, "fresh": True}
+        token = cache_fill.acquire_fill(key)
+        if token is None:
+            return {"ok": False, "error": "Cache is being filled by another caller", "count": 0}
+    lease = acquire_scan_lock(data_source_id, wait=0)
+    if lease is None:
+        cache_fill.release_fill(key, token)
+        if self.request.retries >= self.max_retries:
+            # A later lookup refills it (inline once the entry expires)
+            return _in_flight(data_source_id)
+        raise self.retry(args=[data_source_id, shard, None], countdown=REFRESH_RETRY_COUNTDOWN)
+    count = 0
+    try:
+        with lease.heartbeat():
+            for batch in cache_fill.fill(key, _source_batches(ds, shard), token):
+                count += len(batch)
+    finally:
+        lease.release()
     return {"ok": True, "count": count}
 
 
+def _in_flight(data_source_id: int) -> dict:
+    holder = current_holder(data_source_id) or {}
+    return {
+        "ok": False,
+        "error": "Scan already in progress",
+        "count": 0,
+        "scan_run_id": holder.get("scan_run_id"),
+    }
+
+
+def _locked_fetch(data_source_id: int, impl) -> dict:
+    """
+    Run a fetch implementation under the DataSource scan lock (single flight), then score what
+    it persisted like a scan's callback does, so a later unchanged replay never leaves those
+    rows unscored. The dashboard summary is recomputed if the inventory changed or VMs moved.
+    """
+    lease = acquire_scan_lock(data_source_id)
+    if lease is None:
+        return _in_flight(data_source_id)
+    dirty = None if window_enabled() else set()
+    item = {"data_source_id": data_source_id}
+    try:
+        with lease.heartbeat():
+            item["result"] = out = impl(data_source_id, dirty)
+            _detect(item, sorted(dirty or ()))
+    finally:
+        lease.release()
+    for key in ("detection_updated", "detection_error"):
+        if key in item:
+            out[key] = item[key]
+    if out.get("ok") and (not out.get("unchanged") or out.get("detection_updated")):
+        refresh_dashboard_summary()
+    return out
+
+
 @shared_task(bind=True)
 def fetch_vcenter_vms(self, data_source_id: int) -> dict:
     """Fetch VMs from a vCenter DataSource and sync to DB. Uses cache."""
-    return _fetch_vcenter_impl(data_source_id)
+    return _locked_fetch(data_source_id, _fetch_vcenter_impl)
 
 
 @shared_task(bind=True)
 def fetch_aria_vms(self, data_source_id: int) -> dict:
     """Fetch VMs from a VMware Aria DataSource and sync to DB."""
-    return _fetch_aria_impl(data_source_id)
+    return _locked_fetch(data_source_id, _fetch_aria_impl)
 
 
 @shared_task(bind=True)
 def fetch_stor2rrd_vms(self, data_source_id: int) -> dict:
     """Fetch VMs/clients from a Stor2RRD DataSource and sync to DB."""
-    return _fetch_stor2rrd_impl(data_source_id)
+    return _locked_fetch(data_source_id, _fetch_stor2rrd_impl)
+
+
+@shared_task(bind=True)
+def refresh_dashboard(self) -> dict:
+    """
+    Apply age transitions to every source and recompute the dashboard summary (Celery Beat):
+    VMs of sources that are not being scanned still age into missing / powered-off idle.
+    """
+    updated = apply_age_transitions()
+    summary = refresh_dashboard_summary()
+    return {"ok": True, "updated": updated, "computed_at": summary.computed_at.isoformat()}
+
+
+@shared_task(bind=True)
+def rollup_metric_history(self) -> dict:
+    """Roll raw (hourly) metric samples into daily aggregates and apply history retention."""
+    return _rollup_metric_history()
+
+
+def _fetch_source(ds: DataSource, dirty: Set[int]) -> dict:
+    """Fetch and persist one DataSource with the implementation for its type."""
+    if ds.source_type == DataSource.SourceType.VCENTER:
+        return _fetch_vcenter_impl(ds.id, dirty)
+    if ds.source_type == DataSource.SourceType.ARIA:
+        return _fetch_aria_impl(ds.id, dirty)
+    if ds.source_type == DataSource.SourceType.STOR2RRD:
+        return _fetch_stor2rrd_impl(ds.id, dirty)
+    return {"ok": False, "error": f"Unknown source type {ds.source_type}", "count": 0}
+
+
+# ScanRun columns filled from instrumentation counters of the same name
+_COUNTER_FIELDS = (
+    "rows_created", "rows_updated", "rows_unchanged", "api_calls", "bytes_received", "perf_errors",
+    "full_syncs", "incremental_syncs",
+)
+# ScanRun counters summed from the shards into the parent run of a sharded scan
+_STATS_SUM_FIELDS = [f"{name}_seconds" for name in instrumentation.PHASES if name != "detect"] + list(_COUNTER_FIELDS)
+
+
+def _stats_fields(stats: instrumentation.ScanStats | None) -> dict:
+    """ScanRun column values for a collector (phases that did not run count as 0 s); {} without one."""
+    if stats is None:
+        return {}
+    fields = {
+        f"{name}_seconds": round(stats.phases.get(name, 0.0), 3)
+        for name in instrumentation.PHASES
+        if name != "detect"
+    }
+    for name in _COUNTER_FIELDS:
+        fields[name] = stats.counters.get(name, 0)
+    fields["cache_hit"] = stats.cache_hit
+    return fields
+
+
+def _run_scan_step(scan_run_id: int, lease: dict | None, fetch) -> dict:
+    """
+    Run fetch(ds, dirty) for a ScanRun under the lease heartbeat and record its outcome.
+    Persistence stops with LeaseLost once the lease is gone; afterwards the lease is handed
+    over to finish_scan (queue TTL) whatever the outcome. Under a Rule B window detection
+    re-scores the whole source, so no dirty pks are collected or sent to the callback.
+    """
+    scan_run = ScanRun.objects.select_related("data_source").get(pk=scan_run_id)
+    ds = scan_run.data_source
+    scan_run.status = ScanRun.Status.RUNNING
+    scan_run.save(update_fields=["status", "updated_at"])
+    dirty = None if window_enabled() else set()
+    held = ScanLease.from_dict(lease) if lease else None
+    # Unbound if entering the heartbeat or the collector fails
+    stats = None
+    try:
+        with held.heartbeat() if held else nullcontext(), instrumentation.collect_stats() as stats:
+            out = fetch(ds, dirty)
+        scan_run.status = ScanRun.Status.SUCCESS if out.get("ok") else ScanRun.Status.FAILED
+        scan_run.message = out.get("message", str(out.get("count", 0)) + " VMs" if out.get("ok") else out.get("error", ""))
+    except Exception as e:
+        scan_run.status = ScanRun.Status.FAILED
+        scan_run.message = str(e)
+        out = {"ok": False, "error": str(e)}
+    fields = _stats_fields(stats)
+    for name, value in fields.items():
+        setattr(scan_run, name, value)
+    scan_run.finished_at = timezone.now()
+    scan_run.save(update_fields=["status", "message", "finished_at", "updated_at", *fields])
+    if held is not None:
+        held.hand_over()
+    return {
+        "data_source_id": ds.id,
+        "scan_run_id": scan_run.id,
+        "parent_scan_run_id": scan_run.parent_id,
+        "result": out,
+        "dirty": sorted(dirty or ()),
+        "lease": lease,
+    }
+
+
+@shared_task(bind=True)
+def scan_data_source(self, scan_run_id: int, lease: dict | None = None) -> dict:
+    """
+    Chord header task: fetch one DataSource and finish its ScanRun, renewing the scan lease
+    taken by run_scan. Returns the ids of VMs created/changed (none under a Rule B window)
+    and the lease, so the chord callback can run detection on them and release the lock.
+    """
+    return _run_scan_step(scan_run_id, lease, _fetch_source)
+
+
+@shared_task(bind=True)
+def scan_vcenter_shard(self, scan_run_id: int, shard: dict, lease: dict | None = None) -> dict:
+    """Chord header task for one shard of a sharded vCenter scan (child ScanRun); see scan_data_source."""
+    out = _run_scan_step(scan_run_id, lease, lambda ds, dirty: _fetch_vcenter_shard_impl(ds.id, shard, dirty))
+    out["shard"] = shard["name"]
+    return out
+
+
+def _merge_shards(parent_id: int, items: list) -> dict:
+    """
+    Fold the shard results of one source into a single chord item and finish the parent ScanRun.
+    Age transitions (missing, powered-off idle) need the whole source: they only run when
+    every shard succeeded, otherwise VMs of a failed shard would age into missing.
+    """
+    failed = [item["shard"] for item in items if not item["result"].get("ok")]
+    # Parent instrumentation: shard counters and phase seconds (worker time, not wall time) summed
+    shards = list(ScanRun.objects.filter(parent_id=parent_id).values(*_STATS_SUM_FIELDS, "cache_hit"))
+    totals = {name: sum(shard[name] or 0 for shard in shards) for name in _STATS_SUM_FIELDS}
+    hits = [shard["cache_hit"] for shard in shards if shard["cache_hit"] is not None]
+    ScanRun.objects.filter(pk=parent_id).update(
+        status=ScanRun.Status.FAILED if failed else ScanRun.Status.SUCCESS,
+        message=f"{len(failed)}/{len(items)} shards failed: {', '.join(failed)}" if failed else f"{len(items)} shards",
+        finished_at=timezone.now(),
+        cache_hit=all(hits) if hits else None,
+        **totals,
+    )
+    return {
+        "data_source_id": items[0]["data_source_id"],
+        "scan_run_id": parent_id,
+        "result": {
+            "ok": len(failed) < len(items),
+            "count": sum(item["result"].get("count", 0) for item in items),
+            "failed_shards": failed,
+        },
+        "shards": [{"scan_run_id": item["scan_run_id"], "shard": item["shard"], "result": item["result"]} for item in items],
+        "dirty": sorted({pk for item in items for pk in item["dirty"]}),
+        "lease": items[0]["lease"],
+        "age_transitions": not failed,
+    }
+
+
+def _detect(item: dict, dirty: list) -> None:
+    age_transitions = item.pop("age_transitions", True)
+    if not item["result"].get("ok"):
+        return
+    if item["result"].get("unchanged"):
+        # Unchanged inventory: nothing to re-score, but rows still age into missing/Rule A
+        dirty = []
+    try:
+        # Re-score VMs this fetch created or changed (the whole source under a Rule B window), plus age transitions
+        with instrumentation.phase("detect"):
+            item["detection_updated"] = run_detection(
+                data_source_id=item["data_source_id"], vm_ids=dirty, age_transitions=age_transitions
+            )
+    except Exception as e:
+        item["detection_error"] = str(e)
+
+
+@shared_task(bind=True)
+def finish_scan(self, results: list) -> dict:
+    """
+    Chord callback: merge the shards of sharded sources, run idle detection for every
+    source that fetched successfully (and still holds its scan lock), then release the lock
+    and record how long it was held.
+    The dashboard summary is recomputed once at the end if any source changed or had VMs
+    age into another state.
+    """
+    groups = {}
+    for item in results:
+        groups.setdefault(item.pop("parent_scan_run_id", None) or item["scan_run_id"], []).append(item)
+    results = [
+        _merge_shards(scan_run_id, items) if "shard" in items[0] else items[0]
+        for scan_run_id, items in groups.items()
+    ]
+    for item in results:
+        dirty = item.pop("dirty", [])
+        lease = item.pop("lease", None)
+        lease = ScanLease.from_dict(lease) if lease else None
+        fields = {}
+        try:
+            with lease.heartbeat() if lease else nullcontext(), instrumentation.collect_stats() as stats:
+                if lease is None or lease.renew():
+                    _detect(item, dirty)
+                else:
+                    # Another scan owns the source now: its own callback scores what it wrote
+                    item.pop("age_transitions", None)
+                    item["detection_error"] = "Scan lock was lost before detection"
+            if "detect" in stats.phases:
+                fields["detect_seconds"] = round(stats.phases["detect"], 3)
+        finally:
+            if lease is not None:
+                fields["lock_hold_seconds"] = lease.release()
+            if fields:
+                ScanRun.objects.filter(pk=item["scan_run_id"]).update(**fields)
+    if any(
+        item["result"].get("ok") and (not item["result"].get("unchanged") or item.get("detection_updated"))
+        for item in results
+    ):
+        refresh_dashboard_summary()
+    return {"ok": True, "results": results}
+
+
+def _source_header(ds: DataSource, scan_run: ScanRun, lease: dict) -> list:
+    """Chord header signatures for one source: one per shard (with child ScanRuns) or a single one."""
+    shards = _vcenter_shards(ds)
+    if not shards:
+        signature = scan_data_source.s(scan_run.id, lease)
+        incremental = ds.source_type == DataSource.SourceType.VCENTER and (ds.config or {}).get("incremental_sync")
+        if SCAN_SYNC_QUEUE and incremental:
+            # Land every scan in the process that holds the source's collector and version
+            signature = signature.set(queue=SCAN_SYNC_QUEUE)
+        return [signature]
+    scan_run.status = ScanRun.Status.RUNNING
+    scan_run.save(update_fields=["status", "updated_at"])
+    children = ScanRun.objects.bulk_create([
+        ScanRun(
+            data_source=ds, parent=scan_run, shard=shard["name"],
+            status=ScanRun.Status.PENDING, started_at=scan_run.started_at,
+        )
+        for shard in shards
+    ])
+    return [scan_vcenter_shard.s(child.id, shard, lease) for child, shard in zip(children, shards)]
 
 
 @shared_task(bind=True)
 def run_scan(self, data_source_id: int | None = None) -> dict:
     """
-    Orchestrate a full scan: optionally for one DataSource or all enabled.
-    Creates a ScanRun per source (or one global if data_source_id is None and we run all).
+    Orchestrate a scan: optionally for one DataSource or all enabled.
+    Creates a ScanRun per source and fans out one scan_data_source subtask per source as a
+    Celery chord, so sources are fetched in parallel; finish_scan aggregates the results
+    and runs detection. Returns the chord id and ScanRun ids without waiting.
+    A vCenter with config["shard_by"] gets one scan_vcenter_shard subtask and child ScanRun
+    per shard instead.
+    A source whose scan lock is held is not scanned again: its in-flight ScanRun id is
+    returned under "joined".
     """
     now = timezone.now()
     if data_source_id is not None:
@@ -197,32 +617,33 @@ def run_scan(self, data_source_id: int | None = None) -> dict:
     else:
         sources = list(DataSource.objects.filter(is_enabled=True))
 
-    results = []
+    header = []
+    leases = []
+    scan_run_ids = []
+    joined = []
     for ds in sources:
+        # Queue TTL: nothing renews the lease until a worker picks up the header task
+        lease = acquire_scan_lock(ds.id, ttl=SCAN_LOCK_QUEUE_TTL)
+        if lease is None:
+            joined.append({"data_source_id": ds.id, "scan_run_id": _in_flight(ds.id)["scan_run_id"]})
+            continue
         scan_run = ScanRun.objects.create(
-            data_source=ds,
-            status=ScanRun.Status.RUNNING,
-            started_at=now,
+            data_source=ds, status=ScanRun.Status.PENDING, started_at=now, lock_wait_seconds=lease.waited
         )
-        try:
-            if ds.source_type == DataSource.SourceType.VCENTER:
-                out = _fetch_vcenter_impl(ds.id)
-            elif ds.source_type == DataSource.SourceType.ARIA:
-                out = _fetch_aria_impl(ds.id)
-            elif ds.source_type == DataSource.SourceType.STOR2RRD:
-                out = _fetch_stor2rrd_impl(ds.id)
-            else:
-                out = {"ok": False, "error": f"Unknown source type {ds.source_type}", "count": 0}
-            scan_run.finished_at = timezone.now()
-            scan_run.status = ScanRun.Status.SUCCESS if out.get("ok") else ScanRun.Status.FAILED
-            scan_run.message = out.get("message", str(out.get("count", 0)) + " VMs" if out.get("ok") else out.get("error", ""))
-        except Exception as e:
-            scan_run.finished_at = timezone.now()
-            scan_run.status = ScanRun.Status.FAILED
-            scan_run.message = str(e)
-            out = {"ok": False, "error": str(e)}
-        # Run idle detection on this source's VMs after fetch
-        if out.get("ok"):
-            run_detection(data_source_id=ds.id)
-        results.append({"data_source_id": ds.id, "scan_run_id": scan_run.id, "result": out})
-    return {"ok": True, "results": results}
+        lease.attach(scan_run.id, SCAN_LOCK_QUEUE_TTL)
+        header += _source_header(ds, scan_run, lease.to_dict())
+        leases.append(lease)
+        scan_run_ids.append(scan_run.id)
+    if not header:
+        return {"ok": True, "scan_run_ids": [], "joined": joined}
+    try:
+        result = chord(header)(finish_scan.s())
+    except Exception as e:
+        # Nothing was queued: free the sources for the next trigger
+        for lease in leases:
+            lease.release()
+        ScanRun.objects.filter(Q(pk__in=scan_run_ids) | Q(parent_id__in=scan_run_ids)).update(
+            status=ScanRun.Status.FAILED, finished_at=timezone.now(), message=str(e)
+        )
+        raise
+    return {"ok": True, "chord_id": result.id, "scan_run_ids": scan_run_ids, "joined": joined}
@@ -1,15 +1,12 @@
 # apps.web.views - Secure enterprise dashboard (NOC / Command Center)
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from django.db.models import Q
 from django.shortcuts import render
 
-from apps.scans.models import DataSource, VirtualMachine
+from apps.scans.models import VirtualMachine
+from apps.scans.summary import dashboard_summary
 
-# Idle threshold for "Idle/Zombie" count
-IDLE_ZOMBIE_THRESHOLD = 0.7
-# For donut: "Idle" = score >= 0.5; "Active" = score < 0.5 or None
-IDLE_FOR_CHART = 0.5
 # Data grid
 PAGE_SIZE = 20
 STATUS_ZOMBIE = "zombie"   # idle_score >= 0.8
@@ -32,40 +29,9 @@ DEFAULT_SORT_DIR = "desc"
 def dashboard(request):
     """
     NOC-style dashboard: KPIs, charts, VM data grid with search, filter, pagination.
+    KPIs and charts come from the snapshot refreshed after each scan (one lookup).
     """
-    # KPI: Total VMs
-    total_vms = VirtualMachine.objects.count()
-
-    # KPI: Idle/Zombie VMs (idle_score > 0.7)
-    idle_vms_qs = VirtualMachine.objects.filter(idle_score__gt=IDLE_ZOMBIE_THRESHOLD)
-    idle_zombie_count = idle_vms_qs.count()
-
-    # KPI: Potential savings
-    savings_vcpu = 0
-    savings_ram_mb = 0
-    for vm in idle_vms_qs.only("metadata"):
-        meta = vm.metadata or {}
-        savings_vcpu += meta.get("numCpu") or 0
-        savings_ram_mb += meta.get("memorySizeMB") or 0
-    savings_ram_gb = round(savings_ram_mb / 1024.0, 1)
-
-    # Chart A (Donut)
-    active_count = VirtualMachine.objects.filter(
-        Q(idle_score__lt=IDLE_FOR_CHART) | Q(idle_score__isnull=True)
-    ).count()
-    idle_for_donut = VirtualMachine.objects.filter(idle_score__gte=IDLE_FOR_CHART).count()
-    chart_efficiency = {"active": active_count, "idle": idle_for_donut}
-
-    # Chart B (Bar)
-    top_sources_idle = (
-        DataSource.objects.annotate(
-            idle_count=Count("virtual_machines", filter=Q(virtual_machines__idle_score__gt=IDLE_ZOMBIE_THRESHOLD))
-        )
-        .filter(idle_count__gt=0)
-        .order_by("-idle_count")[:5]
-        .values_list("name", "idle_count")
-    )
-    chart_clusters = [{"label": name, "count": count} for name, count in top_sources_idle]
+    summary = dashboard_summary()
 
     # VM data grid: search, filter, order, paginate
     q = (request.GET.get("q") or "").strip()
@@ -122,12 +88,15 @@ def dashboard(request):
     base_query_suffix = query_params_no_sort.urlencode()
 
     context = {
-        "total_vms": total_vms,
-        "idle_zombie_count": idle_zombie_count,
-        "savings_vcpu": savings_vcpu,
-        "savings_ram_gb": savings_ram_gb,
-        "chart_efficiency": chart_efficiency,
-        "chart_clusters": chart_clusters,
+        "total_vms": summary.total_vms,
+        "idle_zombie_count": summary.idle_zombie_count,
+        "savings_vcpu": summary.savings_vcpu,
+        "savings_ram_gb": round(summary.savings_ram_mb / 1024.0, 1),
+        "savings_disk_gb": summary.savings_disk_gb,
+        "savings_by_source": summary.savings_by_source,
+        "chart_efficiency": {"active": summary.active_count, "idle": summary.idle_count},
+        "chart_clusters": summary.top_sources,
+        "summary_computed_at": summary.computed_at,
         "page_obj": page_obj,
         "current_q": q,
         "current_status": status,
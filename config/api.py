@@ -7,6 +7,7 @@ from rest_framework.pagination import PageNumberPagination
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+from apps.scans import cache_fill
 from apps.scans.models import VirtualMachine, DataSource
 
 
@@ -91,6 +92,48 @@ def api_vm_detail(request, pk):
     })
 
 
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter(
+            "metric",
+            openapi.IN_QUERY,
+            description="cpu_usage_percent (default), network_usage_kbps or disk_usage_iops",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter("days", openapi.IN_QUERY, description="Window in days (default 7)", type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: "OK", 400: "Bad request", 404: "Not found"},
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def api_vm_metrics(request, pk):
+    """Metric history of one VM for charts (rollup resolution chosen from the window)."""
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from apps.scans.metrics import METRIC_FIELDS, metric_series
+
+    metric = request.query_params.get("metric") or "cpu_usage_percent"
+    if metric not in METRIC_FIELDS:
+        return Response({"detail": "Unknown metric."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        days = max(1, min(int(request.query_params.get("days") or 7), 400))
+    except ValueError:
+        return Response({"detail": "days must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    if not VirtualMachine.objects.filter(pk=pk).exists():
+        return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    now = timezone.now()
+    resolution, points = metric_series(pk, metric, now - timedelta(days=days), now)
+    return Response({
+        "id": pk,
+        "metric": metric,
+        "resolution": resolution,
+        "points": [{"t": t.isoformat(), "value": value} for t, value in points],
+    })
+
+
 @swagger_auto_schema(method="get")
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -98,3 +141,11 @@ def api_data_sources(request):
     """List data sources (vCenter, Aria, Stor2RRD)."""
     sources = DataSource.objects.filter(is_enabled=True).values("id", "name", "source_type")
     return Response(list(sources))
+
+
+@swagger_auto_schema(method="get", responses={200: "OK"})
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def api_cache_stats(request):
+    """Source API cache outcomes (hit, stale, miss, early, waited) per source type."""
+    return Response(cache_fill.counters(DataSource.SourceType.values))
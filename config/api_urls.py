@@ -1,11 +1,13 @@
 # API URL configuration
 from django.urls import path
-from .api import api_health, api_vm_list, api_vm_detail, api_data_sources
+from .api import api_health, api_vm_list, api_vm_detail, api_vm_metrics, api_data_sources, api_cache_stats
 
 app_name = "api"
 urlpatterns = [
     path("health/", api_health, name="health"),
     path("vms/", api_vm_list, name="vm-list"),
     path("vms/<int:pk>/", api_vm_detail, name="vm-detail"),
+    path("vms/<int:pk>/metrics/", api_vm_metrics, name="vm-metrics"),
     path("data-sources/", api_data_sources, name="data-sources"),
+    path("cache-stats/", api_cache_stats, name="cache-stats"),
 ]
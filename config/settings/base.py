@@ -165,6 +165,29 @@ CACHES = {
     }
 }
 
+# Scans: persistence, per-source scan lock and source API cache
+# Rows per bulk upsert statement
+SCAN_UPSERT_CHUNK_SIZE = env.int("SCAN_UPSERT_CHUNK_SIZE", default=1000)
+# Per-DataSource scan lock (cache lease): lifetime without heartbeat, and how long a duplicate trigger waits
+SCAN_LOCK_TTL = env.int("SCAN_LOCK_TTL", default=300)
+SCAN_LOCK_WAIT = env.float("SCAN_LOCK_WAIT", default=0)
+SCAN_LOCK_QUEUE_TTL = env.int("SCAN_LOCK_QUEUE_TTL", default=3600)  # lease lifetime while the scan's tasks are queued
+# Source API cache: seconds fresh, seconds served stale during a background refresh, wait for another filler
+API_CACHE_TTL = env.int("API_CACHE_TTL", default=300)
+API_CACHE_STALE_TTL = env.int("API_CACHE_STALE_TTL", default=300)
+API_CACHE_FILL_WAIT = env.float("API_CACHE_FILL_WAIT", default=30)
+# Celery queue for incremental_sync vCenter scans; consume it with a single worker process
+SCAN_SYNC_QUEUE = env("SCAN_SYNC_QUEUE", default="")
+
+# Idle scoring: engine and Rule B window (thresholds are under Idle detection below)
+IDLE_SCORING_ENGINE = env("IDLE_SCORING_ENGINE", default="sql")  # sql (one UPDATE per source), numpy (weighted curves) or python
+RULE_B_WINDOW_DAYS = env.int("RULE_B_WINDOW_DAYS", default=7)  # Rule B over N days of metric history (0 = snapshot)
+RULE_B_AGGREGATE = env("RULE_B_AGGREGATE", default="avg")  # avg or p95 (p95 on PostgreSQL only)
+
+# Metric history: raw samples (the hourly tier), then daily rollups
+METRIC_RAW_RETENTION_DAYS = env.int("METRIC_RAW_RETENTION_DAYS", default=30)  # keep >= RULE_B_WINDOW_DAYS
+METRIC_DAILY_RETENTION_DAYS = env.int("METRIC_DAILY_RETENTION_DAYS", default=400)
+
 # CSRF (set in production/docker if needed)
 CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS", default=[])
 
@@ -16,3 +16,23 @@ def test_api_vm_list_requires_auth(client):
     """VM list endpoint requires authentication."""
     response = client.get("/api/vms/")
     assert response.status_code in (401, 403)
+
+
+@pytest.mark.django_db
+def test_api_vm_metrics_returns_history_points(client):
+    """Metric history endpoint returns raw points when nothing has been rolled up yet."""
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+
+    from apps.scans.metrics import record_samples
+    from apps.scans.models import DataSource, VirtualMachine
+
+    ds = DataSource.objects.create(name="vc", source_type=DataSource.SourceType.VCENTER)
+    vm = VirtualMachine.objects.create(data_source=ds, name="vm", uuid="u-1")
+    record_samples([(vm.pk, 3.0, None, None)], timezone.now())
+    client.force_login(get_user_model().objects.create_user("viewer", password="x"))
+
+    data = client.get(f"/api/vms/{vm.pk}/metrics/?days=2").json()
+    assert data["resolution"] == "raw"
+    assert [p["value"] for p in data["points"]] == [3.0]
+    assert client.get(f"/api/vms/{vm.pk}/metrics/?metric=memory").status_code == 400
@@ -0,0 +1,221 @@
+# Tests for apps.scans.detection (idle scoring engines)
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from apps.scans import detection
+from apps.scans.models import DataSource, VirtualMachine
+
+
+@pytest.fixture
+def inventory(db):
+    """VMs covering every rule branch, with ages an hour away from each day boundary."""
+    now = timezone.now()
+    hour = timedelta(hours=1)
+    days = lambda n: timedelta(days=n)  # noqa: E731
+    ds = DataSource.objects.create(name="vc", source_type=DataSource.SourceType.VCENTER)
+    rows = [
+        dict(last_seen=None, power_state="poweredOn"),
+        dict(last_seen=now - days(7) - hour, power_state="poweredOn", cpu_usage_percent=90.0),
+        dict(last_seen=now - days(7) + hour, power_state="poweredOn", cpu_usage_percent=1.0),
+        dict(last_seen=now, power_state="poweredOff", last_boot_time=now - days(31) - hour),
+        dict(last_seen=now, power_state=" PoweredOff ", last_boot_time=now - days(31) + hour),
+        dict(last_seen=now, power_state="poweredOff"),
+        dict(last_seen=now, power_state="poweredOn", cpu_usage_percent=1.0, network_usage_kbps=0.5,
+             disk_usage_iops=1.0),
+        dict(last_seen=now, power_state="poweredOn", cpu_usage_percent=1.0, network_usage_kbps=0.5),
+        dict(last_seen=now, power_state="poweredOn", network_usage_kbps=0.5, disk_usage_iops=1.0,
+             cpu_usage_percent=50.0),
+        dict(last_seen=now, power_state="poweredOn", cpu_usage_percent=1.0),
+        dict(last_seen=now, power_state="poweredOn"),
+        dict(last_seen=now, power_state="suspended", cpu_usage_percent=0.0),
+        dict(last_seen=now, power_state="", idle_score=0.0, status=VirtualMachine.VMStatus.ACTIVE),
+    ]
+    for i, row in enumerate(rows):
+        VirtualMachine.objects.create(data_source=ds, name=f"vm{i}", uuid=f"u-{i}", **row)
+    return ds
+
+
+def _scores():
+    return dict(VirtualMachine.objects.values_list("uuid", "idle_score").order_by("uuid")), dict(
+        VirtualMachine.objects.values_list("uuid", "status").order_by("uuid")
+    )
+
+
+def test_sql_engine_matches_python_engine(inventory):
+    assert detection.compute_idle_scores_sql() == 12
+    sql_result = _scores()
+    VirtualMachine.objects.update(idle_score=None, status=VirtualMachine.VMStatus.ACTIVE)
+    detection.compute_idle_scores()
+    assert _scores() == sql_result
+    scores, statuses = sql_result
+    assert statuses["u-0"] == statuses["u-1"] == VirtualMachine.VMStatus.MISSING
+    assert statuses["u-3"] == statuses["u-6"] == VirtualMachine.VMStatus.IDLE
+    assert scores["u-9"] == 0.4 and statuses["u-9"] == VirtualMachine.VMStatus.ACTIVE
+
+
+def test_sql_engine_only_updates_changed_rows(inventory):
+    detection.compute_idle_scores_sql()
+    assert detection.compute_idle_scores_sql() == 0
+    VirtualMachine.objects.filter(uuid="u-10").update(cpu_usage_percent=0.5)
+    assert detection.run_detection(data_source_id=inventory.id) == 1
+
+
+def test_numpy_engine_scores_continuous_curves(inventory):
+    scoring = pytest.importorskip("apps.scans.scoring")
+    if not scoring.NUMPY_AVAILABLE:
+        pytest.skip("numpy not installed")
+    assert scoring.compute_idle_scores_numpy() == 12
+    scores, statuses = _scores()
+    assert statuses["u-0"] == statuses["u-1"] == VirtualMachine.VMStatus.MISSING
+    assert scores["u-3"] == 1.0 and statuses["u-3"] == VirtualMachine.VMStatus.IDLE
+    # All three metrics well under their thresholds: close to the full weight
+    assert scores["u-6"] > 0.9 and statuses["u-6"] == VirtualMachine.VMStatus.IDLE
+    # CPU busy, network/disk quiet: only their weights count
+    assert 0.4 < scores["u-8"] < 0.5 and statuses["u-8"] == VirtualMachine.VMStatus.ACTIVE
+    assert scores["u-10"] == 0.0 and scores["u-11"] == 0.0
+    assert scoring.compute_idle_scores_numpy() == 0
+
+
+def test_incremental_detection_scores_dirty_rows_and_aged_rows(inventory, monkeypatch):
+    from apps.scans import metrics
+
+    # Snapshot scoring: only dirty rows can change score
+    monkeypatch.setattr(metrics, "RULE_B_WINDOW_DAYS", 0)
+    detection.run_detection(data_source_id=inventory.id)
+    stale = timezone.now() - timedelta(days=8)
+    VirtualMachine.objects.filter(uuid="u-10").update(cpu_usage_percent=0.5)  # changed, dirty
+    VirtualMachine.objects.filter(uuid="u-11").update(cpu_usage_percent=0.5, power_state="poweredOn")  # not dirty
+    VirtualMachine.objects.filter(uuid="u-7").update(last_seen=stale)  # aged out
+    dirty = VirtualMachine.objects.filter(uuid="u-10").values_list("pk", flat=True)
+
+    assert detection.run_detection(data_source_id=inventory.id, vm_ids=dirty) == 2
+    scores, statuses = _scores()
+    assert scores["u-10"] == 0.4
+    assert statuses["u-7"] == VirtualMachine.VMStatus.MISSING
+    assert scores["u-11"] == 0.0
+
+
+def test_window_scores_move_when_only_samples_change(inventory):
+    from django.db.models import F
+
+    from apps.scans.metrics import record_samples
+    from apps.scans.models import VMMetricSample
+
+    vm = VirtualMachine.objects.get(uuid="u-10")
+    now = timezone.now()
+    VirtualMachine.objects.filter(pk=vm.pk).update(cpu_usage_percent=1.0)
+    record_samples([(vm.pk, 1.0, None, None)], now)
+    for hours in range(1, 5):
+        record_samples([(vm.pk, 80.0, None, None)], now - timedelta(hours=hours))
+    detection.run_detection(data_source_id=inventory.id)
+    assert VirtualMachine.objects.get(pk=vm.pk).idle_score == 0.0
+
+    # Same columns (no dirty rows), but the busy hours left the window
+    VMMetricSample.objects.filter(vm=vm, cpu_usage_percent=80.0).update(
+        sampled_at=F("sampled_at") - timedelta(days=10)
+    )
+    detection.run_detection(data_source_id=inventory.id, vm_ids=[])
+    assert VirtualMachine.objects.get(pk=vm.pk).idle_score == 0.4
+
+
+def test_rule_b_uses_window_average_from_metric_history(inventory):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from apps.scans.metrics import record_samples
+
+    vm = VirtualMachine.objects.get(uuid="u-10")
+    now = timezone.now()
+    # Busy snapshot, but the last days were quiet on average
+    vm.cpu_usage_percent = 60.0
+    vm.save(update_fields=["cpu_usage_percent"])
+    for hours in (1, 2, 3, 4):
+        record_samples([(vm.pk, 0.0 if hours > 1 else 16.0, None, None)], now - timedelta(hours=hours))
+    record_samples([(vm.pk, 90.0, None, None)], now - timedelta(days=10))  # outside the window
+
+    with CaptureQueriesContext(connection) as queries:
+        detection.compute_idle_scores_sql()
+    # The window is aggregated by one statement into the window columns; scoring reads those
+    assert sum("scans_vmmetricsample" in query["sql"] for query in queries.captured_queries) == 1
+    vm.refresh_from_db()
+    assert vm.window_cpu_usage_percent == 4.0
+    sql_score = vm.idle_score
+    VirtualMachine.objects.update(idle_score=None)
+    detection.compute_idle_scores()
+    assert VirtualMachine.objects.get(pk=vm.pk).idle_score == sql_score == 0.4
+
+
+def test_rollups_advance_watermark_and_feed_window_queries(inventory, monkeypatch):
+    from apps.scans import metrics, rollups
+    from apps.scans.metrics import metric_series, record_samples, window_aggregates
+    from apps.scans.models import VMMetricRollup, VMMetricSample
+
+    vm = VirtualMachine.objects.get(uuid="u-6")
+    now = timezone.now()
+    for hours in range(1, 73):
+        record_samples([(vm.pk, float(hours % 4), 0.5, None)], now - timedelta(hours=hours))
+    before = window_aggregates(now, vm_id=vm.pk)[vm.pk]
+
+    monkeypatch.setattr(rollups, "RAW_RETENTION_DAYS", 1)
+    # Read the 7-day window from daily rollups once they exist
+    monkeypatch.setattr(metrics, "WINDOW_MIN_BUCKETS", 2)
+    result = rollups.rollup_metric_history(now)
+    days = VMMetricRollup.objects.filter(vm=vm, resolution="day").count()
+    assert result["rolled_up"] == {"day": days} and days >= 3
+    assert result["deleted"]["raw"] > 0
+    assert VMMetricSample.objects.filter(vm=vm).count() < 72
+    # Second run finds nothing new: each bucket is rolled up once
+    assert rollups.rollup_metric_history(now)["rolled_up"] == {"day": 0}
+
+    after = window_aggregates(now, vm_id=vm.pk)[vm.pk]
+    assert after["cpu_usage_percent"] == pytest.approx(before["cpu_usage_percent"])
+    assert after["network_usage_kbps"] == pytest.approx(0.5)
+    resolution, points = metric_series(vm.pk, "cpu_usage_percent", now - timedelta(days=3, hours=1), now)
+    assert resolution == "day" and len(points) >= 3
+    # Both engines read the same rollup + raw window
+    detection.compute_idle_scores_sql()
+    sql_score = VirtualMachine.objects.get(pk=vm.pk).idle_score
+    VirtualMachine.objects.update(idle_score=None)
+    detection.compute_idle_scores()
+    assert VirtualMachine.objects.get(pk=vm.pk).idle_score == sql_score
+
+
+def test_late_sample_reopens_its_rolled_up_day(inventory):
+    from apps.scans import rollups
+    from apps.scans.metrics import bucket_start, get_watermarks, record_samples
+    from apps.scans.models import VMMetricRollup
+
+    vm = VirtualMachine.objects.get(uuid="u-6")
+    now = timezone.now()
+    yesterday = bucket_start(now, "day") - timedelta(days=1)
+    record_samples([(vm.pk, 10.0, None, None)], yesterday + timedelta(hours=1))
+    rollups.rollup_metric_history(now)
+    assert get_watermarks()["day"] == bucket_start(now, "day")
+
+    # A scan that started before the rollup writes into the day it already aggregated
+    record_samples([(vm.pk, 20.0, None, None)], yesterday + timedelta(hours=23))
+    assert get_watermarks()["day"] == yesterday
+    rollups.rollup_metric_history(now)
+    day = VMMetricRollup.objects.get(vm=vm, resolution="day", bucket=yesterday)
+    assert day.sample_count == 2 and day.cpu_usage_percent_avg == pytest.approx(15.0)
+
+
+def test_numpy_engine_reads_window_aggregates_and_falls_back_to_snapshots(inventory):
+    scoring = pytest.importorskip("apps.scans.scoring")
+    if not scoring.NUMPY_AVAILABLE:
+        pytest.skip("numpy not installed")
+    from apps.scans.metrics import record_samples
+
+    vm = VirtualMachine.objects.get(uuid="u-10")
+    VirtualMachine.objects.filter(pk=vm.pk).update(cpu_usage_percent=60.0)
+    now = timezone.now()
+    for hours in (1, 2, 3, 4):
+        record_samples([(vm.pk, 0.0 if hours > 1 else 16.0, None, None)], now - timedelta(hours=hours))
+
+    scoring.compute_idle_scores_numpy(now=now)
+    scores, _ = _scores()
+    # Window average 4.0 instead of the busy snapshot; u-9 has no history and keeps its 1.0 snapshot
+    assert scores["u-10"] == round(scoring.CPU_WEIGHT / (1 + (4.0 / detection.CPU_IDLE_PERCENT) ** scoring.CURVE_STEEPNESS), 4)
+    assert scores["u-9"] == round(scoring.CPU_WEIGHT / (1 + (1.0 / detection.CPU_IDLE_PERCENT) ** scoring.CURVE_STEEPNESS), 4)
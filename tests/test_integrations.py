@@ -0,0 +1,509 @@
+# Tests for apps.integrations (vCenter, Aria, Stor2RRD clients)
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from apps.integrations import vcenter
+from apps.integrations.base import VMInfo
+
+requires_pyvmomi = pytest.mark.skipif(not vcenter.PYVMOMI_AVAILABLE, reason="pyvmomi not installed")
+
+
+def _obj_content(moid, props):
+    return SimpleNamespace(
+        obj=SimpleNamespace(_moId=moid),
+        propSet=[SimpleNamespace(name=k, val=v) for k, v in props.items()],
+    )
+
+
+class FakePropertyCollector:
+    """Serves VM properties in pages like RetrievePropertiesEx / ContinueRetrievePropertiesEx."""
+
+    def __init__(self, objects, page_size):
+        self.pages = [objects[i:i + page_size] for i in range(0, len(objects), page_size)]
+        self.calls = 0
+
+    def _page(self, index):
+        self.calls += 1
+        token = str(index + 1) if index + 1 < len(self.pages) else None
+        return SimpleNamespace(objects=self.pages[index], token=token)
+
+    def RetrievePropertiesEx(self, specs, options):
+        return self._page(0)
+
+    def ContinueRetrievePropertiesEx(self, token):
+        return self._page(int(token))
+
+
+@requires_pyvmomi
+def test_vm_info_from_props_maps_quickstats_and_boot_time():
+    boot = datetime.now(timezone.utc) - timedelta(days=2)
+    info = vcenter._vm_info_from_props("vm-42", {
+        "name": "web-01",
+        "summary.config.uuid": "4200-aa",
+        "summary.config.numCpu": 2,
+        "summary.config.memorySizeMB": 4096,
+        "summary.storage.committed": 30 * 2 ** 30,
+        "summary.storage.uncommitted": 10 * 2 ** 30,
+        "runtime.powerState": "poweredOn",
+        "runtime.bootTime": boot,
+        "summary.quickStats.overallCpuUsage": 400,
+        "summary.quickStats.guestMemoryUsage": 1024,
+    })
+    assert info.uuid == "4200-aa"
+    assert info.power_state == "poweredon"
+    assert info.cpu_usage_percent == pytest.approx(10.0)
+    assert info.memory_usage_mb == 1024.0
+    assert info.metadata["numCpu"] == 2
+    assert (info.num_cpu, info.memory_size_mb, info.provisioned_disk_gb) == (2, 4096, 40.0)
+    assert info.metadata["memoryUsagePercent"] == 25.0
+    assert info.uptime_days == pytest.approx(2.0, abs=0.01)
+
+
+@requires_pyvmomi
+def test_vm_info_from_props_falls_back_to_moid():
+    info = vcenter._vm_info_from_props("vm-7", {"name": "orphan"})
+    assert info.uuid == "vm-vm-7"
+    assert info.power_state is None
+
+
+@requires_pyvmomi
+def test_retrieve_vm_properties_pages_through_token(monkeypatch):
+    monkeypatch.setattr(vcenter, "_vm_filter_spec", lambda view: None)
+    objects = [_obj_content(f"vm-{i}", {"name": f"vm{i}"}) for i in range(25)]
+    collector = FakePropertyCollector(objects, page_size=10)
+    content = SimpleNamespace(propertyCollector=collector)
+    rows = list(vcenter._retrieve_vm_properties(content, view=None, page_size=10))
+    assert [ref._moId for ref, _ in rows] == [f"vm-{i}" for i in range(25)]
+    assert collector.calls == 3
+
+
+class FakePerfManager:
+    """Returns one sample series per requested counter; counts QueryPerf calls."""
+
+    def __init__(self, counters):
+        self.perfCounter = [
+            SimpleNamespace(
+                key=key,
+                groupInfo=SimpleNamespace(key=name.split(".")[0]),
+                nameInfo=SimpleNamespace(key=name.split(".")[1]),
+                rollupType=name.split(".")[2],
+            )
+            for key, name in counters.items()
+        ]
+        self.calls = 0
+
+    def QueryPerf(self, querySpec):
+        self.calls += 1
+        return [
+            SimpleNamespace(
+                entity=spec.entity,
+                value=[
+                    SimpleNamespace(id=SimpleNamespace(counterId=m.counterId), value=[2, 4, -1])
+                    for m in spec.metricId
+                ],
+            )
+            for spec in querySpec
+        ]
+
+
+@requires_pyvmomi
+def test_apply_perf_metrics_batches_query_perf():
+    from pyVmomi import vim
+
+    perf = FakePerfManager({
+        1: "net.usage.average",
+        2: "disk.numberReadAveraged.average",
+        3: "disk.numberWriteAveraged.average",
+        4: "cpu.usage.average",
+    })
+    content = SimpleNamespace(about=SimpleNamespace(instanceUuid="test-vc-batch"), perfManager=perf)
+    vms = {}
+    for i in range(600):
+        moid = f"vm-{i}"
+        vms[moid] = (vim.VirtualMachine(moid), vcenter.VMInfo(name=moid, uuid=moid))
+    vcenter._apply_perf_metrics(content, vms, {"perf_batch_size": 250})
+    assert perf.calls == 3
+    info = vms["vm-599"][1]
+    assert info.network_usage_kbps == 3.0
+    assert info.disk_usage_iops == 6.0
+
+
+@requires_pyvmomi
+def test_apply_perf_metrics_logs_and_counts_failed_batches(caplog):
+    from pyVmomi import vim
+
+    from apps.integrations import instrumentation
+
+    class FailingPerfManager(FakePerfManager):
+        def QueryPerf(self, querySpec):
+            if not self.calls:
+                self.calls += 1
+                raise RuntimeError("boom")
+            return super().QueryPerf(querySpec)
+
+    perf = FailingPerfManager({1: "net.usage.average"})
+    content = SimpleNamespace(about=SimpleNamespace(instanceUuid="test-vc-fail"), perfManager=perf)
+    vms = {f"vm-{i}": (vim.VirtualMachine(f"vm-{i}"), vcenter.VMInfo(name=f"vm-{i}", uuid=f"vm-{i}")) for i in range(4)}
+    with instrumentation.collect_stats() as stats:
+        vcenter._apply_perf_metrics(content, vms, {"perf_batch_size": 2})
+    assert perf.calls == 2
+    assert stats.counters["perf_errors"] == 1
+    assert "QueryPerf failed for 2 VMs" in caplog.text
+    assert vms["vm-0"][1].network_usage_kbps is None
+    assert vms["vm-3"][1].network_usage_kbps == 3.0
+
+
+class FakeServiceInstance:
+    def __init__(self, authenticated=True):
+        self.authenticated = authenticated
+        self.logins = 0
+        self.content = SimpleNamespace(sessionManager=SimpleNamespace(Login=self._login))
+
+    def _login(self, user, pwd):
+        self.logins += 1
+        self.authenticated = True
+
+    def CurrentTime(self):
+        from pyVmomi import vim
+
+        if not self.authenticated:
+            raise vim.fault.NotAuthenticated()
+        return datetime.now(timezone.utc)
+
+
+@requires_pyvmomi
+def test_session_pool_reuses_and_relogs(monkeypatch):
+    from apps.integrations import vcenter_pool
+
+    connects = []
+
+    def fake_connect(config):
+        si = FakeServiceInstance()
+        connects.append(si)
+        return si
+
+    monkeypatch.setattr(vcenter_pool, "connect_vcenter", fake_connect)
+    monkeypatch.setattr(vcenter_pool, "_disconnect", lambda si: None)
+    config = {"host": "vc-pool.example.com", "user": "u", "password": "p", "max_sessions": 1}
+    with vcenter_pool.vcenter_session(config) as first:
+        pass
+    first.si.authenticated = False  # server-side session expired
+    with vcenter_pool.vcenter_session(config) as second:
+        assert second is first
+    assert len(connects) == 1
+    assert first.si.logins == 1
+    pool = vcenter_pool.get_pool(config)
+    held = pool.acquire(config)
+    with pytest.raises(TimeoutError):
+        pool.acquire(config, timeout=0.01)
+    pool.release(held)
+
+    def batches():
+        with vcenter_pool.vcenter_session(config) as session:
+            yield session
+            yield session
+
+    stream = batches()
+    next(stream)
+    stream.close()  # consumer stopped early: the session goes back to the pool
+    with vcenter_pool.vcenter_session(config) as third:
+        assert third is first
+    assert len(connects) == 1
+    vcenter_pool.close_all()
+
+
+def _update(version, objects, truncated=False):
+    object_set = [
+        SimpleNamespace(
+            obj=SimpleNamespace(_moId=moid),
+            kind=kind,
+            changeSet=[SimpleNamespace(name=k, op="assign", val=v) for k, v in props.items()],
+        )
+        for moid, kind, props in objects
+    ]
+    return SimpleNamespace(version=version, truncated=truncated, filterSet=[SimpleNamespace(objectSet=object_set)])
+
+
+class FakeUpdateCollector:
+    def __init__(self, updates):
+        self.updates = updates  # version -> update (None = no changes)
+        self.seen_versions = []
+
+    def WaitForUpdatesEx(self, version, options):
+        self.seen_versions.append(version)
+        return self.updates.get(version)
+
+
+@requires_pyvmomi
+def test_inventory_sync_applies_changes_since_version():
+    sync = object.__new__(vcenter._InventorySync)
+    sync.version, sync.props, sync.refs = "", {}, {}
+    sync.collector = FakeUpdateCollector({
+        "": _update("1", [("vm-1", "enter", {"name": "a", "runtime.powerState": "poweredOn"})], truncated=True),
+        "1": _update("2", [("vm-2", "enter", {"name": "b"})]),
+    })
+    assert sync.poll(100) == {"vm-1", "vm-2"}
+    assert sync.version == "2"
+
+    sync.collector = FakeUpdateCollector({
+        "2": _update("3", [
+            ("vm-1", "modify", {"runtime.powerState": "poweredOff"}),
+            ("vm-2", "leave", {}),
+        ]),
+    })
+    assert sync.poll(100) == {"vm-1"}
+    assert sync.props == {"vm-1": {"name": "a", "runtime.powerState": "poweredOff"}}
+    assert sync.poll(100) == set()
+    assert sync.collector.seen_versions == ["2", "3"]
+
+
+@requires_pyvmomi
+def test_inventory_sync_reports_why_it_fell_back_to_a_full_snapshot(monkeypatch):
+    from pyVmomi import vmodl
+
+    class FakeSync:
+        def __init__(self, content):
+            self.props, self.full_at, self.fail = {"vm-1": {"name": "a"}}, time.monotonic(), False
+
+        def poll(self, max_objects):
+            if self.fail:
+                raise vmodl.query.InvalidCollectorVersion()
+            return set()
+
+        def destroy(self):
+            pass
+
+    monkeypatch.setattr(vcenter, "_InventorySync", FakeSync)
+    monkeypatch.setattr(vcenter, "_synced_keys", set())
+    # Usage properties change on every poll: they are not part of the update filter
+    assert not any("quickStats" in p for p in vcenter.SYNC_PROPERTIES)
+    client, first = vcenter.VCenterClient(), SimpleNamespace(state={})
+
+    def reason(session, config=None):
+        return client._poll(session, None, config or {}, "ds-1", 100)[2]
+
+    assert reason(first) == "initial"
+    assert reason(first) == ""
+    assert reason(SimpleNamespace(state={})) == "session_changed"
+    first.state[("inventory_sync", "ds-1")].fail = True
+    assert reason(first) == "version_lost"
+    assert reason(first, {"full_sync_interval": 1e-9}) == "periodic"
+
+
+@requires_pyvmomi
+def test_session_pool_prefers_the_session_holding_sync_state(monkeypatch):
+    from apps.integrations import vcenter_pool
+
+    monkeypatch.setattr(vcenter_pool, "connect_vcenter", lambda config: FakeServiceInstance())
+    monkeypatch.setattr(vcenter_pool, "_disconnect", lambda si: None)
+    config = {"host": "vc-prefer.example.com", "user": "u", "password": "p", "max_sessions": 2}
+    pool = vcenter_pool.get_pool(config)
+    a, b = pool.acquire(config), pool.acquire(config)
+    a.state["key"] = object()
+    pool.release(a)
+    pool.release(b)  # b is now the most recently used
+    assert pool.acquire(config, prefer="key") is a
+    vcenter_pool.close_all()
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise RuntimeError(self.status_code)
+
+
+class FakeSession:
+    """Stands in for the shared requests.Session; routes by (method, url suffix)."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def request(self, method, url, headers=None, timeout=None, **kwargs):
+        self.calls.append((method, url, headers, kwargs))
+        for (m, suffix), handler in self.routes.items():
+            if m == method and url.endswith(suffix):
+                return handler(headers=headers, **kwargs)
+        return FakeResponse({}, status_code=404)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def test_aria_iter_vm_batches_walks_every_page(monkeypatch):
+    from apps.integrations import aria
+
+    resources = [{"identifier": f"res-{i}", "name": f"vm{i}"} for i in range(5)]
+
+    def list_page(headers, params):
+        start = params["page"] * params["pageSize"]
+        return FakeResponse({
+            "pageInfo": {"totalCount": len(resources), "page": params["page"]},
+            "resourceList": resources[start:start + params["pageSize"]],
+        })
+
+    session = FakeSession({("GET", "/api/resources"): list_page})
+    monkeypatch.setattr(aria, "get_session", lambda: session)
+    config = {"base_url": "https://aria", "token": "t", "page_size": 2, "collect_stats": False}
+    batches = list(aria.AriaClient().iter_vm_batches(config))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert batches[2][0].uuid == "res-4"
+    assert [c[3]["params"]["page"] for c in session.calls] == [0, 1, 2]
+
+
+def test_aria_iter_vm_batches_keeps_paging_when_the_server_caps_page_size(monkeypatch):
+    from apps.integrations import aria
+
+    resources = [{"identifier": f"res-{i}", "name": f"vm{i}"} for i in range(5)]
+
+    def list_page(headers, params):
+        # Server-side cap of 2 per page whatever pageSize asks for
+        start = params["page"] * 2
+        return FakeResponse({"pageInfo": {"totalCount": len(resources)}, "resourceList": resources[start:start + 2]})
+
+    session = FakeSession({("GET", "/api/resources"): list_page})
+    monkeypatch.setattr(aria, "get_session", lambda: session)
+    config = {"base_url": "https://aria", "token": "t", "page_size": 100, "collect_stats": False}
+    assert [len(b) for b in aria.AriaClient().iter_vm_batches(config)] == [2, 2, 1]
+
+
+def test_aria_latest_stats_are_fetched_in_chunks(monkeypatch):
+    from apps.integrations import aria
+
+    def stats(headers, json):
+        return FakeResponse({"values": [
+            {
+                "resourceId": rid,
+                "stat-list": {"stat": [
+                    {"statKey": {"key": "cpu|usage_average"}, "data": [1.5]},
+                    {"statKey": {"key": "mem|consumed_average"}, "data": [2048.0]},
+                    {"statKey": {"key": "disk|numberReadAveraged_average"}, "data": [2.0]},
+                    {"statKey": {"key": "disk|numberWriteAveraged_average"}, "data": [3.0]},
+                    {"statKey": {"key": "config|hardware|num_Cpu"}, "data": [4.0]},
+                    {"statKey": {"key": "mem|guest_provisioned"}, "data": [8388608.0]},
+                ]},
+            }
+            for rid in json["resourceId"]
+        ]})
+
+    session = FakeSession({("POST", "/api/resources/stats/latest/query"): stats})
+    monkeypatch.setattr(aria, "get_session", lambda: session)
+    vms = [VMInfo(name=f"vm{i}", uuid=f"res-{i}") for i in range(450)]
+    config = {"base_url": "https://aria", "token": "t", "stats_chunk_size": 200}
+    aria.AriaClient().enrich_with_latest_stats(config, vms)
+    assert [len(c[3]["json"]["resourceId"]) for c in session.calls] == [200, 200, 50]
+    assert vms[449].cpu_usage_percent == 1.5
+    assert vms[449].memory_usage_mb == 2.0
+    assert vms[449].disk_usage_iops == 5.0
+    assert (vms[449].num_cpu, vms[449].memory_size_mb) == (4, 8192)
+
+
+def test_aria_token_is_acquired_once_and_renewed_after_401(monkeypatch):
+    from apps.integrations import aria
+
+    issued = []
+    rejected = {"first": True}
+
+    def acquire(headers, json):
+        issued.append(json["username"])
+        return FakeResponse({"token": f"tok{len(issued)}", "validity": (time.time() + 3600) * 1000})
+
+    def metrics(headers):
+        if headers["Authorization"] == "vRealizeOpsToken tok1" and rejected.pop("first", False):
+            return FakeResponse({}, status_code=401)
+        return FakeResponse({"values": {"cpu|usage_average": 3.0}})
+
+    session = FakeSession({
+        ("POST", "/api/auth/token/acquire"): acquire,
+        ("GET", "/metrics/latest"): metrics,
+    })
+    monkeypatch.setattr(aria, "get_session", lambda: session)
+    monkeypatch.setattr(aria, "_tokens", {})
+    client = aria.AriaClient()
+    config = {"base_url": "https://aria-token", "user": "svc", "password": "pw"}
+    assert client.get_vm_metrics(config, "res-1").cpu_percent == 3.0  # 401 -> re-acquire -> ok
+    assert client.get_vm_metrics(config, "res-2").cpu_percent == 3.0
+    assert len(issued) == 2
+
+
+class SlowMetricsClient:
+    """get_vm_metrics that sleeps; records peak concurrency."""
+
+    def __init__(self, delay, slow_ids=()):
+        import threading
+
+        self.delay = delay
+        self.slow_ids = set(slow_ids)
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def get_vm_metrics(self, config, vm_id):
+        from apps.integrations.base import VMMetrics
+
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(5 if vm_id in self.slow_ids else self.delay)
+        with self.lock:
+            self.active -= 1
+        return VMMetrics(vm_id=vm_id, cpu_percent=1.0, disk_iops=2.0)
+
+
+def test_enrich_with_vm_metrics_is_bounded_and_respects_budget():
+    from apps.integrations.enrichment import MetricsBudget, enrich_with_vm_metrics
+
+    client = SlowMetricsClient(delay=0.02, slow_ids={"vm-0"})
+    vms = [VMInfo(name=f"vm{i}", uuid=f"vm-{i}") for i in range(40)]
+    started = time.monotonic()
+    enriched = enrich_with_vm_metrics(client, {"metrics_concurrency": 8}, vms, MetricsBudget(1.0))
+    assert time.monotonic() - started < 3
+    assert client.peak <= 8
+    assert enriched == 39
+    assert vms[0].cpu_usage_percent is None
+    assert vms[1].cpu_usage_percent == 1.0 and vms[1].disk_usage_iops == 2.0
+
+
+def test_phases_timed_in_worker_threads_do_not_nest_into_the_caller():
+    import contextvars
+    import threading
+
+    from apps.integrations.instrumentation import collect_stats, phase
+
+    def worker():
+        with phase("fetch"):
+            time.sleep(0.05)
+
+    with collect_stats() as stats:
+        with phase("enrich"):
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(worker,))
+            thread.start()
+            thread.join()
+    assert stats.phases["fetch"] >= 0.05
+    # The worker ran concurrently, so its time is not carved out of the caller's phase
+    assert stats.phases["enrich"] >= stats.phases["fetch"]
+
+
+def test_stor2rrd_sizing_rounds_counts_skips_non_numeric_and_prefers_the_first_key():
+    from apps.integrations.stor2rrd import _sizing
+
+    assert _sizing({"vcpu": "3.6", "memory_mb": 2047.5, "provisioned_gb": "40.25"}) == {
+        "num_cpu": 4, "memory_size_mb": 2048, "provisioned_disk_gb": 40.25
+    }
+    # First key wins; a non-numeric value falls through to the next key
+    assert _sizing({"num_cpu": 2, "vcpu": 8, "memory_mb": "n/a", "mem_mb": 1024, "disk_gb": None}) == {
+        "num_cpu": 2, "memory_size_mb": 1024
+    }
+    assert _sizing({"name": "x"}) == {}
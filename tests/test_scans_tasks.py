@@ -0,0 +1,451 @@
+# Tests for apps.scans.tasks (fetch + persist pipeline)
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from apps.integrations.base import VMInfo
+from apps.scans import tasks
+from apps.scans.models import DataSource, ScanRun, VirtualMachine, VMMetricSample
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Tasks cache API responses; use an in-process cache instead of Redis."""
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    from django.core.cache import cache
+    cache.clear()
+
+
+@pytest.fixture
+def aria_source(db):
+    return DataSource.objects.create(
+        name="Aria", source_type=DataSource.SourceType.ARIA, config={"base_url": "https://aria"}
+    )
+
+
+def _batches(n_pages, per_page):
+    for p in range(n_pages):
+        yield [VMInfo(name=f"vm-{p}-{i}", uuid=f"uuid-{p}-{i}", power_state="poweredOn") for i in range(per_page)]
+
+
+def test_fetch_aria_persists_and_caches_every_page(aria_source, monkeypatch):
+    calls = []
+
+    def fake_iter(self, config):
+        calls.append(config)
+        yield from _batches(3, 4)
+
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", fake_iter)
+    assert tasks._fetch_aria_impl(aria_source.id) == {"ok": True, "count": 12}
+    assert VirtualMachine.objects.filter(data_source=aria_source).count() == 12
+    # Second run is served from the cache; the inventory is the one just persisted
+    assert tasks._fetch_aria_impl(aria_source.id) == {
+        "ok": True, "count": 12, "unchanged": True, "message": "12 VMs (unchanged)"
+    }
+    assert len(calls) == 1
+
+
+def test_stor2rrd_fetch_persists_each_batch_before_pulling_the_next(db, monkeypatch):
+    ds = DataSource.objects.create(name="S2R", source_type=DataSource.SourceType.STOR2RRD, config={"per_vm_metrics": False})
+    persisted = []
+
+    def fake_iter(self, config):
+        for batch in _batches(3, 2):
+            # Everything yielded so far is already in the DB when the client is resumed
+            persisted.append(VirtualMachine.objects.filter(data_source=ds).count())
+            yield batch
+
+    monkeypatch.setattr(tasks.Stor2RRDClient, "iter_vm_batches", fake_iter)
+    assert tasks._fetch_stor2rrd_impl(ds.id) == {"ok": True, "count": 6}
+    assert persisted == [0, 2, 4]
+
+
+def test_cache_codec_round_trip_keeps_values_and_types():
+    from datetime import datetime, timezone as dt_timezone
+
+    from apps.scans import cache_codec
+
+    vms = [
+        VMInfo(name="a", uuid="u-a", power_state="poweredOn", metadata={"raw": {"k": [1, 2]}},
+               cpu_usage_mhz=1200, cpu_usage_percent=3.5,
+               last_boot_time=datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc)),
+        VMInfo(name="b", uuid="u-b"),
+    ]
+    value = cache_codec.encode_vms(vms)
+    assert value.startswith(cache_codec.MAGIC)
+    decoded = cache_codec.decode_vms(value)
+    assert decoded == vms and isinstance(decoded[0].cpu_usage_mhz, int)
+    # Values from the previous JSON format are misses, not errors downstream
+    assert cache_codec.manifest_pages(3) is None
+    with pytest.raises(ValueError):
+        cache_codec.decode_vms(b'[{"name": "a"}]')
+
+
+def test_upsert_vms_reports_created_and_updated(aria_source):
+    from apps.scans.persistence import upsert_vms
+
+    first = [VMInfo(name=f"vm{i}", uuid=f"u-{i}", cpu_usage_percent=10.0) for i in range(5)]
+    result = upsert_vms(aria_source.id, first, chunk_size=2)
+    assert (result.created, result.updated) == (5, 0)
+
+    second = [VMInfo(name=f"vm{i}", uuid=f"u-{i}", power_state="poweredOff", cpu_usage_percent=1.0) for i in range(3, 8)]
+    result = upsert_vms(aria_source.id, second, chunk_size=2)
+    assert (result.created, result.updated) == (3, 2)
+    assert VirtualMachine.objects.filter(data_source=aria_source).count() == 8
+    assert VirtualMachine.objects.get(uuid="u-4").cpu_usage_percent == 1.0
+    assert VirtualMachine.objects.get(uuid="u-0").cpu_usage_percent == 10.0
+
+
+def test_upsert_vms_only_touches_unchanged_rows(aria_source):
+    from apps.scans.persistence import upsert_vms
+
+    vms = [VMInfo(name=f"vm{i}", uuid=f"u-{i}", cpu_usage_percent=10.0, uptime_days=1.0) for i in range(5)]
+    upsert_vms(aria_source.id, vms)
+    VirtualMachine.objects.filter(uuid="u-3").update(status=VirtualMachine.VMStatus.MISSING)
+
+    vms[0].name = "renamed"
+    vms[1].cpu_usage_percent = 90.0
+    vms[2].uptime_days = 2.0
+    later = timezone.now() + timedelta(hours=1)
+    result = upsert_vms(aria_source.id, vms, now=later)
+    # Usage and uptime are not part of the fingerprint: only the rename and the missing row are rewritten
+    assert (result.created, result.updated, result.unchanged) == (0, 2, 3)
+    changed = set(VirtualMachine.objects.filter(pk__in=result.changed_pks).values_list("uuid", flat=True))
+    # Reappearing missing rows are rewritten even when their fingerprint matches; moved metrics are re-scored
+    assert changed == {"u-0", "u-1", "u-3"}
+    assert VirtualMachine.objects.get(uuid="u-4").last_seen == later
+    assert VirtualMachine.objects.get(uuid="u-1").cpu_usage_percent == 90.0
+    assert VirtualMachine.objects.get(uuid="u-2").uptime_days == 2.0
+    # One metric sample per VM per hourly scan
+    assert VMMetricSample.objects.filter(vm__data_source=aria_source).count() == 10
+
+
+def test_run_scan_fans_out_per_source_and_detects_in_callback(aria_source, monkeypatch):
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    other = DataSource.objects.create(
+        name="Aria 2", source_type=DataSource.SourceType.ARIA, config={"base_url": "https://aria2"}
+    )
+    # VM uuids are unique across sources
+    monkeypatch.setattr(
+        tasks.AriaClient,
+        "iter_vm_batches",
+        lambda self, config: [[VMInfo(name=f"{config['base_url']}-{i}", uuid=f"{config['base_url']}-{i}") for i in range(2)]],
+    )
+    detected = []
+    monkeypatch.setattr(
+        tasks, "run_detection", lambda data_source_id, vm_ids, **kw: detected.append((data_source_id, vm_ids)) or 0
+    )
+
+    out = tasks.run_scan.apply().get()
+    assert out["ok"] and len(out["scan_run_ids"]) == 2
+    runs = ScanRun.objects.filter(pk__in=out["scan_run_ids"])
+    assert {run.status for run in runs} == {ScanRun.Status.SUCCESS}
+    # Rule B window (default): the whole source is re-scored, no dirty pks travel through the chord
+    assert sorted(detected) == sorted([(aria_source.id, []), (other.id, [])])
+    assert all(run.lock_hold_seconds is not None and run.lock_wait_seconds is not None for run in runs)
+
+
+def test_duplicate_trigger_returns_in_flight_scan_run(aria_source, monkeypatch):
+    from apps.scans.locks import acquire_scan_lock
+
+    lease = acquire_scan_lock(aria_source.id, scan_run_id=41, wait=0)
+    assert acquire_scan_lock(aria_source.id, wait=0) is None
+    out = tasks.run_scan.apply(args=[aria_source.id]).get()
+    assert out["joined"] == [{"data_source_id": aria_source.id, "scan_run_id": 41}]
+    assert tasks.fetch_aria_vms.apply(args=[aria_source.id]).get()["scan_run_id"] == 41
+    assert not ScanRun.objects.exists()
+
+    lease.release()
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(1, 1))
+    assert tasks.fetch_aria_vms.apply(args=[aria_source.id]).get()["ok"]
+    # Lock released after the locked fetch
+    assert acquire_scan_lock(aria_source.id, wait=0) is not None
+
+
+def test_scan_run_fails_cleanly_when_its_collector_cannot_start(aria_source, monkeypatch):
+    from apps.scans.locks import acquire_scan_lock
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+
+    def broken_collector():
+        raise RuntimeError("collector unavailable")
+
+    monkeypatch.setattr(tasks.instrumentation, "collect_stats", broken_collector)
+    out = tasks.run_scan.apply(args=[aria_source.id]).get()
+    run = ScanRun.objects.get(pk=out["scan_run_ids"][0])
+    assert run.status == ScanRun.Status.FAILED and run.message == "collector unavailable"
+    assert run.finished_at is not None
+    assert acquire_scan_lock(aria_source.id, wait=0) is not None
+
+
+def test_scan_stops_persisting_once_its_lease_is_taken_over(aria_source, monkeypatch):
+    from django.core.cache import cache
+
+    from apps.scans import locks
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    key = locks._lock_key(aria_source.id)
+    usurper = {"token": "other", "scan_run_id": 99, "acquired_at": 0.0}
+
+    def fake_iter(self, config):
+        batches = _batches(2, 3)
+        yield next(batches)
+        # Lease expired while fetching and another scan took the source
+        cache.set(key, usurper, 300)
+        yield next(batches)
+
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", fake_iter)
+    out = tasks.run_scan.apply(args=[aria_source.id]).get()
+    run = ScanRun.objects.get(pk=out["scan_run_ids"][0])
+    assert run.status == ScanRun.Status.FAILED and "lost" in run.message
+    assert VirtualMachine.objects.filter(data_source=aria_source).count() == 3
+    # Releasing the lost lease leaves the new holder's lease alone
+    assert cache.get(key) == usurper
+
+
+@pytest.mark.parametrize("failing_shard", [None, "dc1/cl-b"])
+def test_sharded_vcenter_scan_runs_age_transitions_only_when_every_shard_succeeds(db, monkeypatch, failing_shard):
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    ds = DataSource.objects.create(
+        name="vCenter", source_type=DataSource.SourceType.VCENTER, config={"shard_by": "cluster"}
+    )
+    stale = VirtualMachine.objects.create(
+        data_source=ds, name="gone", uuid="gone", power_state="poweredOn",
+        last_seen=timezone.now() - timedelta(days=30),
+    )
+    shards = [{"type": "ClusterComputeResource", "moid": f"domain-c{i}", "name": name, "recursive": True}
+              for i, name in enumerate(["dc1/cl-a", "dc1/cl-b"])]
+    monkeypatch.setattr(tasks.VCenterClient, "list_shards", lambda self, config: shards)
+
+    def fake_batches(self, config, shard=None):
+        yield [VMInfo(name=f"{shard['moid']}-{i}", uuid=f"{shard['moid']}-{i}", power_state="poweredOn") for i in range(3)]
+        if shard["name"] == failing_shard:
+            raise ConnectionError("session lost")
+
+    monkeypatch.setattr(tasks.VCenterClient, "iter_vm_batches", fake_batches)
+
+    out = tasks.run_scan.apply(args=[ds.id]).get()
+    parent = ScanRun.objects.get(pk=out["scan_run_ids"][0])
+    children = {run.shard: run.status for run in parent.shards.all()}
+    assert set(children) == {"dc1/cl-a", "dc1/cl-b"}
+    assert VirtualMachine.objects.filter(data_source=ds).count() == 7
+    stale.refresh_from_db()
+    if failing_shard:
+        assert parent.status == ScanRun.Status.FAILED and children[failing_shard] == ScanRun.Status.FAILED
+        # VMs of the failed shard were not collected: nothing may age into missing
+        assert stale.status != VirtualMachine.VMStatus.MISSING
+    else:
+        assert parent.status == ScanRun.Status.SUCCESS and set(children.values()) == {ScanRun.Status.SUCCESS}
+        assert stale.status == VirtualMachine.VMStatus.MISSING
+    assert parent.lock_hold_seconds is not None
+
+
+def test_scan_run_records_phase_timings_and_counters(aria_source, monkeypatch):
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(2, 3))
+
+    first = ScanRun.objects.get(pk=tasks.run_scan.apply(args=[aria_source.id]).get()["scan_run_ids"][0])
+    assert (first.rows_created, first.rows_updated, first.rows_unchanged) == (6, 0, 0)
+    assert first.cache_hit is False
+    assert first.fetch_seconds is not None and first.persist_seconds > 0 and first.detect_seconds is not None
+
+    # Second scan replays the cached pages: nothing changed
+    second = ScanRun.objects.get(pk=tasks.run_scan.apply(args=[aria_source.id]).get()["scan_run_ids"][0])
+    assert (second.rows_created, second.rows_updated, second.rows_unchanged) == (0, 0, 6)
+    assert second.cache_hit is True and second.api_calls == 0
+
+
+def test_incremental_sync_scans_count_full_and_incremental_syncs_on_the_sync_queue(db, monkeypatch):
+    from apps.integrations.vcenter import VMSyncResult
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    monkeypatch.setattr(tasks, "SCAN_SYNC_QUEUE", "vcenter_sync")
+    ds = DataSource.objects.create(
+        name="vCenter", source_type=DataSource.SourceType.VCENTER, config={"incremental_sync": True}
+    )
+    vms = [VMInfo(name=f"vm-{i}", uuid=f"uuid-{i}", power_state="poweredOn") for i in range(3)]
+    results = iter([
+        VMSyncResult(full=True, vms=vms, present_uuids=[vm.uuid for vm in vms], full_reason="initial"),
+        VMSyncResult(full=False, vms=vms[:1], present_uuids=[vm.uuid for vm in vms]),
+    ])
+    monkeypatch.setattr(tasks.VCenterClient, "sync_vms", lambda self, config, sync_key: next(results))
+
+    runs = [ScanRun.objects.get(pk=tasks.run_scan.apply(args=[ds.id]).get()["scan_run_ids"][0]) for _ in range(2)]
+    assert [(run.full_syncs, run.incremental_syncs) for run in runs] == [(1, 0), (0, 1)]
+    assert runs[1].rows_unchanged == 3
+
+    [signature] = tasks._source_header(ds, runs[1], {})
+    assert signature.options["queue"] == "vcenter_sync"
+    ds.config = {}
+    [signature] = tasks._source_header(ds, runs[1], {})
+    assert "queue" not in signature.options
+
+
+def test_stale_inventory_is_served_while_a_background_task_refills_it(aria_source, monkeypatch):
+    import time
+
+    from django.core.cache import cache
+
+    from apps.scans import cache_fill
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    pages = iter([3, 2])
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(next(pages), 4))
+
+    assert tasks._fetch_aria_impl(aria_source.id) == {"ok": True, "count": 12}
+    key = tasks._source_cache_key(aria_source)
+    cache.set(key, {**cache.get(key), "fresh_until": time.time() - 1})
+
+    # Expired but within API_CACHE_STALE_TTL: the old 3 pages are served, the refill (eager) swaps in 2
+    assert tasks._fetch_aria_impl(aria_source.id)["count"] == 12
+    assert cache.get(key)["pages"] == 2 and cache.get(cache_fill._fill_key(key)) is None
+    assert tasks._fetch_aria_impl(aria_source.id) == {"ok": True, "count": 8}
+    assert cache_fill.counters(["aria"])["aria"] == {"hit": 1, "stale": 1, "miss": 1, "early": 0, "waited": 0}
+
+
+def test_background_refresh_retries_after_the_scan_that_holds_the_source(aria_source, monkeypatch):
+    from celery.exceptions import Retry
+    from django.core.cache import cache
+
+    from apps.scans import cache_fill
+    from apps.scans.locks import acquire_scan_lock
+
+    fetched = []
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: fetched.append(1) or _batches(1, 1))
+    key = tasks._source_cache_key(aria_source)
+    token = cache_fill.acquire_fill(key)
+    lease = acquire_scan_lock(aria_source.id, scan_run_id=7, wait=0)
+
+    # The scan that served the stale entry still holds the source: retry later, fill lock given back
+    with pytest.raises(Retry):
+        tasks.refresh_source_cache.apply(args=[aria_source.id, None, token], throw=True, retries=0)
+    assert fetched == [] and cache.get(cache_fill._fill_key(key)) is None
+    # Still held after the last retry: give up
+    out = tasks.refresh_source_cache.apply(args=[aria_source.id, None, None], retries=tasks.REFRESH_MAX_RETRIES).get()
+    assert out["ok"] is False and out["scan_run_id"] == 7
+
+    # The retry after the scan takes the fill lock again and refills
+    lease.release()
+    assert tasks.refresh_source_cache.apply(args=[aria_source.id, None, None], retries=1).get() == {"ok": True, "count": 1}
+    # ... unless the entry is fresh by then
+    assert tasks.refresh_source_cache.apply(args=[aria_source.id, None, None], retries=2).get()["fresh"] is True
+    assert fetched == [1]
+
+
+def test_scan_of_an_already_persisted_inventory_only_touches_last_seen(aria_source, monkeypatch):
+    from django.core.cache import cache
+
+    from apps.scans import metrics
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    # Snapshot scoring: detection gets the dirty pks
+    monkeypatch.setattr(metrics, "RULE_B_WINDOW_DAYS", 0)
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(2, 3))
+    tasks.run_scan.apply(args=[aria_source.id]).get()
+    old = timezone.now() - timedelta(hours=1)
+    # Gone from the source before the last persist: must keep its old last_seen
+    gone = VirtualMachine.objects.create(data_source=aria_source, name="gone", uuid="uuid-gone", last_seen=old)
+    before = VirtualMachine.objects.get(uuid="uuid-0-0").last_seen
+    detections = []
+    monkeypatch.setattr(tasks, "run_detection", lambda **kw: detections.append(kw) or 0)
+
+    out = tasks.run_scan.apply(args=[aria_source.id]).get()
+    run = ScanRun.objects.get(pk=out["scan_run_ids"][0])
+    assert run.status == ScanRun.Status.SUCCESS and run.message == "6 VMs (unchanged)"
+    assert (run.rows_created, run.rows_updated, run.rows_unchanged) == (0, 0, 6)
+    assert VirtualMachine.objects.get(uuid="uuid-0-0").last_seen > before
+    assert VirtualMachine.objects.get(pk=gone.pk).last_seen == old
+    # Nothing is re-scored, but age transitions still run for the source
+    assert detections == [{"data_source_id": aria_source.id, "vm_ids": [], "age_transitions": True}]
+
+    # A different cached inventory goes through the upsert and detection again
+    cache.clear()
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(2, 4))
+    tasks.run_scan.apply(args=[aria_source.id]).get()
+    assert len(detections) == 2 and len(detections[1]["vm_ids"]) == 2
+    aria_source.refresh_from_db()
+    assert len(aria_source.inventory_generation) == 40
+
+
+def test_direct_fetch_scores_what_it_persists(aria_source, monkeypatch):
+    from apps.scans import metrics
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    monkeypatch.setattr(metrics, "RULE_B_WINDOW_DAYS", 0)
+    monkeypatch.setattr(tasks.AriaClient, "iter_vm_batches", lambda self, config: _batches(2, 3))
+    out = tasks.fetch_aria_vms.apply(args=[aria_source.id]).get()
+    assert out["ok"] and out["detection_updated"] == 6
+    # The scan replays the same inventory as unchanged; the rows were already scored by the fetch
+    out = tasks.run_scan.apply(args=[aria_source.id]).get()
+    assert ScanRun.objects.get(pk=out["scan_run_ids"][0]).message == "6 VMs (unchanged)"
+    assert not VirtualMachine.objects.filter(data_source=aria_source, idle_score__isnull=True).exists()
+
+
+def test_inventory_fingerprint_covers_every_ingested_value_but_not_page_order():
+    from apps.scans import cache_fill
+
+    def fingerprint(pages):
+        manifest = {}
+        list(cache_fill.fill("idlehunter:test:", iter(pages), on_fill=manifest.update))
+        return manifest["fingerprint"]
+
+    def vm(i, cpu=2.0, **kw):
+        return VMInfo(name=f"vm{i}", uuid=f"uuid-{i}", power_state="poweredOn", cpu_usage_percent=cpu, **kw)
+
+    base = fingerprint([[vm(0, uptime_days=3), vm(1)], [vm(2)]])
+    assert fingerprint([[vm(2)], [vm(1), vm(0, uptime_days=3)]]) == base
+    # Uptime and usage are persisted columns: a new reading is a different inventory
+    assert fingerprint([[vm(0, uptime_days=4), vm(1)], [vm(2)]]) != base
+    assert fingerprint([[vm(0, uptime_days=3), vm(1)], [vm(2, cpu=9.0)]]) != base
+
+
+def test_beat_refresh_ages_unscanned_sources_into_the_summary(aria_source):
+    from apps.scans.summary import dashboard_summary, refresh_dashboard_summary
+
+    VirtualMachine.objects.create(
+        data_source=aria_source, name="old", uuid="old", idle_score=0.0, last_seen=timezone.now() - timedelta(days=30)
+    )
+    refresh_dashboard_summary()
+    assert dashboard_summary().idle_zombie_count == 0
+
+    assert tasks.refresh_dashboard.apply().get()["updated"] == 1
+    assert VirtualMachine.objects.get(uuid="old").status == VirtualMachine.VMStatus.MISSING
+    assert dashboard_summary().idle_zombie_count == 1
+
+
+def test_sizing_migration_backfills_counts_from_vcenter_metadata(aria_source):
+    from importlib import import_module
+
+    from django.apps import apps
+
+    migration = import_module("apps.scans.migrations.0016_virtualmachine_sizing")
+    rows = {
+        "full": {"numCpu": 4, "memorySizeMB": 8192.0},
+        "partial": {"memorySizeMB": 1024},
+        "junk": {"numCpu": "four", "memorySizeMB": -1},
+        "none": {},
+    }
+    for uuid, metadata in rows.items():
+        VirtualMachine.objects.create(data_source=aria_source, name=uuid, uuid=uuid, metadata=metadata)
+    VirtualMachine.objects.create(data_source=aria_source, name="set", uuid="set", num_cpu=2, metadata={"numCpu": 16})
+
+    migration.backfill_sizing(apps, None)
+    sizing = dict(
+        (uuid, (cpu, mem)) for uuid, cpu, mem in VirtualMachine.objects.values_list("uuid", "num_cpu", "memory_size_mb")
+    )
+    assert sizing == {
+        "full": (4, 8192), "partial": (None, 1024), "junk": (None, None), "none": (None, None), "set": (2, None)
+    }
@@ -18,3 +18,54 @@ def test_dashboard_200_when_authenticated(client, django_user_model):
     client.force_login(user)
     response = client.get(reverse("web:dashboard"))
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_dashboard_renders_the_summary_snapshot(client, django_user_model):
+    """KPIs come from the stored snapshot; refresh_dashboard_summary recomputes it in SQL."""
+    from apps.scans.models import DataSource, VirtualMachine
+    from apps.scans.summary import refresh_dashboard_summary
+
+    ds = DataSource.objects.create(name="vc", source_type=DataSource.SourceType.VCENTER)
+    VirtualMachine.objects.create(
+        data_source=ds, name="z1", uuid="z1", idle_score=0.9, num_cpu=4, memory_size_mb=2048, provisioned_disk_gb=40.0
+    )
+    VirtualMachine.objects.create(data_source=ds, name="z2", uuid="z2", idle_score=0.8, num_cpu=2)
+    VirtualMachine.objects.create(data_source=ds, name="a1", uuid="a1", idle_score=0.1, num_cpu=8)
+    VirtualMachine.objects.create(data_source=ds, name="n1", uuid="n1")
+    refresh_dashboard_summary()
+    # Not in the snapshot until the next refresh
+    VirtualMachine.objects.create(data_source=ds, name="late", uuid="late", idle_score=1.0)
+
+    client.force_login(django_user_model.objects.create_user(username="viewer", password="x"))
+    context = client.get(reverse("web:dashboard")).context
+    assert (context["total_vms"], context["idle_zombie_count"]) == (4, 2)
+    assert (context["savings_vcpu"], context["savings_ram_gb"], context["savings_disk_gb"]) == (6, 2.0, 40.0)
+    assert context["savings_by_source"] == [{"label": "vc", "count": 2, "vcpu": 6, "ram_mb": 2048, "disk_gb": 40.0}]
+    assert context["chart_efficiency"] == {"active": 2, "idle": 2}
+    assert context["chart_clusters"] == [{"label": "vc", "count": 2}]
+
+
+@pytest.mark.django_db
+def test_admin_edits_refresh_the_summary_shown_with_its_time(
+    admin_client, django_capture_on_commit_callbacks, monkeypatch
+):
+    from apps.scans.models import DataSource, VirtualMachine
+    from apps.scans.summary import dashboard_summary, refresh_dashboard_summary
+    from config.celery import app
+
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    ds = DataSource.objects.create(name="vc", source_type=DataSource.SourceType.VCENTER)
+    vm = VirtualMachine.objects.create(data_source=ds, name="z1", uuid="z1", idle_score=0.9)
+    refresh_dashboard_summary()
+    with django_capture_on_commit_callbacks() as callbacks:
+        admin_client.post(reverse("admin:scans_virtualmachine_delete", args=[vm.pk]), {"post": "yes"})
+    # The admin request only queues the refresh; it runs once the delete is committed
+    assert len(callbacks) == 1 and dashboard_summary().total_vms == 1
+    callbacks[0]()
+
+    summary = dashboard_summary()
+    assert (summary.total_vms, summary.idle_zombie_count) == (0, 0)
+    response = admin_client.get(reverse("web:dashboard"))
+    assert response.context["summary_computed_at"] == summary.computed_at
+    assert "Son güncelleme" in response.content.decode()